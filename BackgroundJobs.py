@@ -0,0 +1,137 @@
+"""
+BackgroundJobs Module
+
+Runs long offline work (study-wide feature extraction, EmotiBit CSV imports) as a
+separate `python <script>.py ...` process, so an HTTP request only starts the job and
+returns its id instead of blocking for minutes or hours.
+
+PROCESSES:
+    Jobs are plain subprocesses of a fresh interpreter, never forks of the Flask process:
+    a fork would copy its h5py, SessionStore, BLE and model threads mid-operation (a
+    child can deadlock on a lock held by one of them, e.g. the HDF5 library lock).
+
+PROTOCOL:
+    The script gets `--result-json <path>` appended to its arguments and writes its
+    result there as a JSON object before exiting with status 0. stdout/stderr go to
+    <path>.log; the last lines are reported when the job fails.
+
+STATUS (JobRunner.status):
+    {job_id, kind, state: 'running' | 'done' | 'failed', started_unix, finished_unix,
+     seconds, returncode, result (the script's JSON), error, log_tail}
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+LOG_TAIL_LINES = 20
+MAX_FINISHED_JOBS = 100
+
+
+class JobRunner:
+    """Starts script jobs and keeps their status (in memory, for this process)."""
+
+    def __init__(self, work_dir: Optional[str] = None):
+        """
+        Args:
+            work_dir (str): Directory of the result/log files (default: a temporary directory).
+        """
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix='jobs_')
+        os.makedirs(self.work_dir, exist_ok=True)
+        self._jobs: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def start(self, kind: str, script: str, args: List[str]) -> str:
+        """
+        Run `python <script> <args> --result-json <file>` in the background.
+
+        Args:
+            kind (str): Job type reported in the status (e.g. 'features').
+            script (str): Script path, relative to this module's directory or absolute.
+            args (list): Command-line arguments of the script.
+
+        Returns:
+            str: Job id.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        result_path = os.path.join(self.work_dir, f'{kind}_{job_id}.json')
+        command = [sys.executable, os.path.join(base_dir, script), *map(str, args), '--result-json', result_path]
+        log = open(result_path + '.log', 'w')
+        process = subprocess.Popen(command, cwd=os.getcwd(), stdout=log, stderr=subprocess.STDOUT)
+        job = {
+            'job_id': job_id, 'kind': kind, 'state': 'running', 'started_unix': time.time(),
+            'finished_unix': None, 'returncode': None, 'result': None, 'error': None,
+            '_process': process, '_result_path': result_path, '_log': log,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._prune()
+        threading.Thread(target=self._wait, args=(job,), daemon=True).start()
+        print(f"Background job {kind} {job_id} started (pid {process.pid})")
+        return job_id
+
+    def status(self, job_id: str) -> Optional[dict]:
+        """Public status of one job, or None for an unknown id."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._public(job) if job is not None else None
+
+    def jobs(self, kind: Optional[str] = None) -> List[dict]:
+        """Status of every known job (of one kind), newest first."""
+        with self._lock:
+            jobs = [self._public(job) for job in self._jobs.values() if kind is None or job['kind'] == kind]
+        return sorted(jobs, key=lambda job: job['started_unix'], reverse=True)
+
+    def _wait(self, job: dict) -> None:
+        returncode = job['_process'].wait()
+        job['_log'].close()
+        result, error = None, None
+        try:
+            with open(job['_result_path'], 'r') as f:
+                result = json.load(f)
+        except (OSError, ValueError) as e:
+            if returncode == 0:
+                error = f"No result written: {e}"
+        if returncode != 0:
+            error = f"Exited with status {returncode}"
+        with self._lock:
+            job.update(returncode=returncode, result=result, error=error, finished_unix=time.time(),
+                       state='done' if error is None else 'failed')
+        print(f"Background job {job['kind']} {job['job_id']} {job['state']}")
+
+    def _public(self, job: dict) -> dict:
+        status = {key: value for key, value in job.items() if not key.startswith('_')}
+        end = job['finished_unix'] or time.time()
+        status['seconds'] = round(end - job['started_unix'], 3)
+        status['log_tail'] = self._log_tail(job) if job['state'] == 'failed' else None
+        return status
+
+    @staticmethod
+    def _log_tail(job: dict) -> List[str]:
+        try:
+            with open(job['_result_path'] + '.log', 'r', errors='replace') as f:
+                return f.read().splitlines()[-LOG_TAIL_LINES:]
+        except OSError:
+            return []
+
+    def _prune(self) -> None:
+        """Forget the oldest finished jobs beyond MAX_FINISHED_JOBS. Lock held."""
+        finished = sorted((job for job in self._jobs.values() if job['state'] != 'running'),
+                          key=lambda job: job['started_unix'])
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job['job_id']]
+
+
+def write_result_json(path: Optional[str], result: dict) -> None:
+    """Script side of the protocol: write the job result (no-op without --result-json)."""
+    if not path:
+        return
+    with open(path + '.tmp', 'w') as f:
+        json.dump(result, f, default=str)
+    os.replace(path + '.tmp', path)
@@ -7,13 +7,15 @@ from pathlib import Path
 from typing import Tuple, Optional, List, Dict
 from datetime import datetime
 import glob
+import TimestampManager as tm
+from ParquetStore import PARQUET_AVAILABLE, parquet_path_for, load_frame
 
 class DatabaseUploader:
     """
     Handles uploading CSV sensor data to PostgreSQL database.
     
     Responsibilities:
-    - Parse CSV files from subject directories
+    - Parse CSV files (or their Parquet copies) from subject directories
     - Extract metadata from filenames and session info
     - Upload data to appropriate database tables
     - Manage database connections and transactions
@@ -56,9 +58,20 @@ class DatabaseUploader:
             self.conn.close()
         print("Database connection closed")
     
+    def _read_table(self, csv_path: str) -> pd.DataFrame:
+        """
+        Load an exported table. Uses the Parquet copy next to the CSV when it is at
+        least as new as the CSV (typed columnar read), otherwise parses the CSV.
+        """
+        parquet_path = parquet_path_for(csv_path)
+        if (PARQUET_AVAILABLE and os.path.exists(parquet_path)
+                and os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path)):
+            return load_frame(parquet_path, categories=False)
+        return pd.read_csv(csv_path)
+
     def _upload_event_markers(self, csv_path: str, experiment_id: int) -> int:
         """Upload event marker CSV to database."""
-        df = pd.read_csv(csv_path)
+        df = tm.add_iso_column(self._read_table(csv_path), 'timestamp_iso')
         
         # Map CSV columns to database columns
         records = [
@@ -85,7 +98,7 @@ class DatabaseUploader:
     
     def _upload_respiratory_data(self, csv_path: str, experiment_id: int) -> int:
         """Upload respiratory CSV to database."""
-        df = pd.read_csv(csv_path)
+        df = tm.add_iso_column(self._read_table(csv_path), 'timestamp')
         
         records = [
             (
@@ -113,7 +126,7 @@ class DatabaseUploader:
     
     def _upload_cardiac_data(self, csv_path: str, experiment_id: int) -> int:
         """Upload cardiac CSV to database."""
-        df = pd.read_csv(csv_path)
+        df = tm.add_iso_column(self._read_table(csv_path), 'timestamp')
         
         records = [
             (
@@ -143,7 +156,7 @@ class DatabaseUploader:
     
     def _upload_audio_transcription_data(self, csv_path: str, experiment_id: int) -> int:
         """Upload audio/transcription CSV to database."""
-        df = pd.read_csv(csv_path)
+        df = self._read_table(csv_path)
         
         records = [
             (
@@ -181,7 +194,7 @@ class DatabaseUploader:
 
     def _upload_ser_data(self, csv_path: str, experiment_id: int) -> int:
         """Upload SER (Speech Emotion Recognition) CSV to database."""
-        df = pd.read_csv(csv_path)
+        df = self._read_table(csv_path)
         
         records = [
             (
@@ -216,7 +229,7 @@ class DatabaseUploader:
 
     def _upload_emotibit_data(self, csv_path: str, experiment_id: int) -> int:
         """Upload EmotiBit CSV to database."""
-        df = pd.read_csv(csv_path)
+        df = self._read_table(csv_path)
         
         filename = os.path.basename(csv_path)
         type_tag = filename.replace('.csv', '').split('_')[-1]
@@ -0,0 +1,148 @@
+"""
+Decimation Module
+
+Reduce a time series to a fixed number of points for plotting, so live views cost the
+same no matter how long a session has been running.
+
+METHODS:
+    lttb:   Largest-Triangle-Three-Buckets. Keeps the first and last point and, per
+            bucket, the point forming the largest triangle with the previously kept
+            point and the mean of the next bucket. Preserves the visual shape of
+            smooth signals (HR, respiration force).
+    minmax: Keeps the minimum and maximum of every bucket (two points per bucket).
+            Fully vectorized; never hides spikes.
+
+Non-numeric columns (event_marker, condition) are reduced to their change points.
+"""
+from typing import Tuple
+
+import numpy as np
+
+DECIMATION_METHODS = ("lttb", "minmax")
+DEFAULT_POINTS = 800
+TIME_FIELD = 'timestamp_unix'
+
+
+def lttb_indices(t: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets.
+
+    Args:
+        t (np.ndarray): Timestamps (non-decreasing).
+        y (np.ndarray): Values, without NaN.
+        points (int): Number of points to keep (>= 3).
+
+    Returns:
+        np.ndarray: Sorted row indices, len == min(points, len(t)).
+    """
+    n = len(t)
+    if points >= n or points < 3:
+        return np.arange(n)
+
+    t = np.asarray(t, dtype='f8')
+    y = np.asarray(y, dtype='f8')
+    # Buckets for the n - 2 interior points; the first and last points are always kept
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+
+    # Mean of every bucket, used as the third triangle vertex for the bucket before it
+    sums_t = np.add.reduceat(t[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    mean_t = np.append(sums_t / counts, t[-1])
+    mean_y = np.append(sums_y / counts, y[-1])
+
+    kept = np.empty(points, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+    a = 0
+    for bucket in range(points - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        next_t, next_y = mean_t[bucket + 1], mean_y[bucket + 1]
+        # Twice the triangle area; the constant factor does not change the argmax
+        area = np.abs((t[a] - next_t) * (y[lo:hi] - y[a]) - (t[a] - t[lo:hi]) * (next_y - y[a]))
+        a = lo + int(np.argmax(area))
+        kept[bucket + 1] = a
+    return kept
+
+
+def minmax_indices(y: np.ndarray, points: int) -> np.ndarray:
+    """
+    Indices of the minimum and maximum of each of points // 2 equal-count buckets.
+
+    Args:
+        y (np.ndarray): Values; NaN is never selected unless a bucket holds only NaN.
+        points (int): Maximum number of points to keep.
+
+    Returns:
+        np.ndarray: Sorted, unique row indices.
+    """
+    n = len(y)
+    buckets = max(points // 2, 1)
+    if points >= n:
+        return np.arange(n)
+
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    nan = np.isnan(padded)
+
+    offsets = np.arange(buckets) * size
+    lows = offsets + np.where(nan, np.inf, padded).argmin(axis=1)
+    highs = offsets + np.where(nan, -np.inf, padded).argmax(axis=1)
+    kept = np.unique(np.concatenate([lows, highs]))
+    return kept[kept < n]
+
+
+def change_indices(values: np.ndarray) -> np.ndarray:
+    """Indices of the first row and of every row whose value differs from the previous row."""
+    if len(values) == 0:
+        return np.arange(0)
+    changed = np.flatnonzero(values[1:] != values[:-1]) + 1
+    return np.concatenate([[0], changed])
+
+
+def decimate_series(t: np.ndarray, y: np.ndarray, points: int = DEFAULT_POINTS,
+                    method: str = "lttb") -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Decimate one numeric series (NaN samples are dropped first).
+
+    Returns:
+        (np.ndarray, np.ndarray): Kept timestamps and values.
+    """
+    if method not in DECIMATION_METHODS:
+        raise ValueError(f"method must be one of {DECIMATION_METHODS}")
+
+    valid = ~np.isnan(y)
+    t, y = t[valid], y[valid]
+    if method == "lttb":
+        kept = lttb_indices(t, y, points)
+    else:
+        kept = minmax_indices(y, points)
+    return t[kept], y[kept]
+
+
+def decimate_rows(rows: np.ndarray, points: int = DEFAULT_POINTS, method: str = "lttb",
+                  time_field: str = TIME_FIELD) -> dict:
+    """
+    Decimate every column of a structured array of stream rows.
+
+    Returns:
+        dict: {field: {'timestamp_unix': [...], 'values': [...]}} with numeric fields
+            decimated to at most `points` points and other fields reduced to change points.
+    """
+    t = rows[time_field].astype('f8')
+    series = {}
+    for field in rows.dtype.names:
+        if field == time_field:
+            continue
+        values = rows[field]
+        if values.dtype.kind in 'fiub':
+            kept_t, kept_y = decimate_series(t, values.astype('f8'), points, method)
+        else:
+            kept = change_indices(values)
+            kept_t = t[kept]
+            kept_y = np.array([v.decode('utf-8') if isinstance(v, bytes) else v for v in values[kept]],
+                              dtype=object)
+        series[field] = {time_field: kept_t.tolist(), 'values': kept_y.tolist()}
+    return series
@@ -0,0 +1,400 @@
+"""
+DeviceWorker Module
+
+Runs a device's acquisition loop in its own Python process, so SER inference, file
+conversions and Flask requests in the main process cannot starve it or jitter its
+timestamps.
+
+PROCESSES:
+    main     DeviceWorker creates the ring buffer, launches the worker and drains the rows
+             on a thread into the manager's callback (HDF5 writes, detectors, markers).
+    worker   python DeviceWorker.py --source Module:Class ... opens the device, timestamps
+             and decodes its samples and writes them into the ring buffer; nothing else.
+             It is a fresh interpreter (not a fork of the Flask process), so it does not
+             import app.py or the ML stack.
+
+RING BUFFER (SharedRingBuffer):
+    One multiprocessing.shared_memory block: an int64 write counter followed by
+    `capacity` rows of the source's dtype. Single producer (worker), single consumer
+    (main). The producer copies a block of at most `max_block` rows (larger blocks are
+    written in pieces), then advances the counter; the consumer copies everything between
+    its own read counter and the write counter. While the consumer copies, one unpublished
+    block may be landing past the counter, so after the copy it also discards the rows
+    within max_block of being overwritten (max_block must be below capacity; default
+    capacity / 4). Rows overwritten or discarded before they were read count in `dropped`.
+
+CONTROL CHANNEL:
+    multiprocessing.connection over localhost with a random authkey (passed through the
+    environment). Every request (command, args) gets one reply ('ok', value) or
+    ('error', message):
+        open     open the device with the source options -> source.open() result
+        start    start writing rows to the ring buffer
+        stop     stop writing rows
+        status   source.status() plus the worker's rows written and last error
+        quit     close the device and exit
+
+SOURCES:
+    A source is a class named "Module:Class" (VernierManager:VernierSource,
+    PolarManager:PolarSource) with:
+        dtype                   structured row dtype
+        open(**options) dict    connect; raise if the device is not available
+        read_block()            rows read since the last call (blocks briefly), or None
+        status() dict           device state
+        close()
+"""
+import argparse
+import importlib
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Optional
+
+import numpy as np
+
+DEFAULT_CAPACITY_ROWS = 65536
+DEFAULT_DRAIN_INTERVAL = 0.02
+DEFAULT_STATUS_INTERVAL = 1.0
+DEFAULT_REQUEST_TIMEOUT = 10.0
+LAUNCH_TIMEOUT = 30.0
+AUTHKEY_ENV = "DEVICE_WORKER_AUTHKEY"
+# Worker poll interval for control requests while it is not streaming
+IDLE_POLL_INTERVAL = 0.1
+COUNTER_BYTES = 8
+
+
+def resolve_source(spec: str):
+    """Source class from "Module:Class"."""
+    module_name, class_name = spec.split(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class SharedRingBuffer:
+    """Single-producer/single-consumer ring of structured rows in shared memory."""
+
+    def __init__(self, dtype: np.dtype, capacity: int = DEFAULT_CAPACITY_ROWS, name: Optional[str] = None,
+                 max_block: Optional[int] = None):
+        """
+        Args:
+            dtype (np.dtype): Row dtype.
+            capacity (int): Rows held before the producer overwrites unread rows.
+            name (str): Attach to the existing block `name` (worker side); None creates one.
+            max_block (int): Largest block the producer publishes at once (default capacity // 4;
+                both sides must use the same value).
+        """
+        self.dtype = np.dtype(dtype)
+        self.capacity = int(capacity)
+        self.max_block = int(max_block) if max_block is not None else max(1, self.capacity // 4)
+        if not 0 < self.max_block < self.capacity:
+            raise ValueError("max_block must be at least 1 and smaller than capacity")
+        self._owner = name is None
+        size = COUNTER_BYTES + self.capacity * self.dtype.itemsize
+        self._shm = SharedMemory(name=name, create=self._owner, size=size)
+        if not self._owner:
+            # The creating process unlinks the block; the attaching process must not track it
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+        self._counter = np.ndarray((1,), dtype='<i8', buffer=self._shm.buf)
+        self._rows = np.ndarray((self.capacity,), dtype=self.dtype, buffer=self._shm.buf, offset=COUNTER_BYTES)
+        if self._owner:
+            self._counter[0] = 0
+        self._read = 0
+        self.rows_read = 0
+        self.dropped = 0
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def written(self) -> int:
+        """Rows written by the producer since creation."""
+        return int(self._counter[0])
+
+    def write(self, rows: np.ndarray) -> None:
+        """Producer: append rows, publishing them in blocks of at most max_block rows."""
+        for offset in range(0, len(rows), self.max_block):
+            self._write_block(rows[offset:offset + self.max_block])
+
+    def _write_block(self, rows: np.ndarray) -> None:
+        n = len(rows)
+        start = int(self._counter[0])
+        first = start % self.capacity
+        head = min(n, self.capacity - first)
+        self._rows[first:first + head] = rows[:head]
+        self._rows[:n - head] = rows[head:]
+        # Publish only after the rows are in place
+        self._counter[0] = start + n
+
+    def read(self) -> np.ndarray:
+        """Consumer: copy of the rows written since the last read (oldest first)."""
+        end = int(self._counter[0])
+        start = max(self._read, end - self.capacity)
+        self.dropped += start - self._read
+        n = end - start
+        if n == 0:
+            return self._rows[:0].copy()
+        first = start % self.capacity
+        head = min(n, self.capacity - first)
+        rows = np.concatenate((self._rows[first:first + head], self._rows[:n - head]))
+
+        # Rows overwritten while they were being copied are not valid: those of the blocks
+        # published meanwhile, plus up to max_block rows of a block still being written
+        lapped = min(int(self._counter[0]) + self.max_block - self.capacity - start, n)
+        if lapped > 0:
+            rows = rows[lapped:]
+            self.dropped += lapped
+        self._read = end
+        self.rows_read += len(rows)
+        return rows
+
+    def close(self) -> None:
+        """Detach; the creating side also removes the shared memory block."""
+        del self._counter, self._rows
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+class DeviceWorker:
+    """Main-process handle of one out-of-process device source."""
+
+    def __init__(self, source: str, on_rows: Callable[[np.ndarray], None],
+                 on_error: Optional[Callable[[str], None]] = None, capacity: int = DEFAULT_CAPACITY_ROWS,
+                 drain_interval: float = DEFAULT_DRAIN_INTERVAL, status_interval: float = DEFAULT_STATUS_INTERVAL):
+        """
+        Args:
+            source (str): Source class as "Module:Class".
+            on_rows (callable): Called on the drain thread with every block of rows.
+            on_error (callable): Called on the drain thread with the worker's error message
+                when acquisition fails (e.g. the device disconnected).
+            capacity (int): Ring buffer rows (covers capacity / rate seconds of main-process stalls).
+            drain_interval (float): Seconds between ring buffer reads.
+            status_interval (float): Seconds between worker status checks while streaming.
+        """
+        self.source = source
+        self.dtype = resolve_source(source).dtype
+        self.on_rows = on_rows
+        self.on_error = on_error
+        self.capacity = capacity
+        self.drain_interval = drain_interval
+        self.status_interval = status_interval
+        self.ring = None
+        self.process = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self._drain_thread = None
+        self._draining = threading.Event()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def launch(self) -> None:
+        """Create the ring buffer and start the worker process."""
+        authkey = secrets.token_bytes(16)
+        self.ring = SharedRingBuffer(self.dtype, self.capacity)
+        listener = Listener(('127.0.0.1', 0), authkey=authkey)
+        env = dict(os.environ, **{AUTHKEY_ENV: authkey.hex()})
+        host, port = listener.address
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--source', self.source, '--ring', self.ring.name,
+             '--capacity', str(self.capacity), '--address', f'{host}:{port}'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+
+        # Listener.accept() has no timeout; accept on a helper thread and give up if the worker dies
+        accepted = {}
+        acceptor = threading.Thread(target=lambda: accepted.update(conn=listener.accept()), daemon=True)
+        acceptor.start()
+        deadline = time.monotonic() + LAUNCH_TIMEOUT
+        while acceptor.is_alive() and self.alive and time.monotonic() < deadline:
+            acceptor.join(0.1)
+        listener.close()
+        if 'conn' not in accepted:
+            self.close()
+            raise RuntimeError(f"Device worker {self.source} did not start")
+        self._conn = accepted['conn']
+        print(f"✓ Device worker {self.source} running (pid {self.process.pid})")
+
+    def request(self, command: str, args: Optional[dict] = None, timeout: float = DEFAULT_REQUEST_TIMEOUT):
+        """Send one control request and return its reply value (RuntimeError on errors)."""
+        with self._lock:
+            if self._conn is None or not self.alive:
+                raise RuntimeError(f"Device worker {self.source} is not running")
+            self._conn.send((command, args or {}))
+            if not self._conn.poll(timeout):
+                raise RuntimeError(f"Device worker {self.source} did not answer '{command}' in {timeout} s")
+            status, value = self._conn.recv()
+        if status == 'error':
+            raise RuntimeError(value)
+        return value
+
+    def open(self, timeout: float = DEFAULT_REQUEST_TIMEOUT, **options) -> dict:
+        """Open the device in the worker; returns the source's description."""
+        return self.request('open', options, timeout=timeout)
+
+    def start(self) -> None:
+        """Start acquisition and the drain thread."""
+        self.request('start')
+        if self._drain_thread is None or not self._drain_thread.is_alive():
+            self._draining.set()
+            self._drain_thread = threading.Thread(target=self._drain_loop, daemon=True)
+            self._drain_thread.start()
+
+    def stop(self) -> None:
+        """Stop acquisition, then deliver the rows still in the ring buffer."""
+        if self.alive and self._conn is not None:
+            try:
+                self.request('stop')
+            except RuntimeError as e:
+                print(f"Error stopping device worker {self.source}: {e}")
+        self._draining.clear()
+        # on_error may stop the worker from the drain thread itself
+        if self._drain_thread is not None and self._drain_thread is not threading.current_thread():
+            self._drain_thread.join(timeout=5)
+        self._drain_thread = None
+        self._drain()
+
+    def status(self) -> dict:
+        """Worker and source state plus the ring buffer counters."""
+        status = {'source': self.source, 'alive': self.alive,
+                  'pid': self.process.pid if self.process is not None else None}
+        if self.ring is not None:
+            status.update(rows_read=self.ring.rows_read, dropped_rows=self.ring.dropped,
+                          backlog_rows=self.ring.written - self.ring.rows_read - self.ring.dropped)
+        if self.alive:
+            try:
+                status.update(self.request('status'))
+            except RuntimeError as e:
+                status['error'] = str(e)
+        return status
+
+    def close(self) -> None:
+        """Stop the worker process and release the ring buffer."""
+        if self._drain_thread is not None:
+            self.stop()
+        if self.alive and self._conn is not None:
+            try:
+                self.request('quit')
+            except RuntimeError as e:
+                print(f"Error closing device worker {self.source}: {e}")
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def _drain(self) -> None:
+        if self.ring is None:
+            return
+        rows = self.ring.read()
+        if len(rows):
+            self.on_rows(rows)
+
+    def _drain_loop(self) -> None:
+        next_status = time.monotonic() + self.status_interval
+        while self._draining.is_set():
+            try:
+                self._drain()
+            except Exception as e:
+                print(f"Error handling rows from device worker {self.source}: {e}")
+            if time.monotonic() >= next_status:
+                next_status = time.monotonic() + self.status_interval
+                error = None if self.alive else f"Device worker {self.source} exited"
+                if error is None:
+                    try:
+                        error = self.request('status').get('error')
+                    except RuntimeError as e:
+                        error = str(e)
+                if error:
+                    self._draining.clear()
+                    self._drain()
+                    if self.on_error is not None:
+                        self.on_error(error)
+                    return
+            time.sleep(self.drain_interval)
+
+
+def run_worker(source_spec: str, ring_name: str, capacity: int, address: tuple, authkey: bytes) -> None:
+    """Worker process main loop: serve control requests and copy source rows into the ring buffer."""
+    source = resolve_source(source_spec)()
+    ring = SharedRingBuffer(source.dtype, capacity, name=ring_name)
+    conn = Client(address, authkey=authkey)
+    streaming = False
+    opened = False
+    error = None
+    rows_written = 0
+    try:
+        while True:
+            if conn.poll(0 if streaming else IDLE_POLL_INTERVAL):
+                command, args = conn.recv()
+                if command == 'quit':
+                    conn.send(('ok', None))
+                    break
+                try:
+                    if command == 'open':
+                        reply = source.open(**args)
+                        opened = True
+                        error = None
+                    elif command == 'start':
+                        if not opened:
+                            raise RuntimeError("Device is not open")
+                        streaming, reply = True, None
+                    elif command == 'stop':
+                        streaming, reply = False, None
+                    elif command == 'status':
+                        reply = dict(source.status() if opened else {}, streaming=streaming,
+                                     rows_written=rows_written, error=error)
+                    else:
+                        raise ValueError(f"Unknown command: {command}")
+                    conn.send(('ok', reply))
+                except Exception as e:
+                    conn.send(('error', f"{type(e).__name__}: {e}"))
+
+            if streaming:
+                try:
+                    rows = source.read_block()
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                    print(f"✗ Device worker {source_spec}: {error}")
+                    streaming = False
+                    continue
+                if rows is not None and len(rows):
+                    ring.write(rows)
+                    rows_written += len(rows)
+    except (EOFError, ConnectionError):
+        print(f"Device worker {source_spec}: control channel closed")
+    finally:
+        try:
+            source.close()
+        except Exception as e:
+            print(f"Error closing device source {source_spec}: {e}")
+        ring.close()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Out-of-process device acquisition worker (see DeviceWorker).")
+    parser.add_argument('--source', required=True, help="Source class as Module:Class")
+    parser.add_argument('--ring', required=True, help="Shared memory ring buffer name")
+    parser.add_argument('--capacity', type=int, required=True, help="Ring buffer rows")
+    parser.add_argument('--address', required=True, help="Control channel host:port")
+    args = parser.parse_args()
+
+    host, port = args.address.rsplit(':', 1)
+    run_worker(args.source, args.ring, args.capacity, (host, int(port)), bytes.fromhex(os.environ[AUTHKEY_ENV]))
+
+
+if __name__ == '__main__':
+    main()
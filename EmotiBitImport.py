@@ -0,0 +1,190 @@
+"""
+EmotiBitImport Module
+
+Converts an EmotiBit SD-card ground truth CSV (imported through /import_emotibit_csv)
+into an HDF5 file with one group per sensor type tag and its summary pyramid, so
+whole-session overviews of the EmotiBit signals do not re-parse the raw CSV.
+
+INPUT (raw EmotiBit packet lines; '%'/'#' lines are comments):
+    EmotiBitTimestamp,PacketNumber,DataLength,TypeTag,ProtocolVersion,DataReliability,v1,...,vN
+
+OUTPUT (<csv name>.h5 next to the CSV):
+    /<TypeTag>/data        (emotibit_seconds f8, value f4), one row per sample
+    /<TypeTag>/summary/..  1 s / 10 s / 60 s min/mean/max (see SummaryPyramid)
+
+Packets whose payload is not numeric (LSL markers 'LM', time sync packets, ...) are
+skipped. The whole file is parsed in one pandas read with vectorized numeric conversion.
+Times are the EmotiBit clock (EmotiBitTimestamp / 1000), not unix time.
+
+SAMPLE TIMES:
+    A packet carries several samples but one timestamp. The last sample of a packet is
+    stamped with the packet time and earlier ones are spaced back at the channel's sample
+    period, estimated per type tag as the median of (packet interval / samples in packet).
+
+    python EmotiBitImport.py <csv> [<csv> ...] [--result-json PATH]
+    (run by /import_emotibit_csv as a background job, see BackgroundJobs)
+"""
+import argparse
+import csv
+import os
+from typing import Dict, Optional, Tuple
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from BackgroundJobs import write_result_json
+from HDF5Appender import create_stream_dataset
+from SummaryPyramid import write_pyramid, DEFAULT_LEVELS
+
+EMOTIBIT_TIME_FIELD = 'emotibit_seconds'
+EMOTIBIT_DTYPE = np.dtype([
+    (EMOTIBIT_TIME_FIELD, 'f8'),
+    ('value', 'f4'),
+])
+EMOTIBIT_LAYOUT = {"chunk_rows": 16384, "compression": "gzip", "compression_opts": 4, "shuffle": True}
+
+
+NUMERIC_BYTES = np.zeros(256, dtype=bool)
+NUMERIC_BYTES[np.frombuffer(b'0123456789.-+eE,\r\n', dtype=np.uint8)] = True
+PAYLOAD_FIELD = 6
+
+
+def _scan_lines(csv_path: str) -> Tuple[int, np.ndarray]:
+    """
+    Byte-level pass over the file: (most comma-separated fields on a kept line, indices of the
+    lines to skip). Comment lines and packets with a non-numeric payload are skipped up front,
+    so pandas parses every payload column on its fast numeric path.
+    """
+    data = np.fromfile(csv_path, dtype=np.uint8)
+    if len(data) == 0:
+        return 0, np.zeros(0, dtype=np.int64)
+    line_ends = np.r_[np.flatnonzero(data == ord('\n')), len(data)]
+    line_starts = np.r_[0, line_ends[:-1] + 1]
+    first_bytes = data[np.minimum(line_starts, len(data) - 1)]
+    skip = (first_bytes == ord('%')) | (first_bytes == ord('#'))
+
+    commas = np.flatnonzero(data == ord(','))
+    commas_before = np.searchsorted(commas, line_ends)
+    fields = np.diff(commas_before, prepend=0) + 1
+
+    # A byte that cannot be part of a number, after the comma opening the payload
+    text_bytes = np.flatnonzero(~NUMERIC_BYTES[data])
+    text_lines = np.searchsorted(line_ends, text_bytes)
+    first_comma = commas_before[text_lines] - (fields[text_lines] - 1)
+    has_payload = fields[text_lines] > PAYLOAD_FIELD
+    payload_start = commas[np.minimum(first_comma + PAYLOAD_FIELD - 1, len(commas) - 1)] if len(commas) else 0
+    skip[text_lines[has_payload & (text_bytes > payload_start)]] = True
+
+    kept_fields = fields[~skip]
+    return (int(kept_fields.max()) if len(kept_fields) else 0), np.flatnonzero(skip)
+
+
+def sample_period(packet_times: np.ndarray, packet_sizes: np.ndarray) -> float:
+    """Median seconds per sample between consecutive packets of one channel (0 if unknown)."""
+    intervals = np.diff(packet_times)
+    valid = intervals > 0
+    if not valid.any():
+        return 0.0
+    return float(np.median(intervals[valid] / packet_sizes[1:][valid]))
+
+
+def parse_emotibit_csv(csv_path: str) -> Dict[str, np.ndarray]:
+    """
+    Read the numeric sensor packets of a raw EmotiBit CSV.
+
+    Returns:
+        dict: {type_tag: structured array with EMOTIBIT_DTYPE, sorted by time}
+    """
+    n_fields, skip_lines = _scan_lines(csv_path)
+    if n_fields <= PAYLOAD_FIELD:
+        return {}
+    df = pd.read_csv(csv_path, header=None, names=range(n_fields), quoting=csv.QUOTE_NONE, low_memory=False,
+                     skiprows=set(skip_lines.tolist()), dtype={3: 'category'},
+                     encoding='utf-8', encoding_errors='replace')
+
+    # Malformed lines fail the numeric conversion
+    timestamps = pd.to_numeric(df[0], errors='coerce').to_numpy(dtype='f8')
+    lengths = pd.to_numeric(df[2], errors='coerce').to_numpy(dtype='f8')
+    raw = df.iloc[:, PAYLOAD_FIELD:]
+    values = np.column_stack([pd.to_numeric(raw[column], errors='coerce').to_numpy(dtype='f8')
+                              for column in raw.columns])
+
+    # Payload slots of each packet: the first DataLength fields actually present
+    in_payload = (np.arange(raw.shape[1]) < np.nan_to_num(lengths, nan=0.0)[:, None]) & raw.notna().to_numpy()
+    numeric = ~np.isnan(values)
+    packet_ok = (~np.isnan(timestamps) & ~np.isnan(lengths) & in_payload.any(axis=1)
+                 & ~(in_payload & ~numeric).any(axis=1))
+
+    tag_codes, tag_names = df[3].cat.codes.to_numpy(), df[3].cat.categories
+    streams = {}
+    for code in np.unique(tag_codes[packet_ok]):
+        tag = str(tag_names[code])
+        packets = np.flatnonzero(packet_ok & (tag_codes == code))
+        mask = in_payload[packets]
+        sizes = mask.sum(axis=1)
+        times = timestamps[packets] / 1000.0
+        period = sample_period(times, sizes)
+        # Position of each sample counted back from the last sample of its packet
+        back = np.cumsum(mask[:, ::-1], axis=1)[:, ::-1][mask] - 1
+
+        rows = np.zeros(int(sizes.sum()), dtype=EMOTIBIT_DTYPE)
+        rows[EMOTIBIT_TIME_FIELD] = np.repeat(times, sizes) - back * period
+        rows['value'] = values[packets][mask]
+        streams[tag] = rows[np.argsort(rows[EMOTIBIT_TIME_FIELD], kind='stable')]
+    return streams
+
+
+def emotibit_csv_to_hdf5(csv_path: str, hdf5_path: Optional[str] = None,
+                         levels=DEFAULT_LEVELS) -> Tuple[str, Dict[str, int]]:
+    """
+    Write the sensor streams of a raw EmotiBit CSV and their summary pyramids to HDF5.
+
+    Args:
+        csv_path (str): Raw EmotiBit ground truth CSV.
+        hdf5_path (str): Output file (default: the CSV path with an .h5 extension). Replaced if present.
+        levels (tuple): Summary bucket sizes in seconds.
+
+    Returns:
+        (str, dict): Output path and {type_tag: rows written}.
+    """
+    hdf5_path = hdf5_path or os.path.splitext(csv_path)[0] + '.h5'
+    streams = parse_emotibit_csv(csv_path)
+
+    with h5py.File(hdf5_path, 'w') as h5_file:
+        h5_file.attrs['source_csv'] = os.path.basename(csv_path)
+        h5_file.attrs['time_base'] = 'EmotiBitTimestamp / 1000 (device clock, seconds)'
+        for tag, rows in streams.items():
+            group = h5_file.create_group(tag)
+            dataset = create_stream_dataset(group, 'data', EMOTIBIT_DTYPE, EMOTIBIT_LAYOUT)
+            dataset.resize(len(rows), axis=0)
+            dataset[:] = rows
+            dataset.attrs['rows_written'] = len(rows)
+            write_pyramid(group, levels, time_field=EMOTIBIT_TIME_FIELD)
+
+    print(f"EmotiBit CSV '{csv_path}' converted to '{hdf5_path}' ({len(streams)} streams)")
+    return hdf5_path, {tag: len(rows) for tag, rows in streams.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert raw EmotiBit CSVs to per-sensor HDF5 with summaries.")
+    parser.add_argument('files', nargs='+', help="Raw EmotiBit ground truth CSVs")
+    parser.add_argument('--result-json', default=None, help="Write {csv: {file, rows}} to this JSON file")
+    args = parser.parse_args()
+
+    result, failed = {}, False
+    for csv_path in args.files:
+        try:
+            hdf5_path, rows = emotibit_csv_to_hdf5(csv_path)
+            result[csv_path] = {'file': hdf5_path, 'rows': rows}
+        except Exception as e:
+            print(f"Error converting EmotiBit CSV '{csv_path}': {e}")
+            result[csv_path] = {'error': str(e)}
+            failed = True
+    write_result_json(args.result_json, result)
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
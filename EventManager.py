@@ -5,18 +5,97 @@ from threading import Thread, Event
 import threading
 import time
 import atexit
+import queue
 import TimestampManager as tm
+from MarkerTimeline import MarkerTimeline
+from HDF5Appender import (HDF5Appender, create_stream_dataset, valid_rows, write_metadata_attrs, expand_metadata_columns,
+                          is_schema_v1, legacy_row, open_stream_file, close_stream_file)
+from HDF5Exporter import (export_hdf5_to_csv, export_hdf5_to_parquet, write_frame_to_csv, structured_to_frame,
+                          stream_parent, print_progress)
+from SessionStore import SessionStore
+from ParquetStore import parquet_path_for, write_frame_to_parquet
+from SummaryPyramid import write_pyramid
+from StreamSlicer import write_marker_index
 import pandas as pd
 from datetime import datetime, timezone
 
+# Recording modes:
+#   "transitions" - write one row per marker/condition change (event-sourced)
+#   "poll"        - legacy behaviour, write the current state every 10 ms
+EVENT_MODES = ("transitions", "poll")
+DEFAULT_GRID_RATE_HZ = 100.0
+
+# Group name in the session file when a SessionStore is used
+SESSION_STREAM = "event_markers"
+
+STREAM_DTYPE = np.dtype([
+    ('timestamp_unix', 'f8'),
+    ('event_marker', h5py.string_dtype(encoding='utf-8')),
+    ('condition', h5py.string_dtype(encoding='utf-8'))
+])
+
+def expand_transitions_to_grid(transitions: pd.DataFrame, t_start: float, t_stop: float,
+                               rate_hz: float = DEFAULT_GRID_RATE_HZ) -> pd.DataFrame:
+    """
+    Rebuild the fixed-rate event timeline from a transitions table.
+
+    Args:
+        transitions (pd.DataFrame): Rows sorted by 'timestamp_unix', one per marker/condition change.
+        t_start (float): First grid timestamp (unix seconds).
+        t_stop (float): Grid end (unix seconds, exclusive).
+        rate_hz (float): Grid sample rate.
+
+    Returns:
+        pd.DataFrame: One row per grid tick carrying the marker/condition in effect at that tick.
+    """
+    n_ticks = max(int(np.floor((t_stop - t_start) * rate_hz)), 0)
+    grid_ts = t_start + np.arange(n_ticks, dtype='f8') / rate_hz
+
+    change_ts = transitions['timestamp_unix'].to_numpy(dtype='f8')
+    idx = np.searchsorted(change_ts, grid_ts, side='right') - 1
+    idx = np.clip(idx, 0, max(len(change_ts) - 1, 0))
+
+    grid = transitions.iloc[idx].reset_index(drop=True)
+    grid['timestamp_unix'] = grid_ts
+    if 'timestamp_iso' in grid.columns:
+        grid['timestamp_iso'] = tm.format_iso_array(grid_ts)
+    return grid
+
+
+def other_streams_end(h5_file, skip_group: str = None) -> float:
+    """
+    Latest 'timestamp_unix' over the other stream groups of a session file
+    (None when the file holds no other timestamped stream).
+    """
+    end = None
+    for name, group in h5_file.items():
+        if name == skip_group or not isinstance(group, h5py.Group) or 'data' not in group:
+            continue
+        dataset = group['data']
+        n = valid_rows(dataset)
+        if n == 0 or dataset.dtype.names is None or 'timestamp_unix' not in dataset.dtype.names:
+            continue
+        last = float(dataset.fields('timestamp_unix')[n - 1])
+        end = last if end is None else max(end, last)
+    return end
+
 class EventManager:
-    def __init__(self):
+    def __init__(self, mode: str = "transitions", grid_rate_hz: float = DEFAULT_GRID_RATE_HZ,
+                 marker_timeline: MarkerTimeline = None, session_store: SessionStore = None,
+                 swmr: bool = False):
+        if mode not in EVENT_MODES:
+            raise ValueError(f"mode must be one of {EVENT_MODES}")
+
+        self.mode = mode
+        self.grid_rate_hz = grid_rate_hz
         self.time_started_iso = None
         self.time_started_unix = None
+        self.time_stopped_unix = None
         self.is_streaming = False
         
-        self._event_marker = 'startup'
-        self._condition = 'None'
+        # Shared with the sensor managers; /set_event_marker updates it once for all streams
+        self.marker_timeline = marker_timeline or MarkerTimeline()
+        self.marker_timeline.add_listener(self._on_marker_change)
         self._experiment_name = None
         self._trial_name = None
         self._subject_id = None
@@ -24,6 +103,7 @@ class EventManager:
         self.thread = None
         self.shutdown_event = Event()
         self.lock = threading.Lock()
+        self._transitions = queue.Queue()
     
         self._data_folder = None
         self.csv_filename = None
@@ -32,17 +112,27 @@ class EventManager:
         self.hdf5_filename = None
         self.hdf5_file = None
         self._dataset = None
+        self._appender = None
         self._time_started = None
 
+        # When set, the stream is a group of the session file written by the store's thread
+        self.session_store = session_store
+        self.hdf5_group = None
+        # The event rows hold variable-length strings, which HDF5 does not support in SWMR
+        # mode, so the event file is never written in SWMR mode (swmr is accepted and ignored)
+        if swmr:
+            print("Event Manager: SWMR is not used for the event file (variable-length string rows).")
+        self.swmr = False
+
+        # Transitions are rare, so flush on a timer; poll mode fills 100 rows/s.
+        # history_rows: last ~10 minutes of poll rows kept in memory for the live tail endpoint
+        self.appender_options = {"flush_rows": 256, "flush_interval": 1.0, "history_rows": 60000}
+        self.hdf5_layout = {"chunk_rows": 1024, "compression": "gzip", "compression_opts": 4, "shuffle": True}
+
         self.current_row = {
-                                "experiment_name": None, 
-                                "trial_name": None,
-                                "subject_id": None,
-                                "experimenter_name": None,
                                 "timestamp_unix": None,
-                                "timestamp_iso": None,
-                                "event_marker": self._event_marker,
-                                "condition": self._condition,
+                                "event_marker": self.marker_timeline.event_marker,
+                                "condition": self.marker_timeline.condition,
                             }
         
         atexit.register(self.stop)
@@ -58,6 +148,7 @@ class EventManager:
     def experimenter_name(self, value):
         if isinstance(value, str):
             self._experimenter_name = value
+            self._write_metadata_attrs()
         else:
             raise ValueError("Experimenter name must be a string.")
         
@@ -71,24 +162,19 @@ class EventManager:
 
     @property
     def event_marker(self):
-        return self._event_marker
+        return self.marker_timeline.event_marker
     
     @event_marker.setter
     def event_marker(self, value):
-        if isinstance(value, str):
-            self._event_marker = value
-        else:
-            raise ValueError("Event marker must be a string.")
+        self.marker_timeline.set_marker(value)
+
     @property
     def condition(self):
-        return self._condition
+        return self.marker_timeline.condition
     
     @condition.setter
     def condition(self, value):
-        if isinstance(value, str):
-            self._condition = value
-        else:
-            raise ValueError("Condition must be a string.")
+        self.marker_timeline.set_condition(value)
         
     ##################################################################
     # Methods ########################################################  
@@ -100,17 +186,59 @@ class EventManager:
         if not self.is_streaming:
             self.is_streaming = True
             self.shutdown_event.clear()
+            self.time_stopped_unix = None
             self.thread = Thread(target=self._stream_events, daemon=True)
             self.thread.start()
             self.time_started_iso = tm.get_timestamp("iso")
             self.time_started_unix = tm.get_timestamp("unix")
 
+            # Seed the log with the state in effect when streaming began
+            self._on_marker_change(tm.get_timestamp_ns() * 1e-9,
+                                   self.marker_timeline.event_marker,
+                                   self.marker_timeline.condition)
+
             print("Event Manager started streaming...")
 
+    def recent_rows(self, seconds: float = None):
+        """
+        Newest rows kept in memory by the appender (see HDF5Appender.recent); None when not recording.
+
+        In transitions mode a window without changes would be empty although a marker is in
+        effect, so the last change before the window is included, stamped at the window start.
+        """
+        if self._appender is None:
+            return None
+        if self.mode != "transitions" or seconds is None:
+            return self._appender.recent(seconds)
+
+        rows = self._appender.recent()
+        window_start = tm.get_timestamp_ns() * 1e-9 - seconds
+        first = max(int(np.searchsorted(rows['timestamp_unix'], window_start, side='right')) - 1, 0)
+        rows = rows[first:].copy()
+        if len(rows) and rows['timestamp_unix'][0] < window_start:
+            rows['timestamp_unix'][0] = window_start
+        return rows
+
     def close_h5_file(self):
-        if self.hdf5_file:
-            self.hdf5_file.flush()
-            self.hdf5_file.close()
+        def finalize(parent):
+            if self.time_stopped_unix is not None:
+                parent['data'].attrs['time_stopped_unix'] = self.time_stopped_unix
+            self.marker_timeline.write_to_hdf5(parent)
+            write_marker_index(parent)
+            # Rows per second/10 s/minute for QA of the 100 Hz poll-mode stream; in transitions
+            # mode the rows are the changes themselves and their counts say nothing
+            if self.mode != "transitions":
+                write_pyramid(parent)
+
+        if self.hdf5_group is not None and self._appender is not None:
+            self._appender.close(finalize=finalize)
+            self._appender = None
+            return "HDF5 stream closed."
+        elif self.hdf5_file:
+            if self._appender is not None:
+                self._appender.close()
+                self._appender = None
+            close_stream_file(self.hdf5_file, finalize=finalize)
             self.hdf5_file = None  
             self._dataset = None    
 
@@ -125,6 +253,7 @@ class EventManager:
         
         print("Stopping Event Manager...")
         
+        self.time_stopped_unix = tm.get_unix_timestamp_double()
         self.shutdown_event.set()
         self.is_streaming = False  
         
@@ -159,8 +288,27 @@ class EventManager:
         self._subject_id = subject_id
         self._experimenter_name = experimenter_name
         
+        self._write_metadata_attrs()
         print(f"Metadata set: {experiment_name}/{trial_name}/{subject_id}")
 
+    def _metadata(self) -> dict:
+        return {
+            'experiment_name': self._experiment_name,
+            'trial_name': self._trial_name,
+            'subject_id': self._subject_id,
+            'experimenter_name': self._experimenter_name,
+        }
+
+    def _write_metadata_attrs(self):
+        """Store the session metadata once as dataset attributes instead of in every row."""
+        metadata = self._metadata()
+        if self.hdf5_group is not None and self._appender is not None:
+            self._appender.submit(lambda group: write_metadata_attrs(group['data'], metadata), structural=True)
+            return
+        if self._dataset is None or 'experiment_name' in self._dataset.dtype.names:
+            return
+        write_metadata_attrs(self._dataset, metadata)
+
     def set_data_folder(self, subject_folder):
         self.data_folder = subject_folder
 
@@ -199,26 +347,32 @@ class EventManager:
         os.makedirs(os.path.dirname(self.hdf5_filename), exist_ok=True)
         
         try:
+            if self.session_store is not None:
+                self.hdf5_filename = self.session_store.filename
+                self.hdf5_group = SESSION_STREAM
+                self._appender = self.session_store.open_stream(
+                    SESSION_STREAM, STREAM_DTYPE, self.hdf5_layout,
+                    attrs={'mode': self.mode, 'grid_rate_hz': self.grid_rate_hz},
+                    **self.appender_options)
+                self._write_metadata_attrs()
+                print(f"✓ Event stream '{SESSION_STREAM}' initialized in session file: {self.hdf5_filename}")
+                return
+
             print(f"Initializing HDF5 file at: {self.hdf5_filename}")
-            self.hdf5_file = h5py.File(self.hdf5_filename, 'a')  
+            self.hdf5_file = open_stream_file(self.hdf5_filename, swmr=self.swmr)
             if 'data' not in self.hdf5_file:  
-                dtype = np.dtype([
-                    ('experiment_name', h5py.string_dtype(encoding='utf-8')),
-                    ('trial_name', h5py.string_dtype(encoding='utf-8')),
-                    ('subject_id', h5py.string_dtype(encoding='utf-8')),
-                    ('experimenter_name', h5py.string_dtype(encoding='utf-8')),
-                    ('timestamp_unix', 'f8'),
-                    ('timestamp_iso', h5py.string_dtype(encoding='utf-8')),
-                    ('event_marker', h5py.string_dtype(encoding='utf-8')),
-                    ('condition', h5py.string_dtype(encoding='utf-8'))
-                ])
-                self._dataset = self.hdf5_file.create_dataset(
-                    'data', shape=(0,), maxshape=(None,), dtype=dtype
-                )
+                self._dataset = create_stream_dataset(self.hdf5_file, 'data', STREAM_DTYPE, self.hdf5_layout)
+                self._dataset.attrs['mode'] = self.mode
+                self._dataset.attrs['grid_rate_hz'] = self.grid_rate_hz
                 print("✓ Created HDF5 dataset")
             else:
                 self._dataset = self.hdf5_file['data']
                 print("✓ Using existing HDF5 dataset")
+
+            self._write_metadata_attrs()
+            self._appender = HDF5Appender(self._dataset, swmr=self.swmr, **self.appender_options)
+            if self.swmr:
+                self.hdf5_file.swmr_mode = True
             
             print(f"✓ HDF5 file initialized: {self.hdf5_filename}")
 
@@ -227,86 +381,174 @@ class EventManager:
             print(f"✗ {error_msg}")
             raise RuntimeError(error_msg) from e
 
+    def _on_marker_change(self, timestamp: float, event_marker: str, condition: str):
+        """
+        MarkerTimeline listener: queue the change for the writer thread.
+        No-op in poll mode or while not streaming.
+        """
+        if self.mode != "transitions" or not self.is_streaming:
+            return
+
+        self._transitions.put((timestamp, event_marker, condition))
+
     def _stream_events(self):
         if not self.is_streaming:
             print("Event Manager is not currently streaming. Please start the server first.")
             return
         
         print("Event Manager streaming thread started...")
+        if self.mode == "transitions":
+            self._stream_transitions()
+            return
+
         while not self.shutdown_event.is_set():
             with self.lock:
-                self.current_row["experiment_name"] = self._experiment_name
-                self.current_row["trial_name"] = self._trial_name
-                self.current_row["subject_id"] = self._subject_id
-                self.current_row["experimenter_name"] = self.experimenter_name
-                self.current_row["timestamp_unix"] = tm.get_timestamp("unix")
-                self.current_row["timestamp_iso"] = tm.get_timestamp("iso")
-                self.current_row["event_marker"] = self._event_marker
-                self.current_row["condition"] = self._condition
+                self.current_row["timestamp_unix"] = tm.get_timestamp_ns() * 1e-9
+                self.current_row["event_marker"] = self.marker_timeline.event_marker
+                self.current_row["condition"] = self.marker_timeline.condition
                 
                 self.write_to_hdf5(self.current_row)
 
             time.sleep(0.01) # Adjust sleep time as needed (dependent on EmotiBit sampling rate)
 
+    def _stream_transitions(self):
+        """Block on the transition queue and write one row per marker/condition change."""
+        while True:
+            try:
+                ts, marker, condition = self._transitions.get(timeout=0.5)
+            except queue.Empty:
+                if self.shutdown_event.is_set():
+                    break
+                continue
+
+            self.current_row["timestamp_unix"] = ts
+            self.current_row["event_marker"] = marker
+            self.current_row["condition"] = condition
+
+            self.write_to_hdf5(self.current_row)
+
     def write_to_hdf5(self, row):
-        if not self.hdf5_file or not self._dataset:
+        if self._appender is None:
             print("HDF5 file or dataset not initialized. Cannot write data.")
             return
         
-        # with self.lock:
-        # Append the new row to the dataset
-        self._dataset.resize(self._dataset.shape[0] + 1, axis=0)
-        self._dataset[-1] = (
-                                row['experiment_name'], 
-                                row['trial_name'], 
-                                row['subject_id'], 
-                                row['experimenter_name'],
-                                row['timestamp_unix'], 
-                                row['timestamp_iso'], 
-                                row['event_marker'], 
-                                row['condition'], 
-                            )
-
-    def hdf5_to_csv(self):
+        if is_schema_v1(self._dataset):
+            # Existing version 1 file: keep filling the columns rows no longer carry
+            row = legacy_row(row, self._metadata(), 'timestamp_iso')
+        self._appender.append(row)
+
+    def read_transitions(self) -> pd.DataFrame:
+        """Load the raw rows of the event file as a DataFrame (transitions or polled rows)."""
+        with h5py.File(self.hdf5_filename, 'r') as h5_file:
+            parent = stream_parent(h5_file, self.hdf5_group)
+            if 'data' not in parent:
+                raise KeyError(f"Dataset 'data' not found in the file {self.hdf5_filename}.")
+            dataset = parent['data']
+            attrs = dict(dataset.attrs)
+            data = dataset[:valid_rows(dataset)]
+
+        return expand_metadata_columns(tm.add_iso_column(structured_to_frame(data)), attrs)
+
+    def read_event_grid(self, rate_hz: float = None) -> pd.DataFrame:
+        """
+        Produce the fixed-rate event timeline on demand.
+
+        For files recorded in "transitions" mode the grid is rebuilt from the change rows,
+        spanning the first transition to the recorded stop time. Poll-mode files are
+        returned unchanged since they already are the grid.
+
+        Without a stop time (the recording is live or did not stop cleanly) the grid runs
+        to the end of the other streams of the session file, to now while this manager is
+        still streaming, or else to the file's last write time.
+        """
+        with h5py.File(self.hdf5_filename, 'r') as h5_file:
+            parent = stream_parent(h5_file, self.hdf5_group)
+            attrs = dict(parent['data'].attrs) if 'data' in parent else {}
+            streams_end = other_streams_end(h5_file, self.hdf5_group) if self.hdf5_group is not None else None
+
+        transitions = self.read_transitions()
+        if attrs.get('mode', 'poll') != 'transitions' or transitions.empty:
+            return transitions
+
+        rate_hz = rate_hz or float(attrs.get('grid_rate_hz', DEFAULT_GRID_RATE_HZ))
+        t_start = float(transitions['timestamp_unix'].iloc[0])
+        t_last = float(transitions['timestamp_unix'].iloc[-1])
+        if 'time_stopped_unix' in attrs:
+            t_stop = float(attrs['time_stopped_unix'])
+        elif streams_end is not None:
+            t_stop = streams_end
+        elif self.is_streaming:
+            t_stop = tm.get_unix_timestamp_double()
+        else:
+            t_stop = os.path.getmtime(self.hdf5_filename)
+        # The last marker holds for at least one tick
+        t_stop = max(t_stop, t_last + 1.0 / rate_hz)
+        return expand_transitions_to_grid(transitions, t_start, t_stop, rate_hz)
+
+    def hdf5_to_csv(self, rate_hz: float = None, progress=print_progress):
         """
         Convert an HDF5 file to a CSV file.
+        The file stores numeric timestamps only; timestamp_iso is generated here.
+        Transitions-mode files are expanded to the fixed-rate grid (grid_rate_hz by default).
         Dependencies:
             h5_filename (str): The path to the HDF5 file.
             csv_filename (str): The path to the CSV file to be created.
+        Returns:
+            int: Rows written, or None if the conversion failed.
         """
         try:
-            chunk_size = 1000
             with h5py.File(self.hdf5_filename, 'r') as h5_file:
-                if 'data' not in h5_file:
+                parent = stream_parent(h5_file, self.hdf5_group)
+                if 'data' not in parent:
                     print(f"Dataset 'data' not found in the file {self.hdf5_filename}.")
                     return
-                
-                dataset = h5_file['data']
-                field_names = dataset.dtype.names
-                first_chunk = True
-
-                for start in range(0, dataset.shape[0], chunk_size):
-                    end = min(start + chunk_size, dataset.shape[0])
-                    chunk = dataset[start:end]
-
-                    chunk_dict = {
-                        field: np.char.decode(chunk[field], 'utf-8') if chunk[field].dtype.kind == 'S' 
-                            else [x.decode('utf-8') if isinstance(x, bytes) else x for x in chunk[field]]
-                        for field in field_names
-                    }
-
-                    chunk_df = pd.DataFrame(chunk_dict)
-
-                    if first_chunk:
-                        chunk_df.to_csv(self.csv_filename, mode='w', index=False, header=True)
-                        first_chunk = False
-                    else:
-                        chunk_df.to_csv(self.csv_filename, mode='a', header=False, index=False)
-            
+                is_transitions = parent['data'].attrs.get('mode', 'poll') == 'transitions'
+
+            if is_transitions:
+                rows = write_frame_to_csv(self.read_event_grid(rate_hz), self.csv_filename,
+                                          progress=progress, label='Event')
+            else:
+                rows = export_hdf5_to_csv(self.hdf5_filename, self.csv_filename,
+                                          progress=progress, label='Event', group=self.hdf5_group)
+
             print(f"HDF5 file '{self.hdf5_filename}' successfully converted to CSV file '{self.csv_filename}'.")
-        
+            return rows
+
         except FileNotFoundError:
             print(f"Error: The HDF5 file '{self.hdf5_filename}' was not found.")
-            
+
         except Exception as e:
             print(f"Error converting HDF5 to CSV: {e}")
+
+    def hdf5_to_parquet(self, rate_hz: float = None, progress=print_progress):
+        """
+        Convert HDF5 to a Parquet file next to the CSV (see ParquetStore).
+        Transitions-mode files are expanded to the fixed-rate grid, as for the CSV.
+
+        Returns:
+            int: Rows written, or None if the conversion failed.
+        """
+        try:
+            parquet_filename = parquet_path_for(self.csv_filename)
+            with h5py.File(self.hdf5_filename, 'r') as h5_file:
+                parent = stream_parent(h5_file, self.hdf5_group)
+                if 'data' not in parent:
+                    print(f"Dataset 'data' not found in the file {self.hdf5_filename}.")
+                    return
+                is_transitions = parent['data'].attrs.get('mode', 'poll') == 'transitions'
+
+            if is_transitions:
+                rows = write_frame_to_parquet(self.read_event_grid(rate_hz), parquet_filename,
+                                              drop_columns=['timestamp_iso'])
+            else:
+                rows = export_hdf5_to_parquet(self.hdf5_filename, parquet_filename,
+                                              progress=progress, label='Event', group=self.hdf5_group)
+
+            print(f"HDF5 file '{self.hdf5_filename}' successfully converted to Parquet file '{parquet_filename}'.")
+            return rows
+
+        except FileNotFoundError:
+            print(f"Error: The HDF5 file '{self.hdf5_filename}' was not found.")
+
+        except Exception as e:
+            print(f"Error converting HDF5 to Parquet: {e}")
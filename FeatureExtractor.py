@@ -0,0 +1,365 @@
+"""
+FeatureExtractor Module
+
+Per-marker-segment physiological features for every subject of a study, computed in a
+process pool (one task per subject) and collected into one feature table.
+
+INPUT:
+    experiments/subject_data/<experiment>/<trial>/<subject>/ (streams as read by
+    SessionAligner.collect_subject_streams). A subject recorded with one PolarHub strap
+    uses that strap as its cardiac stream; subjects with several straps are refused
+    (the HR features would mix different people's hearts).
+
+SEGMENTS:
+    One segment per interval of the markers table (event_marker + condition). Files
+    without a markers table are segmented at the changes of the event stream; subjects
+    without either get a single segment covering the recording.
+
+FEATURES (per segment):
+    hr_mean_bpm         mean Polar HR (0 = no contact, ignored)
+    rmssd_ms            mean of the strap's rolling RMSSD (cardiac HRV column)
+    resp_rate_bpm       mean Vernier respiration rate; when the belt reports none, upward
+                        mean crossings of the force signal per minute
+    force_amplitude     95th - 5th percentile of the respiration force
+    force_std           standard deviation of the respiration force
+    eda_mean, eda_std, eda_min, eda_max, eda_slope (per second)   EmotiBit EA channel
+
+    Means, standard deviations and slopes use cumulative sums over each stream, so a
+    subject costs O(samples + segments) regardless of the number of segments.
+
+INCREMENTAL RUNS:
+    <root>/features_manifest.json stores a fingerprint (path, size, mtime of every
+    .h5/.csv input) per subject. Subjects whose fingerprint is unchanged keep their rows
+    from the previous <root>/features.parquet (features.csv without pyarrow).
+
+    python FeatureExtractor.py [--root experiments/subject_data] [--experiment NAME] [--workers N] [--force]
+                               [--result-json PATH]
+
+    The pool uses the spawn start method. The web app runs this script as a background
+    job (BackgroundJobs) rather than calling extract_features in its own process.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from functools import partial
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from BackgroundJobs import write_result_json
+from HDF5Exporter import convert_in_parallel
+from ParquetStore import PARQUET_AVAILABLE, write_frame_to_parquet
+from SessionAligner import ALIGNED_SUFFIX, TIME_FIELD, collect_subject_streams
+
+DEFAULT_SUBJECT_DATA_DIR = os.path.join('experiments', 'subject_data')
+FEATURES_BASENAME = 'features'
+MANIFEST_FILENAME = 'features_manifest.json'
+MANIFEST_VERSION = 1
+EDA_STREAM = 'emotibit_EA'
+FORCE_PERCENTILES = (5, 95)
+
+KEY_COLUMNS = ['experiment', 'trial', 'subject']
+SEGMENT_COLUMNS = ['segment', 'event_marker', 'condition', 'start_unix', 'end_unix', 'duration_s']
+FEATURE_COLUMNS = ['hr_mean_bpm', 'rmssd_ms', 'resp_rate_bpm', 'force_amplitude', 'force_std',
+                   'eda_mean', 'eda_std', 'eda_min', 'eda_max', 'eda_slope']
+
+
+def find_subject_dirs(root: str = DEFAULT_SUBJECT_DATA_DIR, experiment: Optional[str] = None) -> List[str]:
+    """Subject directories <root>/<experiment>/<trial>/<subject>, sorted."""
+    pattern = os.path.join(root, experiment or '*', '*', '*')
+    return sorted(path for path in glob.glob(pattern) if os.path.isdir(path))
+
+
+def subject_key(subject_dir: str, root: str) -> str:
+    return os.path.relpath(subject_dir, root).replace(os.sep, '/')
+
+
+def input_fingerprint(subject_dir: str) -> str:
+    """Hash of (relative path, size, mtime) of every .h5/.csv input of a subject (aligned outputs excluded)."""
+    entries = []
+    for directory, _, filenames in os.walk(subject_dir):
+        for filename in filenames:
+            if not filename.endswith(('.h5', '.csv')) or ALIGNED_SUFFIX + '.' in filename:
+                continue
+            path = os.path.join(directory, filename)
+            stat = os.stat(path)
+            entries.append((os.path.relpath(path, subject_dir), stat.st_size, stat.st_mtime_ns))
+    return hashlib.sha1(json.dumps(sorted(entries)).encode('utf-8')).hexdigest()
+
+
+def marker_segments(streams: Dict[str, pd.DataFrame], table) -> pd.DataFrame:
+    """Segments (event_marker, condition, start_unix, end_unix) of one subject's recording."""
+    last_sample = max((float(df[TIME_FIELD].iloc[-1]) for df in streams.values() if len(df)), default=np.nan)
+    first_sample = min((float(df[TIME_FIELD].iloc[0]) for df in streams.values() if len(df)), default=np.nan)
+
+    if table is not None and len(table):
+        intervals = table.intervals
+        segments = pd.DataFrame({
+            'event_marker': table.marker_labels[intervals['marker_id']],
+            'condition': table.condition_labels[intervals['condition_id']],
+            'start_unix': intervals['start_unix'],
+            'end_unix': intervals['end_unix'],
+        })
+    elif 'event_markers' in streams and len(streams['event_markers']):
+        events = streams['event_markers']
+        labels = events['event_marker'].astype(str) + '\x00' + events['condition'].astype(str)
+        changes = np.flatnonzero(np.r_[True, labels.to_numpy()[1:] != labels.to_numpy()[:-1]])
+        starts = events[TIME_FIELD].to_numpy(dtype='f8')[changes]
+        segments = pd.DataFrame({
+            'event_marker': events['event_marker'].to_numpy(dtype=object)[changes],
+            'condition': events['condition'].to_numpy(dtype=object)[changes],
+            'start_unix': starts,
+            'end_unix': np.r_[starts[1:], np.inf],
+        })
+    else:
+        segments = pd.DataFrame({'event_marker': [''], 'condition': [''],
+                                 'start_unix': [first_sample], 'end_unix': [np.inf]})
+
+    # Open intervals end with the recording
+    segments['end_unix'] = np.where(np.isfinite(segments['end_unix']), segments['end_unix'], last_sample)
+    segments = segments[segments['end_unix'] > segments['start_unix']].reset_index(drop=True)
+    segments.insert(0, 'segment', np.arange(len(segments)))
+    segments['duration_s'] = segments['end_unix'] - segments['start_unix']
+    return segments
+
+
+def _bounds(ts: np.ndarray, segments: pd.DataFrame):
+    return (np.searchsorted(ts, segments['start_unix'].to_numpy(), side='left'),
+            np.searchsorted(ts, segments['end_unix'].to_numpy(), side='left'))
+
+
+def segment_moments(ts: np.ndarray, values: np.ndarray, segments: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """
+    Mean, standard deviation and least-squares slope (per second) of values within every
+    segment, from cumulative sums. NaN samples are ignored; empty segments get NaN.
+    """
+    start, stop = _bounds(ts, segments)
+    valid = ~np.isnan(values)
+    t = np.where(valid, ts - (ts[0] if len(ts) else 0.0), 0.0)
+    v = np.where(valid, values, 0.0)
+
+    def window(x):
+        c = np.concatenate(([0.0], np.cumsum(x)))
+        return c[stop] - c[start]
+
+    n = window(valid.astype('f8'))
+    sum_v, sum_vv = window(v), window(v * v)
+    sum_t, sum_tt, sum_tv = window(t), window(t * t), window(t * v)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(n > 0, sum_v / n, np.nan)
+        var = np.where(n > 1, (sum_vv - n * mean ** 2) / (n - 1), np.nan)
+        t_var = n * sum_tt - sum_t ** 2
+        slope = np.where((n > 1) & (t_var > 0), (n * sum_tv - sum_t * sum_v) / t_var, np.nan)
+    return {'mean': mean, 'std': np.sqrt(np.clip(var, 0, None)), 'slope': slope}
+
+
+def _segment_reduce(ts: np.ndarray, values: np.ndarray, segments: pd.DataFrame, fn) -> np.ndarray:
+    """fn(values of the segment without NaN) per segment; NaN for empty segments."""
+    start, stop = _bounds(ts, segments)
+    out = np.full(len(segments), np.nan)
+    for i, (lo, hi) in enumerate(zip(start, stop)):
+        window = values[lo:hi]
+        window = window[~np.isnan(window)]
+        if len(window):
+            out[i] = fn(window)
+    return out
+
+
+def _column(df: pd.DataFrame, column: str) -> np.ndarray:
+    return pd.to_numeric(df[column], errors='coerce').to_numpy(dtype='f8', na_value=np.nan)
+
+
+def compute_segment_features(streams: Dict[str, pd.DataFrame], segments: pd.DataFrame) -> pd.DataFrame:
+    """FEATURE_COLUMNS for every segment (NaN where a stream is missing)."""
+    features = pd.DataFrame({column: np.full(len(segments), np.nan) for column in FEATURE_COLUMNS})
+    if len(segments) == 0:
+        return features
+
+    cardiac = streams.get('cardiac')
+    if cardiac is not None and len(cardiac):
+        ts = cardiac[TIME_FIELD].to_numpy(dtype='f8')
+        hr = _column(cardiac, 'HR')
+        hr[hr <= 0] = np.nan
+        features['hr_mean_bpm'] = segment_moments(ts, hr, segments)['mean']
+        if 'HRV' in cardiac.columns:
+            rmssd = _column(cardiac, 'HRV')
+            rmssd[rmssd <= 0] = np.nan
+            features['rmssd_ms'] = segment_moments(ts, rmssd, segments)['mean']
+
+    respiratory = streams.get('respiratory')
+    if respiratory is not None and len(respiratory):
+        ts = respiratory[TIME_FIELD].to_numpy(dtype='f8')
+        force = _column(respiratory, 'force')
+        features['force_std'] = segment_moments(ts, force, segments)['std']
+        features['force_amplitude'] = _segment_reduce(
+            ts, force, segments, lambda w: np.subtract(*np.percentile(w, FORCE_PERCENTILES[::-1])))
+        rate = np.full(len(segments), np.nan)
+        if 'RR' in respiratory.columns:
+            belt_rate = _column(respiratory, 'RR')
+            belt_rate[belt_rate <= 0] = np.nan
+            rate = segment_moments(ts, belt_rate, segments)['mean']
+        missing = np.flatnonzero(np.isnan(rate))
+        if len(missing):
+            subset = segments.iloc[missing]
+            durations = subset['duration_s'].to_numpy()
+            crossings = _segment_reduce(ts, force, subset, lambda w: np.count_nonzero(
+                (w[:-1] <= w.mean()) & (w[1:] > w.mean())))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                rate[missing] = crossings * 60.0 / durations
+        features['resp_rate_bpm'] = rate
+
+    eda = streams.get(EDA_STREAM)
+    if eda is not None and len(eda):
+        ts = eda[TIME_FIELD].to_numpy(dtype='f8')
+        values = _column(eda, EDA_STREAM)
+        moments = segment_moments(ts, values, segments)
+        features['eda_mean'] = moments['mean']
+        features['eda_std'] = moments['std']
+        features['eda_slope'] = moments['slope']
+        features['eda_min'] = _segment_reduce(ts, values, segments, np.min)
+        features['eda_max'] = _segment_reduce(ts, values, segments, np.max)
+    return features
+
+
+def _single_cardiac_stream(streams: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    """Use a subject's only PolarHub strap ('cardiac_<LABEL>') as 'cardiac'; ValueError for several straps."""
+    straps = sorted(name for name in streams if name.startswith('cardiac_'))
+    if not straps:
+        return streams
+    if len(straps) > 1 or 'cardiac' in streams:
+        labels = [name[len('cardiac_'):] for name in straps] + (['(single strap)'] if 'cardiac' in streams else [])
+        raise ValueError(f"Subject has several Polar straps ({', '.join(labels)}); "
+                         f"HR features need one strap per subject")
+    streams = dict(streams)
+    streams['cardiac'] = streams.pop(straps[0])
+    return streams
+
+
+def extract_subject_features(subject_dir: str, root: str = DEFAULT_SUBJECT_DATA_DIR) -> pd.DataFrame:
+    """Feature rows (KEY_COLUMNS + SEGMENT_COLUMNS + FEATURE_COLUMNS) of one subject directory."""
+    streams, table = collect_subject_streams(subject_dir)
+    streams = _single_cardiac_stream(streams)
+    segments = marker_segments(streams, table)
+    features = compute_segment_features(streams, segments)
+
+    experiment, trial, subject = subject_key(subject_dir, root).split('/')[-3:]
+    keys = pd.DataFrame({'experiment': experiment, 'trial': trial, 'subject': subject}, index=segments.index)
+    return pd.concat([keys, segments[SEGMENT_COLUMNS], features], axis=1)
+
+
+def _row_keys(table: pd.DataFrame) -> pd.Series:
+    return table['experiment'].astype(str) + '/' + table['trial'].astype(str) + '/' + table['subject'].astype(str)
+
+
+def features_path(root: str) -> str:
+    return os.path.join(root, FEATURES_BASENAME + ('.parquet' if PARQUET_AVAILABLE else '.csv'))
+
+
+def load_features(path: str) -> pd.DataFrame:
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=KEY_COLUMNS + SEGMENT_COLUMNS + FEATURE_COLUMNS)
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, keep_default_na=False, na_values=[''])
+
+
+def _load_manifest(root: str) -> Dict[str, str]:
+    try:
+        with open(os.path.join(root, MANIFEST_FILENAME), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest.get('subjects', {}) if manifest.get('version') == MANIFEST_VERSION else {}
+
+
+def _save_manifest(root: str, subjects: Dict[str, str]) -> None:
+    path = os.path.join(root, MANIFEST_FILENAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'version': MANIFEST_VERSION, 'subjects': subjects}, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def extract_features(root: str = DEFAULT_SUBJECT_DATA_DIR, experiment: Optional[str] = None,
+                     workers: Optional[int] = None, force: bool = False) -> dict:
+    """
+    Update the feature table of all subjects under root.
+
+    Args:
+        root (str): Subject data directory.
+        experiment (str): Only (re)process subjects of this experiment; rows of others are kept.
+        workers (int): Process pool size (default: CPU count, at most one per subject).
+        force (bool): Recompute subjects whose inputs are unchanged.
+
+    Returns:
+        dict: {output, subjects, computed: [...], skipped: [...], errors: {subject: message}, rows, seconds}
+    """
+    start_time = time.perf_counter()
+    output = features_path(root)
+    previous = load_features(output)
+    manifest = _load_manifest(root) if not force else {}
+    previous_keys = _row_keys(previous)
+    known = set(previous_keys)
+
+    subject_dirs = {subject_key(path, root): path for path in find_subject_dirs(root, experiment)}
+    fingerprints = {key: input_fingerprint(path) for key, path in subject_dirs.items()}
+    todo = [key for key in subject_dirs if manifest.get(key) != fingerprints[key] or key not in known]
+    skipped = [key for key in subject_dirs if key not in todo]
+
+    pool_size = max(1, min(workers or os.cpu_count() or 1, len(todo) or 1))
+    jobs = {key: partial(extract_subject_features, subject_dirs[key], root) for key in todo}
+    # spawn: workers start from a clean interpreter that imports only this module, never a
+    # fork of a caller holding threads or open HDF5 files (e.g. the Flask app)
+    results = convert_in_parallel(jobs, max_workers=pool_size, use_processes=True,
+                                  mp_context=multiprocessing.get_context('spawn'))
+
+    computed, errors, frames = [], {}, []
+    for key, result in results.items():
+        if isinstance(result, Exception):
+            errors[key] = str(result)
+            print(f"✗ Feature extraction failed for {key}: {result}")
+            continue
+        computed.append(key)
+        frames.append(result)
+
+    # Keep rows of subjects not reprocessed (unchanged, failed, or outside the experiment filter)
+    if len(previous):
+        in_scope = {key for key in known if experiment is None or key.split('/')[0] == experiment}
+        removed = in_scope - set(subject_dirs)
+        frames.insert(0, previous[~previous_keys.isin(set(computed) | removed)])
+    table = pd.concat(frames, ignore_index=True) if frames else previous
+    table = table.sort_values(KEY_COLUMNS + ['segment'], kind='stable').reset_index(drop=True)
+
+    if PARQUET_AVAILABLE:
+        write_frame_to_parquet(table, output)
+    else:
+        table.to_csv(output, index=False)
+    kept = {key: value for key, value in _load_manifest(root).items() if key not in subject_dirs}
+    kept.update({key: fingerprints[key] for key in computed + skipped})
+    _save_manifest(root, kept)
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Features: {len(computed)} subjects computed, {len(skipped)} unchanged, {len(errors)} failed "
+          f"({len(table)} rows) in {elapsed:.1f} s with {pool_size} workers -> {output}")
+    return {'output': output, 'subjects': len(subject_dirs), 'computed': computed, 'skipped': skipped,
+            'errors': errors, 'rows': len(table), 'seconds': elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-marker-segment physiological features for all subjects.")
+    parser.add_argument('--root', default=DEFAULT_SUBJECT_DATA_DIR, help="Subject data directory")
+    parser.add_argument('--experiment', default=None, help="Only process this experiment")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--force', action='store_true', help="Recompute subjects with unchanged inputs")
+    parser.add_argument('--result-json', default=None, help="Write the result summary to this JSON file")
+    args = parser.parse_args()
+    result = extract_features(args.root, args.experiment, args.workers, args.force)
+    write_result_json(args.result_json, result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,431 @@
+"""
+HDF5Appender Module
+
+Buffered, thread-safe row appender shared by the streaming managers
+(EventManager, PolarManager, VernierManager).
+
+Rows are staged in a preallocated structured NumPy buffer and written to the
+extendable HDF5 dataset in blocks. The on-disk capacity grows geometrically so
+the dataset is resized O(log n) times instead of once per row; close() trims
+the dataset back to the number of rows actually written.
+
+FLUSH POLICY:
+    - flush_rows:     flush as soon as this many rows are pending
+    - flush_interval: flush at least every N seconds (background thread)
+    Either may be None to disable that trigger. With background=False the
+    row trigger flushes inline on the appending thread.
+
+ON-DISK INVARIANT:
+    dataset.attrs['rows_written'] always holds the number of valid rows.
+    While the file is open (or after a crash) dataset.shape[0] may be larger;
+    readers must slice [:rows_written] (or call valid_rows(), which also covers
+    SWMR datasets, see below).
+
+DATASET LAYOUT:
+    create_stream_dataset() builds the extendable dataset from a per-stream layout
+    dict (see DEFAULT_LAYOUT): chunk_rows (None = h5py auto-chunking), compression
+    ('gzip', 'lzf' or None), compression_opts (gzip level) and shuffle. The layout
+    is recorded in the dataset's 'layout' attribute.
+    benchmarks/hdf5_layout_benchmark.py compares layouts on synthetic sessions.
+
+LIVE READS (SWMR):
+    open_stream_file(filename, swmr=True) opens the file with libver='latest'. Once the
+    datasets exist the caller sets h5_file.swmr_mode = True and readers can open the file
+    with LiveReader while it is written. An appender created with swmr=True sizes the
+    dataset exactly on every flush (no preallocation) and flushes it to disk, so
+    dataset.shape[0] is the valid row count; valid_rows() uses it for datasets marked
+    with the 'swmr' attribute. New groups/datasets (e.g. markers) cannot be added in
+    SWMR mode, so close_stream_file() reopens the file normally to run finalize steps.
+
+RECENT HISTORY:
+    With history_rows > 0 the appender also keeps the newest history_rows rows in an
+    in-memory ring buffer; recent(seconds) returns those of the last `seconds` up to now
+    without touching the file (used by the live tail endpoint, see Decimation). A stream
+    that stopped delivering rows therefore yields an empty window, not stale rows.
+
+SCHEMA VERSIONS:
+    1: session metadata (METADATA_FIELDS) repeated as vlen-string columns in every row
+    2: session metadata stored once as dataset attributes; rows hold no metadata
+    A version 1 file reopened in 'a' mode keeps its dtype; the managers pass their rows
+    through legacy_row() so the columns rows no longer carry are still filled.
+"""
+import json
+import threading
+from datetime import datetime
+from typing import Callable, Optional
+
+import h5py
+import numpy as np
+
+import TimestampManager as tm
+
+DEFAULT_FLUSH_ROWS = 256
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_INITIAL_CAPACITY = 1024
+DEFAULT_GROWTH_FACTOR = 2.0
+DEFAULT_HISTORY_ROWS = 0
+
+DEFAULT_LAYOUT = {
+    "chunk_rows": 4096,
+    "compression": "gzip",
+    "compression_opts": 4,
+    "shuffle": True,
+}
+
+SCHEMA_VERSION = 2
+METADATA_FIELDS = ('experiment_name', 'trial_name', 'subject_id', 'experimenter_name')
+
+
+def valid_rows(dataset) -> int:
+    """Number of valid rows in a dataset written by HDF5Appender (or a legacy dataset)."""
+    if dataset.attrs.get('swmr', False):
+        return int(dataset.shape[0])
+    return int(dataset.attrs.get('rows_written', dataset.shape[0]))
+
+
+def open_stream_file(filename: str, swmr: bool = False):
+    """
+    Open (or create) a stream file for appending.
+
+    Args:
+        filename (str): HDF5 file path.
+        swmr (bool): Use the latest file format so SWMR mode can be enabled once the
+            datasets are created (h5_file.swmr_mode = True).
+    """
+    if swmr:
+        return h5py.File(filename, 'a', libver='latest')
+    return h5py.File(filename, 'a')
+
+
+def close_stream_file(h5_file, finalize: Optional[Callable] = None) -> None:
+    """
+    Flush and close a stream file, running finalize(h5_file) before it is closed.
+
+    Objects cannot be created while a file is in SWMR mode, so for SWMR files the
+    file is closed first and finalize runs on a normal reopen.
+    """
+    if not h5_file.swmr_mode:
+        if finalize is not None:
+            finalize(h5_file)
+        h5_file.flush()
+        h5_file.close()
+        return
+
+    filename = h5_file.filename
+    h5_file.flush()
+    h5_file.close()
+    if finalize is not None:
+        with h5py.File(filename, 'a') as reopened:
+            finalize(reopened)
+
+
+def create_stream_dataset(parent, name: str, dtype: np.dtype, layout: Optional[dict] = None):
+    """
+    Create an empty, extendable 1-D dataset using a chunk/filter layout.
+
+    Args:
+        parent (h5py.File | h5py.Group): Where to create the dataset.
+        name (str): Dataset name.
+        dtype (np.dtype): Row dtype.
+        layout (dict): Overrides for DEFAULT_LAYOUT.
+
+    Returns:
+        h5py.Dataset: The new dataset.
+    """
+    layout = {**DEFAULT_LAYOUT, **(layout or {})}
+    if layout["compression"] not in (None, "gzip", "lzf"):
+        raise ValueError("compression must be 'gzip', 'lzf' or None")
+
+    kwargs = {"chunks": (layout["chunk_rows"],) if layout["chunk_rows"] else True}
+    if layout["compression"]:
+        kwargs["compression"] = layout["compression"]
+        if layout["compression"] == "gzip" and layout["compression_opts"] is not None:
+            kwargs["compression_opts"] = layout["compression_opts"]
+    if layout["shuffle"]:
+        kwargs["shuffle"] = True
+
+    dataset = parent.create_dataset(name, shape=(0,), maxshape=(None,), dtype=dtype, **kwargs)
+    dataset.attrs['layout'] = json.dumps(layout)
+    return dataset
+
+
+def write_metadata_attrs(dataset, metadata: dict) -> None:
+    """Store session-constant metadata as dataset attributes (schema version 2)."""
+    if dataset.file.swmr_mode:
+        raise RuntimeError("Attributes cannot be written while the file is in SWMR mode; write them at close.")
+    dataset.attrs['schema_version'] = SCHEMA_VERSION
+    for field in METADATA_FIELDS:
+        dataset.attrs[field] = metadata.get(field) or ''
+
+
+def is_schema_v1(dataset) -> bool:
+    """True for a (version 1) dataset that carries the metadata columns in every row."""
+    return dataset is not None and METADATA_FIELDS[0] in dataset.dtype.names
+
+
+def legacy_row(row: dict, metadata: dict, iso_field: str, local_iso: bool = False,
+               extra: Optional[dict] = None) -> dict:
+    """
+    Copy of a row with the schema version 1 columns filled in, for a version 1 dataset
+    reopened in 'a' mode (fields the dataset does not have are ignored by append).
+
+    Args:
+        row (dict): Row with 'timestamp_unix'.
+        metadata (dict): Values of METADATA_FIELDS.
+        iso_field (str): Name of the file's ISO timestamp column.
+        local_iso (bool): Format it as local naive time, as version 1 Polar/Vernier files
+            did, instead of UTC with a 'Z' suffix.
+        extra (dict): Other removed columns (e.g. event_marker/condition).
+    """
+    filled = {**row, **{field: metadata.get(field) or '' for field in METADATA_FIELDS}, **(extra or {})}
+    timestamp = row['timestamp_unix']
+    filled[iso_field] = (datetime.fromtimestamp(timestamp).isoformat() if local_iso
+                         else str(tm.format_iso_array([timestamp])[0]))
+    return filled
+
+
+def expand_metadata_columns(df, attrs):
+    """
+    Re-insert the metadata columns at the front of an exported frame from dataset attributes.
+    No-op for schema version 1 files, which already carry the columns.
+    """
+    for position, field in enumerate(METADATA_FIELDS):
+        if field not in df.columns:
+            value = attrs.get(field, '')
+            if isinstance(value, bytes):
+                value = value.decode('utf-8')
+            df.insert(position, field, value)
+    return df
+
+
+class HDF5Appender:
+    def __init__(self, dataset,
+                 flush_rows: Optional[int] = DEFAULT_FLUSH_ROWS,
+                 flush_interval: Optional[float] = DEFAULT_FLUSH_INTERVAL,
+                 initial_capacity: int = DEFAULT_INITIAL_CAPACITY,
+                 growth_factor: float = DEFAULT_GROWTH_FACTOR,
+                 background: bool = True,
+                 swmr: bool = False,
+                 history_rows: int = DEFAULT_HISTORY_ROWS):
+        """
+        Args:
+            dataset (h5py.Dataset): 1-D structured dataset created with maxshape=(None,).
+            flush_rows (int): Pending-row count that triggers a flush.
+            flush_interval (float): Maximum seconds between flushes.
+            initial_capacity (int): Rows to reserve on disk up front.
+            growth_factor (float): Multiplier applied when the on-disk capacity is exhausted.
+            background (bool): Run flushes on a dedicated thread.
+            swmr (bool): Keep the dataset readable by SWMR readers: size it exactly on every
+                flush and flush it to disk. Must be created before swmr_mode is enabled.
+            history_rows (int): Size of the in-memory ring of recent rows (0 disables it).
+        """
+        if growth_factor <= 1.0:
+            raise ValueError("growth_factor must be greater than 1.0")
+
+        self._dataset = dataset
+        self.dtype = dataset.dtype
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.growth_factor = growth_factor
+        self.swmr = swmr
+
+        self._defaults = {
+            name: ('' if self.dtype[name].kind == 'O' else
+                   np.nan if self.dtype[name].kind == 'f' else 0)
+            for name in self.dtype.names
+        }
+
+        buffer_rows = max(flush_rows or DEFAULT_FLUSH_ROWS, 1)
+        self._buffer = np.zeros(buffer_rows, dtype=self.dtype)
+        self._spare = np.zeros(buffer_rows, dtype=self.dtype)
+        self._pending = 0
+
+        self._history = np.zeros(history_rows, dtype=self.dtype) if history_rows > 0 else None
+        self._history_total = 0    # rows ever pushed; the newest is at (total - 1) % len
+
+        self._rows_written = valid_rows(dataset)
+        if swmr:
+            # Readers take shape[0] as the row count, so never leave unwritten rows on disk
+            dataset.resize(self._rows_written, axis=0)
+            dataset.attrs['swmr'] = True
+        elif dataset.shape[0] < self._rows_written + initial_capacity:
+            dataset.resize(self._rows_written + initial_capacity, axis=0)
+        dataset.attrs['rows_written'] = self._rows_written
+
+        self._lock = threading.Lock()          # guards the staging buffer
+        self._write_lock = threading.Lock()    # serialises writes to the dataset
+        self._flush_requested = threading.Event()
+        self._closed = False
+        self._thread = None
+
+        if background:
+            self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self._thread.start()
+
+    # Properties #####################################################
+    @property
+    def rows_written(self) -> int:
+        """Rows already flushed to the dataset."""
+        return self._rows_written
+
+    @property
+    def n_rows(self) -> int:
+        """Rows flushed plus rows still pending in memory."""
+        return self._rows_written + self._pending
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    ##################################################################
+    # Methods ########################################################
+    def append(self, row: dict) -> None:
+        """Stage a single row given as {field: value}. Missing/None fields get NaN or ''."""
+        with self._lock:
+            # Checked under the lock: a row staged here is always covered by close()'s final flush
+            if self._closed:
+                raise RuntimeError("Cannot append to a closed HDF5Appender.")
+            if self._pending == len(self._buffer):
+                self._grow_buffer(self._pending + 1)
+
+            i = self._pending
+            for name, default in self._defaults.items():
+                value = row.get(name)
+                self._buffer[name][i] = default if value is None else value
+            self._pending += 1
+            pending = self._pending
+            if self._history is not None:
+                self._push_history(self._buffer[i:i + 1])
+
+        self._maybe_flush(pending)
+
+    def append_rows(self, rows: np.ndarray) -> None:
+        """Stage a block of rows given as a structured array with this dataset's dtype."""
+        n = len(rows)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Cannot append to a closed HDF5Appender.")
+            if n == 0:
+                return
+            if self._pending + n > len(self._buffer):
+                self._grow_buffer(self._pending + n)
+            self._buffer[self._pending:self._pending + n] = rows
+            self._pending += n
+            pending = self._pending
+            if self._history is not None:
+                self._push_history(rows)
+
+        self._maybe_flush(pending)
+
+    def flush(self) -> int:
+        """Write all pending rows to the dataset. Returns the number of rows written."""
+        with self._write_lock:
+            with self._lock:
+                n = self._pending
+                if n == 0:
+                    return 0
+                block = self._buffer
+                self._buffer, self._spare = self._spare, block
+                self._pending = 0
+
+            start = self._rows_written
+            end = start + n
+            if self.swmr:
+                self._dataset.resize(end, axis=0)
+            elif end > self._dataset.shape[0]:
+                capacity = max(end, int(self._dataset.shape[0] * self.growth_factor))
+                self._dataset.resize(capacity, axis=0)
+
+            self._dataset[start:end] = block[:n]
+            self._rows_written = end
+            if self.swmr:
+                self._dataset.file.flush()
+            else:
+                self._dataset.attrs['rows_written'] = end
+            return n
+
+    def recent(self, seconds: Optional[float] = None, time_field: str = 'timestamp_unix') -> np.ndarray:
+        """
+        Copy of the rows in the history ring, oldest first.
+
+        Args:
+            seconds (float): Only rows within this many seconds of the current time (None = all).
+            time_field (str): Timestamp field (unix seconds) used for the window.
+        """
+        if self._history is None:
+            raise RuntimeError("History is disabled (history_rows=0).")
+
+        with self._lock:
+            size = len(self._history)
+            count = min(self._history_total, size)
+            start = (self._history_total - count) % size
+            if count < size:
+                rows = self._history[:count].copy()
+            else:
+                rows = np.concatenate((self._history[start:], self._history[:start]))
+
+        if seconds is not None and len(rows):
+            cutoff = tm.get_timestamp_ns() * 1e-9 - seconds
+            rows = rows[np.searchsorted(rows[time_field], cutoff, side='left'):]
+        return rows
+
+    def rebind(self, dataset) -> None:
+        """Continue writing to dataset (the same dataset after its file was reopened)."""
+        with self._write_lock:
+            self._dataset = dataset
+
+    def close(self) -> None:
+        """Stop the flush thread, write remaining rows and trim the dataset to its valid length."""
+        with self._lock:
+            if self._closed:
+                return
+            # Later appends raise instead of staging rows the final flush would miss
+            self._closed = True
+        self._flush_requested.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=5.0)
+            if self._thread.is_alive():
+                print("WARNING: HDF5 flush thread did not stop cleanly within timeout!")
+        self._thread = None
+
+        self.flush()
+        with self._write_lock:
+            if self._dataset.shape[0] != self._rows_written:
+                self._dataset.resize(self._rows_written, axis=0)
+
+    def _maybe_flush(self, pending: int) -> None:
+        if self.flush_rows is None or pending < self.flush_rows:
+            return
+        if self._thread is not None:
+            self._flush_requested.set()
+        else:
+            self.flush()
+
+    def _push_history(self, rows: np.ndarray) -> None:
+        """Copy rows into the history ring. Caller must hold self._lock."""
+        size = len(self._history)
+        n = len(rows)
+        if n > size:
+            self._history_total += n - size
+            rows = rows[-size:]
+            n = size
+        self._history[(self._history_total + np.arange(n)) % size] = rows
+        self._history_total += n
+
+    def _grow_buffer(self, min_rows: int) -> None:
+        """Grow the in-memory staging buffer. Caller must hold self._lock."""
+        new_rows = max(min_rows, int(len(self._buffer) * self.growth_factor))
+        grown = np.zeros(new_rows, dtype=self.dtype)
+        grown[:self._pending] = self._buffer[:self._pending]
+        self._buffer = grown
+
+    def _flush_loop(self) -> None:
+        while not self._closed:
+            self._flush_requested.wait(timeout=self.flush_interval)
+            self._flush_requested.clear()
+            if self._closed:
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing HDF5 buffer: {e}")
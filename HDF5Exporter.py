@@ -0,0 +1,252 @@
+"""
+HDF5Exporter Module
+
+Shared HDF5 -> CSV / Parquet export used by the streaming managers (EventManager,
+PolarManager, VernierManager) and /api/convert-hdf5-to-csv.
+
+EXPORT PIPELINE (per chunk of chunk_rows rows, default DEFAULT_EXPORT_CHUNK_ROWS):
+    - read one slice of the structured 'data' dataset (valid rows only)
+    - decode string columns by decoding each distinct value once and indexing back
+      (marker/condition/metadata columns have very few distinct values)
+    - add the ISO timestamp column, metadata columns (schema version 2 attrs) and
+      event_marker/condition from the file's 'markers' interval table (rebuilt from 'marker_log'
+      for a file that was not closed)
+    - append to a single open, buffered CSV file handle, or to a Parquet file in
+      time-windowed row groups (export_hdf5_to_parquet, see ParquetStore)
+
+PROGRESS:
+    Exports take an optional progress(label, rows_done, rows_total) callback, called
+    after every chunk. print_progress (the default) prints one line per chunk.
+
+PARALLEL CONVERSION:
+    convert_in_parallel() runs several exports concurrently. Threads are the default,
+    since the managers' bound hdf5_to_csv methods cannot be pickled; use_processes=True
+    runs picklable jobs (e.g. functools.partial(export_hdf5_to_csv, ...)) in a process pool.
+    Pass mp_context (e.g. multiprocessing.get_context('spawn')) when the caller has threads
+    or open HDF5 files that a forked worker must not inherit.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+import h5py
+import numpy as np
+import pandas as pd
+
+import TimestampManager as tm
+from HDF5Appender import valid_rows, expand_metadata_columns
+from MarkerTimeline import MarkerTable, attach_markers
+from ParquetStore import DEFAULT_ROW_GROUP_SECONDS, write_frames_to_parquet
+
+DEFAULT_EXPORT_CHUNK_ROWS = 65536
+CSV_BUFFER_BYTES = 1 << 20
+
+
+def print_progress(label: str, rows_done: int, rows_total: int) -> None:
+    """Default progress callback: one line per exported chunk."""
+    if rows_total > 0:
+        print(f"[{label}] {rows_done}/{rows_total} rows ({100.0 * rows_done / rows_total:.0f}%)")
+
+
+def decode_column(values: np.ndarray) -> np.ndarray:
+    """
+    Decode a string column read from HDF5 into an array of str.
+
+    vlen strings come back from h5py as an object array of bytes and fixed-length
+    strings as an 'S' array; numeric columns are returned unchanged.
+    """
+    if values.dtype.kind == 'S':
+        return np.char.decode(values, 'utf-8')
+    if values.dtype.kind != 'O' or len(values) == 0:
+        return values
+
+    try:
+        uniques, inverse = np.unique(values, return_inverse=True)
+    except TypeError:
+        # Mixed bytes/str objects cannot be sorted together
+        return np.array([v.decode('utf-8') if isinstance(v, bytes) else v for v in values], dtype=object)
+
+    decoded = np.array([u.decode('utf-8') if isinstance(u, bytes) else u for u in uniques], dtype=object)
+    return decoded[inverse.reshape(-1)]
+
+
+def structured_to_frame(data: np.ndarray) -> pd.DataFrame:
+    """Build a DataFrame from a structured array, decoding string columns."""
+    return pd.DataFrame({field: decode_column(data[field]) for field in data.dtype.names})
+
+
+def write_frames_to_csv(frames: Iterable[pd.DataFrame], csv_filename: str, rows_total: int,
+                        progress: Optional[Callable[[str, int, int], None]] = print_progress,
+                        label: str = None) -> int:
+    """
+    Write DataFrame chunks to one CSV file through a single buffered handle.
+
+    Returns:
+        int: Rows written.
+    """
+    label = label or os.path.basename(csv_filename)
+    rows_done = 0
+    with open(csv_filename, 'w', newline='', buffering=CSV_BUFFER_BYTES) as csv_file:
+        for frame in frames:
+            frame.to_csv(csv_file, index=False, header=(rows_done == 0))
+            rows_done += len(frame)
+            if progress:
+                progress(label, rows_done, rows_total)
+    return rows_done
+
+
+def write_frame_to_csv(df: pd.DataFrame, csv_filename: str,
+                       chunk_rows: int = DEFAULT_EXPORT_CHUNK_ROWS,
+                       progress: Optional[Callable[[str, int, int], None]] = print_progress,
+                       label: str = None) -> int:
+    """Write an in-memory DataFrame to CSV in chunks so progress can be reported."""
+    if df.empty:
+        df.to_csv(csv_filename, index=False)
+        return 0
+    chunks = (df.iloc[start:start + chunk_rows] for start in range(0, len(df), chunk_rows))
+    return write_frames_to_csv(chunks, csv_filename, len(df), progress, label)
+
+
+def stream_parent(h5_file, group: str = None):
+    """The File or Group holding a stream's 'data' dataset (group is set for SessionStore files)."""
+    if group is None:
+        return h5_file
+    if group not in h5_file:
+        raise KeyError(f"Stream group '{group}' not found in the file {h5_file.filename}.")
+    return h5_file[group]
+
+
+def _stream_frames(parent, iso_column: str, chunk_rows: int):
+    """
+    Open the 'data' dataset of a stream and return (n_rows, frame generator).
+    Each frame has decoded strings, the ISO column, metadata columns and markers attached.
+    """
+    if 'data' not in parent:
+        raise KeyError(f"Dataset 'data' not found in the file {parent.file.filename}.")
+
+    dataset = parent['data']
+    attrs = dict(dataset.attrs)
+    markers = MarkerTable.read_from_hdf5(parent)
+    n_rows = valid_rows(dataset)
+
+    def to_frame(chunk):
+        df = tm.add_iso_column(structured_to_frame(chunk), iso_column)
+        return attach_markers(expand_metadata_columns(df, attrs), markers)
+
+    def frames():
+        if n_rows == 0:
+            # Header-only output so downstream steps still find the file
+            yield to_frame(dataset[:0])
+        for start in range(0, n_rows, chunk_rows):
+            yield to_frame(dataset[start:min(start + chunk_rows, n_rows)])
+
+    return n_rows, frames()
+
+
+def export_hdf5_to_csv(hdf5_filename: str, csv_filename: str,
+                       iso_column: str = 'timestamp_iso',
+                       chunk_rows: int = DEFAULT_EXPORT_CHUNK_ROWS,
+                       progress: Optional[Callable[[str, int, int], None]] = print_progress,
+                       label: str = None, group: str = None) -> int:
+    """
+    Export the 'data' dataset of a stream file to CSV.
+
+    Args:
+        hdf5_filename (str): Stream file written by one of the managers.
+        csv_filename (str): CSV file to create (overwritten).
+        iso_column (str): Name of the generated ISO 8601 timestamp column.
+        chunk_rows (int): Rows read and written per chunk.
+        progress (callable): progress(label, rows_done, rows_total), or None.
+        label (str): Name used in progress reports (defaults to the HDF5 file name).
+        group (str): Stream group inside a SessionStore file (None for per-stream files).
+
+    Returns:
+        int: Rows written.
+
+    Raises:
+        FileNotFoundError: If the HDF5 file does not exist.
+        KeyError: If the file has no 'data' dataset.
+    """
+    if not os.path.exists(hdf5_filename):
+        raise FileNotFoundError(hdf5_filename)
+
+    with h5py.File(hdf5_filename, 'r') as h5_file:
+        n_rows, frames = _stream_frames(stream_parent(h5_file, group), iso_column, chunk_rows)
+        return write_frames_to_csv(frames, csv_filename, n_rows, progress,
+                                   label or os.path.basename(hdf5_filename))
+
+
+def export_hdf5_to_parquet(hdf5_filename: str, parquet_filename: str,
+                           iso_column: str = 'timestamp_iso',
+                           chunk_rows: int = DEFAULT_EXPORT_CHUNK_ROWS,
+                           progress: Optional[Callable[[str, int, int], None]] = print_progress,
+                           label: str = None,
+                           row_group_seconds: float = DEFAULT_ROW_GROUP_SECONDS,
+                           group: str = None) -> int:
+    """
+    Export the 'data' dataset of a stream file to Parquet (see ParquetStore).
+    Same columns as the CSV export except the ISO column, which the loader derives.
+
+    Returns:
+        int: Rows written.
+    """
+    if not os.path.exists(hdf5_filename):
+        raise FileNotFoundError(hdf5_filename)
+
+    with h5py.File(hdf5_filename, 'r') as h5_file:
+        n_rows, frames = _stream_frames(stream_parent(h5_file, group), iso_column, chunk_rows)
+        return write_frames_to_parquet(frames, parquet_filename, n_rows, progress,
+                                       label or os.path.basename(hdf5_filename),
+                                       row_group_seconds, drop_columns=[iso_column])
+
+
+def convert_in_parallel(jobs: Dict[str, Callable[[], object]], max_workers: int = None,
+                        use_processes: bool = False, mp_context=None) -> Dict[str, object]:
+    """
+    Run several conversion jobs concurrently.
+
+    Args:
+        jobs (dict): {label: zero-argument callable}. Must be picklable when use_processes is True.
+        max_workers (int): Pool size (defaults to one worker per job).
+        use_processes (bool): Use a process pool instead of threads.
+        mp_context: multiprocessing context of the process pool (default start method if None).
+
+    Returns:
+        dict: {label: job return value, or the exception it raised}.
+    """
+    if not jobs:
+        return {}
+
+    max_workers = max_workers or len(jobs)
+    if use_processes:
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context)
+    else:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+    results = {}
+    with executor:
+        futures = {label: executor.submit(job) for label, job in jobs.items()}
+        for label, future in futures.items():
+            try:
+                results[label] = future.result()
+            except Exception as e:
+                results[label] = e
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    from functools import partial
+
+    parser = argparse.ArgumentParser(description="Convert stream HDF5 files to CSV (next to each input).")
+    parser.add_argument("files", nargs="+", help="HDF5 files to convert")
+    parser.add_argument("--iso-column", default="timestamp_iso")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_EXPORT_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    results = convert_in_parallel({
+        path: partial(export_hdf5_to_csv, path, os.path.splitext(path)[0] + '.csv',
+                      args.iso_column, args.chunk_rows)
+        for path in args.files
+    }, use_processes=True)
+    for path, result in results.items():
+        print(f"{path}: {'ERROR ' + str(result) if isinstance(result, Exception) else f'{result} rows'}")
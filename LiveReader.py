@@ -0,0 +1,114 @@
+"""
+LiveReader Module
+
+Read-only access to stream files while a manager (or SessionStore) is still writing them.
+
+Writers open their files with HDF5Appender.open_stream_file(..., swmr=True) and switch
+the file to SWMR (single-writer/multiple-reader) mode once the datasets exist; readers
+open them with open_live_file(), which works for SWMR and finished files alike.
+
+TAIL READS:
+    tail_rows() returns the rows of the newest N seconds without reading the whole
+    dataset: it reads only the timestamp field of blocks taken from the end of the
+    dataset, doubling the block size until the block starts before the cut-off, then
+    locates the first row with searchsorted and reads just [start:n_rows].
+    Timestamps must be non-decreasing, which holds for every stream written by the
+    managers (rows are appended in acquisition order).
+"""
+from typing import Optional
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from HDF5Appender import valid_rows
+from HDF5Exporter import stream_parent, structured_to_frame
+
+DEFAULT_TAIL_BLOCK_ROWS = 1024
+TIME_FIELD = 'timestamp_unix'
+
+
+def open_live_file(filename: str):
+    """Open a stream file read-only in SWMR mode (also works for files not written in SWMR mode)."""
+    return h5py.File(filename, 'r', libver='latest', swmr=True)
+
+
+def tail_rows(dataset, seconds: float, time_field: str = TIME_FIELD,
+              block_rows: int = DEFAULT_TAIL_BLOCK_ROWS) -> np.ndarray:
+    """
+    Rows of a live dataset whose timestamp lies within `seconds` of the newest row.
+
+    Args:
+        dataset (h5py.Dataset): Structured stream dataset.
+        seconds (float): Window length, measured back from the newest timestamp.
+        time_field (str): Timestamp field (unix seconds, non-decreasing).
+        block_rows (int): First block size used to search backwards for the cut-off.
+
+    Returns:
+        np.ndarray: Structured array of the rows in the window (possibly empty).
+    """
+    _refresh(dataset)
+    n_rows = valid_rows(dataset)
+    if n_rows == 0:
+        return dataset[0:0]
+
+    timestamps = dataset.fields(time_field)
+    cutoff = timestamps[n_rows - 1] - seconds
+
+    start = n_rows
+    step = max(int(block_rows), 1)
+    while start > 0:
+        block_start = max(start - step, 0)
+        block = timestamps[block_start:start]
+        if block[0] < cutoff:
+            start = block_start + int(np.searchsorted(block, cutoff, side='left'))
+            break
+        start = block_start
+        step *= 2
+
+    return dataset[start:n_rows]
+
+
+def tail_stream(filename: str, seconds: float, group: Optional[str] = None,
+                block_rows: int = DEFAULT_TAIL_BLOCK_ROWS) -> pd.DataFrame:
+    """
+    Newest `seconds` of a stream file as a DataFrame (string columns decoded).
+
+    Args:
+        filename (str): Stream HDF5 file, possibly still being written.
+        seconds (float): Window length.
+        group (str): Stream group inside a SessionStore file (None for per-manager files).
+        block_rows (int): See tail_rows().
+    """
+    with open_live_file(filename) as h5_file:
+        data = tail_rows(stream_parent(h5_file, group)['data'], seconds, block_rows=block_rows)
+    return structured_to_frame(data)
+
+
+def stream_summary(filename: str, group: Optional[str] = None) -> dict:
+    """
+    Row count and newest row of a stream file, for status displays.
+
+    Returns:
+        dict: {'rows': int, 'latest': {field: value} or None}
+    """
+    with open_live_file(filename) as h5_file:
+        dataset = stream_parent(h5_file, group)['data']
+        _refresh(dataset)
+        n_rows = valid_rows(dataset)
+        if n_rows == 0:
+            return {'rows': 0, 'latest': None}
+        latest = structured_to_frame(dataset[n_rows - 1:n_rows])
+
+    return {'rows': n_rows, 'latest': frame_to_records(latest)[0]}
+
+
+def frame_to_records(df: pd.DataFrame) -> list:
+    """JSON-ready list of row dicts (NumPy scalars converted, NaN -> None)."""
+    return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+
+def _refresh(dataset) -> None:
+    """Pick up rows flushed by the writer since the file was opened."""
+    if dataset.file.swmr_mode:
+        dataset.refresh()
@@ -0,0 +1,315 @@
+"""
+MarkerTimeline Module
+
+Single source of truth for the event marker / condition in effect at any time.
+
+Instead of every stream copying the current marker string into each row it writes,
+/set_event_marker updates one MarkerTimeline shared by the event, Polar and Vernier
+managers. The timeline keeps a sparse interval table (one row per change):
+
+    start_unix (f8) | end_unix (f8, +inf while open) | marker_id (u4) | condition_id (u4)
+
+plus the label lists the ids index into. Each stream file receives a copy of the
+table under the 'markers' group when it is closed, clipped to the stream's time span
+(first row to close), and readers attach markers to sensor rows with a vectorized
+searchsorted join (MarkerTable.lookup), so every stream agrees exactly on marker boundaries.
+
+MARKER LOG:
+    While a sensor stream records, MarkerLog appends the state in effect when the stream
+    opened and then every change to 'marker_log/data' beside the stream's 'data':
+
+        start_unix (f8) | event_marker (S128) | condition (S128)
+
+    flushed row by row with the data. Labels are fixed-width UTF-8 (longer ones are cut),
+    so the log also works in SWMR files. A file that was never closed (crash) has no
+    'markers' group; MarkerTable.read_from_hdf5 rebuilds the table from the log instead.
+"""
+import threading
+from typing import Callable, List, Optional
+
+import h5py
+import numpy as np
+import TimestampManager as tm
+from HDF5Appender import valid_rows
+
+INTERVAL_DTYPE = np.dtype([
+    ('start_unix', 'f8'),
+    ('end_unix', 'f8'),
+    ('marker_id', 'u4'),
+    ('condition_id', 'u4'),
+])
+MARKERS_GROUP = 'markers'
+
+MARKER_LOG_GROUP = 'marker_log'
+MARKER_LABEL_BYTES = 128
+MARKER_LOG_DTYPE = np.dtype([
+    ('start_unix', 'f8'),
+    ('event_marker', f'S{MARKER_LABEL_BYTES}'),
+    ('condition', f'S{MARKER_LABEL_BYTES}'),
+])
+
+
+def _decode_label(label) -> str:
+    return label.decode('utf-8', errors='ignore') if isinstance(label, bytes) else label
+
+
+class MarkerTable:
+    """Immutable snapshot of the interval table with its label lists."""
+
+    def __init__(self, intervals: np.ndarray, marker_labels: List[str], condition_labels: List[str]):
+        self.intervals = intervals
+        self.marker_labels = np.asarray(marker_labels, dtype=object)
+        self.condition_labels = np.asarray(condition_labels, dtype=object)
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def lookup(self, timestamps) -> tuple:
+        """
+        Attach markers to sample timestamps.
+
+        Args:
+            timestamps: Array-like of Unix timestamps (seconds).
+
+        Returns:
+            (np.ndarray, np.ndarray): event_marker and condition label per timestamp.
+            Samples taken before the first interval get the first interval's labels.
+        """
+        timestamps = np.asarray(timestamps, dtype='f8')
+        if len(self.intervals) == 0:
+            empty = np.full(len(timestamps), '', dtype=object)
+            return empty, empty.copy()
+
+        idx = np.searchsorted(self.intervals['start_unix'], timestamps, side='right') - 1
+        np.clip(idx, 0, len(self.intervals) - 1, out=idx)
+        rows = self.intervals[idx]
+        return self.marker_labels[rows['marker_id']], self.condition_labels[rows['condition_id']]
+
+    def intervals_for(self, event_marker: str) -> np.ndarray:
+        """Return the (start_unix, end_unix) rows of every interval labelled event_marker."""
+        matches = np.flatnonzero(self.marker_labels == event_marker)
+        mask = np.isin(self.intervals['marker_id'], matches)
+        return self.intervals[mask][['start_unix', 'end_unix']]
+
+    def clip(self, start_unix: float, end_unix: float) -> 'MarkerTable':
+        """
+        Intervals overlapping [start_unix, end_unix], the first starting no earlier than
+        start_unix and the last ending no later than end_unix. Label lists are kept whole.
+        """
+        intervals = self.intervals
+        if len(intervals) == 0:
+            return self
+        keep = (intervals['end_unix'] > start_unix) & (intervals['start_unix'] <= end_unix)
+        if not keep.any():
+            # Span inside one zero-length gap: keep the interval in effect at start_unix
+            first = max(int(np.searchsorted(intervals['start_unix'], start_unix, side='right')) - 1, 0)
+            keep[first] = True
+        clipped = intervals[keep].copy()
+        clipped['start_unix'][0] = max(clipped['start_unix'][0], start_unix)
+        clipped['end_unix'][-1] = max(min(clipped['end_unix'][-1], end_unix), clipped['start_unix'][-1])
+        return MarkerTable(clipped, list(self.marker_labels), list(self.condition_labels))
+
+    @classmethod
+    def from_log(cls, rows: np.ndarray) -> 'MarkerTable':
+        """Interval table from non-empty MARKER_LOG_DTYPE rows; the last interval is open (end_unix = +inf)."""
+        marker_ids, condition_ids = {}, {}
+        intervals = np.zeros(len(rows), dtype=INTERVAL_DTYPE)
+        intervals['start_unix'] = np.maximum.accumulate(rows['start_unix'])
+        intervals['end_unix'][:-1] = intervals['start_unix'][1:]
+        intervals['end_unix'][-1] = np.inf
+        intervals['marker_id'] = [marker_ids.setdefault(_decode_label(label), len(marker_ids))
+                                  for label in rows['event_marker']]
+        intervals['condition_id'] = [condition_ids.setdefault(_decode_label(label), len(condition_ids))
+                                     for label in rows['condition']]
+        return cls(intervals, list(marker_ids), list(condition_ids))
+
+    def write_to_hdf5(self, parent) -> None:
+        """Write (or replace) the 'markers' group under an open h5py File/Group."""
+        if MARKERS_GROUP in parent:
+            del parent[MARKERS_GROUP]
+        group = parent.create_group(MARKERS_GROUP)
+        group.create_dataset('intervals', data=self.intervals)
+        string_dtype = h5py.string_dtype(encoding='utf-8')
+        group.create_dataset('marker_labels', data=list(self.marker_labels), dtype=string_dtype)
+        group.create_dataset('condition_labels', data=list(self.condition_labels), dtype=string_dtype)
+
+    @classmethod
+    def read_from_hdf5(cls, parent) -> Optional['MarkerTable']:
+        """
+        Load the 'markers' group written by write_to_hdf5. A stream that was not closed
+        cleanly has none; its table is rebuilt from 'marker_log' (None if it has neither).
+        """
+        if MARKERS_GROUP not in parent:
+            if MARKER_LOG_GROUP not in parent or 'data' not in parent[MARKER_LOG_GROUP]:
+                return None
+            log = parent[MARKER_LOG_GROUP]['data']
+            rows = log[:valid_rows(log)]
+            return cls.from_log(rows) if len(rows) else None
+        group = parent[MARKERS_GROUP]
+        return cls(
+            group['intervals'][:],
+            [_decode_label(label) for label in group['marker_labels'][:]],
+            [_decode_label(label) for label in group['condition_labels'][:]],
+        )
+
+
+def marker_log_row(timestamp: float, event_marker: str, condition: str) -> dict:
+    """One MARKER_LOG_DTYPE row; labels are UTF-8 encoded and cut to MARKER_LABEL_BYTES."""
+    return {
+        'start_unix': timestamp,
+        'event_marker': event_marker.encode('utf-8')[:MARKER_LABEL_BYTES],
+        'condition': condition.encode('utf-8')[:MARKER_LABEL_BYTES],
+    }
+
+
+def attach_markers(df, table: Optional[MarkerTable]):
+    """
+    Add event_marker/condition columns to an exported frame by joining on timestamp_unix.
+    Frames that already carry the columns (files written before the interval table) are left as-is.
+    """
+    if 'event_marker' in df.columns or 'timestamp_unix' not in df.columns:
+        return df
+    if table is None:
+        df['event_marker'] = ''
+        df['condition'] = ''
+        return df
+
+    markers, conditions = table.lookup(df['timestamp_unix'].to_numpy())
+    df['event_marker'] = markers
+    df['condition'] = conditions
+    return df
+
+
+class MarkerTimeline:
+    def __init__(self, event_marker: str = 'startup', condition: str = 'None'):
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[float, str, str], None]] = []
+        self._marker_ids = {}
+        self._condition_ids = {}
+        self._starts = []
+        self._marker_idx = []
+        self._condition_idx = []
+
+        self._event_marker = event_marker
+        self._condition = condition
+        self._open_interval(tm.get_timestamp_ns() * 1e-9)
+
+    # Property getters ###############################################
+    @property
+    def event_marker(self) -> str:
+        return self._event_marker
+
+    @property
+    def condition(self) -> str:
+        return self._condition
+
+    ##################################################################
+    # Methods ########################################################
+    def set_marker(self, event_marker: str, timestamp: float = None) -> None:
+        """Start a new interval with event_marker (no-op if it is already current)."""
+        if not isinstance(event_marker, str):
+            raise ValueError("Event marker must be a string.")
+        with self._lock:
+            if event_marker == self._event_marker:
+                return
+            self._event_marker = event_marker
+            self._change(timestamp)
+
+    def set_condition(self, condition: str, timestamp: float = None) -> None:
+        """Start a new interval with condition (no-op if it is already current)."""
+        if not isinstance(condition, str):
+            raise ValueError("Condition must be a string.")
+        with self._lock:
+            if condition == self._condition:
+                return
+            self._condition = condition
+            self._change(timestamp)
+
+    def add_listener(self, callback: Callable[[float, str, str], None], replay: bool = False) -> None:
+        """
+        Register callback(timestamp_unix, event_marker, condition), invoked on every change.
+        With replay=True it is first called once with the current state (timestamped now).
+        """
+        with self._lock:
+            self._listeners.append(callback)
+            if replay:
+                callback(tm.get_timestamp_ns() * 1e-9, self._event_marker, self._condition)
+
+    def remove_listener(self, callback) -> None:
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def snapshot(self) -> MarkerTable:
+        """Copy the interval table; the last interval is open (end_unix = +inf)."""
+        with self._lock:
+            n = len(self._starts)
+            intervals = np.zeros(n, dtype=INTERVAL_DTYPE)
+            intervals['start_unix'] = self._starts
+            intervals['end_unix'][:-1] = intervals['start_unix'][1:]
+            intervals['end_unix'][-1] = np.inf
+            intervals['marker_id'] = self._marker_idx
+            intervals['condition_id'] = self._condition_idx
+            return MarkerTable(intervals, list(self._marker_ids), list(self._condition_ids))
+
+    def write_to_hdf5(self, parent, time_field: str = 'timestamp_unix') -> None:
+        """
+        Persist the interval table under parent['markers'], clipped to the span of
+        parent['data'] (first row to now); unclipped when the stream has no rows.
+        """
+        table = self.snapshot()
+        if 'data' in parent:
+            dataset = parent['data']
+            n_rows = valid_rows(dataset)
+            if n_rows and time_field in (dataset.dtype.names or ()):
+                first = float(dataset[0][time_field])
+                table = table.clip(first, max(tm.get_timestamp_ns() * 1e-9, first))
+        table.write_to_hdf5(parent)
+
+    def _change(self, timestamp: Optional[float]) -> None:
+        """Caller must hold self._lock."""
+        if timestamp is None:
+            timestamp = tm.get_timestamp_ns() * 1e-9
+        # Listeners get the stored start, so transitions rows and logs match the table
+        timestamp = self._open_interval(timestamp)
+        for callback in self._listeners:
+            try:
+                callback(timestamp, self._event_marker, self._condition)
+            except Exception as e:
+                print(f"Error in marker timeline listener: {e}")
+
+    def _open_interval(self, timestamp: float) -> float:
+        """Append an interval for the current marker/condition; returns its stored start."""
+        marker_id = self._marker_ids.setdefault(self._event_marker, len(self._marker_ids))
+        condition_id = self._condition_ids.setdefault(self._condition, len(self._condition_ids))
+
+        # Out-of-order timestamps would break the searchsorted join
+        if self._starts and timestamp < self._starts[-1]:
+            timestamp = self._starts[-1]
+        self._starts.append(timestamp)
+        self._marker_idx.append(marker_id)
+        self._condition_idx.append(condition_id)
+        return timestamp
+
+
+class MarkerLog:
+    """Appends the changes of a MarkerTimeline to a stream's marker_log dataset as they happen."""
+
+    def __init__(self, timeline: MarkerTimeline, appender):
+        """
+        Args:
+            timeline (MarkerTimeline): Timeline to follow.
+            appender: HDF5Appender (or SessionStore StreamWriter) of a MARKER_LOG_DTYPE dataset.
+                Closed by close().
+        """
+        self.timeline = timeline
+        self.appender = appender
+        timeline.add_listener(self._on_change, replay=True)
+
+    def close(self) -> None:
+        """Stop following the timeline and close the appender (flushing the last rows)."""
+        self.timeline.remove_listener(self._on_change)
+        self.appender.close()
+
+    def _on_change(self, timestamp: float, event_marker: str, condition: str) -> None:
+        self.appender.append(marker_log_row(timestamp, event_marker, condition))
@@ -0,0 +1,218 @@
+"""
+ParquetStore Module
+
+Parquet export and loading for session data, written next to the CSV exports.
+
+FILE LAYOUT:
+    - typed columns: numeric columns keep their HDF5 dtypes (f8 timestamps, f4 sensor values)
+    - string columns (metadata, event_marker, condition, labels) are dictionary-encoded
+      and load back as pandas categoricals
+    - stream files do not store the ISO timestamp column; it is derived from
+      timestamp_unix on load (load_frame(iso_column=...)), as for the HDF5 files
+    - rows are sorted by timestamp_unix and split into row groups covering
+      row_group_seconds (default DEFAULT_ROW_GROUP_SECONDS) each, so time-range
+      filters skip whole row groups using the column statistics
+
+LOADING:
+    load_frame(path, start_unix=, end_unix=, event_markers=, columns=) pushes the
+    timestamp_unix range and event_marker set down to the Parquet reader.
+
+pyarrow is optional: PARQUET_AVAILABLE is False when it is not installed and the
+export/load functions raise ImportError.
+"""
+import os
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import TimestampManager as tm
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    pa = None
+    pq = None
+    PARQUET_AVAILABLE = False
+
+DEFAULT_ROW_GROUP_SECONDS = 300.0
+PARQUET_COMPRESSION = 'zstd'
+
+
+def _require_pyarrow() -> None:
+    if not PARQUET_AVAILABLE:
+        raise ImportError("pyarrow is required for Parquet export (pip install pyarrow).")
+
+
+def parquet_path_for(csv_path: str) -> str:
+    """The Parquet file that sits next to a CSV export."""
+    return os.path.splitext(csv_path)[0] + '.parquet'
+
+
+def frame_to_table(df: pd.DataFrame, schema=None, drop_columns: Iterable[str] = ()):
+    """
+    Convert a DataFrame to an Arrow table with dictionary-encoded string columns.
+
+    Args:
+        df (pd.DataFrame): Frame to convert.
+        schema (pa.Schema): Schema to cast to (keeps chunks of one file consistent).
+        drop_columns: Columns left out of the table (e.g. derived ISO timestamps).
+
+    Returns:
+        pa.Table
+    """
+    _require_pyarrow()
+    df = df.drop(columns=[c for c in drop_columns if c in df.columns])
+
+    arrays, fields = [], []
+    for name in df.columns:
+        column = df[name]
+        if column.dtype == object or isinstance(column.dtype, pd.CategoricalDtype):
+            values = column.astype(object).where(column.notna(), None)
+            array = pa.array(values, type=pa.string()).dictionary_encode()
+            array = array.cast(pa.dictionary(pa.int32(), pa.string()))
+        else:
+            array = pa.array(column.to_numpy(), from_pandas=True)
+        arrays.append(array)
+        fields.append(pa.field(str(name), array.type))
+
+    table = pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+    return table.cast(schema) if schema is not None else table
+
+
+def write_frames_to_parquet(frames: Iterable[pd.DataFrame], parquet_filename: str, rows_total: int = None,
+                            progress: Optional[Callable[[str, int, int], None]] = None,
+                            label: str = None,
+                            row_group_seconds: float = DEFAULT_ROW_GROUP_SECONDS,
+                            drop_columns: Iterable[str] = ()) -> int:
+    """
+    Write time-ordered DataFrame chunks to one Parquet file.
+
+    Rows are buffered until a row_group_seconds window of timestamp_unix is complete,
+    so row-group boundaries fall on window boundaries regardless of chunk size.
+    Frames without timestamp_unix are written one row group per frame.
+
+    Returns:
+        int: Rows written.
+    """
+    _require_pyarrow()
+    label = label or os.path.basename(parquet_filename)
+    drop_columns = list(drop_columns)
+    writer = None
+    rows_done = 0
+    pending = None
+
+    def write(df):
+        nonlocal writer, rows_done
+        if writer is None:
+            # The first frame fixes the schema, even if it has no rows
+            table = frame_to_table(df, drop_columns=drop_columns)
+            writer = pq.ParquetWriter(parquet_filename, table.schema, compression=PARQUET_COMPRESSION)
+        elif df.empty:
+            return
+        else:
+            table = frame_to_table(df, writer.schema, drop_columns)
+        if len(table) == 0:
+            return
+        writer.write_table(table, row_group_size=len(table))
+        rows_done += len(table)
+        if progress:
+            progress(label, rows_done, rows_total or rows_done)
+
+    try:
+        for frame in frames:
+            if 'timestamp_unix' not in frame.columns or not row_group_seconds:
+                write(frame)
+                continue
+
+            pending = frame if pending is None else pd.concat([pending, frame], ignore_index=True)
+            ts = pending['timestamp_unix'].to_numpy(dtype='f8')
+            window = np.floor((ts - ts[0]) / row_group_seconds) if len(ts) else ts
+            # Write every complete window; keep the last (still filling) one pending
+            boundaries = np.flatnonzero(np.diff(window)) + 1
+            start = 0
+            for end in boundaries:
+                write(pending.iloc[start:end])
+                start = end
+            pending = pending.iloc[start:].reset_index(drop=True)
+
+        if pending is not None:
+            write(pending)
+        if writer is None:
+            write(pd.DataFrame())
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return rows_done
+
+
+def write_frame_to_parquet(df: pd.DataFrame, parquet_filename: str,
+                           row_group_seconds: float = DEFAULT_ROW_GROUP_SECONDS,
+                           drop_columns: Iterable[str] = ()) -> int:
+    """Write an in-memory DataFrame to Parquet (sorted by timestamp_unix when present)."""
+    if 'timestamp_unix' in df.columns:
+        df = df.sort_values('timestamp_unix', kind='stable', na_position='last').reset_index(drop=True)
+    return write_frames_to_parquet([df], parquet_filename, len(df),
+                                   row_group_seconds=row_group_seconds, drop_columns=drop_columns)
+
+
+def csv_to_parquet(csv_path: str, parquet_filename: str = None) -> str:
+    """
+    Convert a small CSV export (subject data, SER results) to Parquet next to it.
+
+    Returns:
+        str: The Parquet file path.
+    """
+    parquet_filename = parquet_filename or parquet_path_for(csv_path)
+    write_frame_to_parquet(pd.read_csv(csv_path), parquet_filename)
+    print(f"CSV file '{csv_path}' converted to Parquet file '{parquet_filename}'.")
+    return parquet_filename
+
+
+def load_frame(parquet_filename: str, columns: List[str] = None,
+               start_unix: float = None, end_unix: float = None,
+               event_markers: Iterable[str] = None, iso_column: str = None,
+               categories: bool = True) -> pd.DataFrame:
+    """
+    Load a Parquet export, pushing time and marker predicates down to the reader.
+
+    Args:
+        parquet_filename (str): File written by this module.
+        columns (list): Columns to read (all by default).
+        start_unix (float): Keep rows with timestamp_unix >= start_unix.
+        end_unix (float): Keep rows with timestamp_unix < end_unix.
+        event_markers (iterable): Keep rows whose event_marker is in this set.
+        iso_column (str): If given, add an ISO 8601 column derived from timestamp_unix.
+        categories (bool): Return dictionary-encoded columns as categoricals (else str objects).
+
+    Returns:
+        pd.DataFrame
+    """
+    _require_pyarrow()
+    filters = []
+    if start_unix is not None:
+        filters.append(('timestamp_unix', '>=', float(start_unix)))
+    if end_unix is not None:
+        filters.append(('timestamp_unix', '<', float(end_unix)))
+    if event_markers is not None:
+        filters.append(('event_marker', 'in', list(event_markers)))
+
+    if columns is not None and iso_column and 'timestamp_unix' not in columns:
+        columns = ['timestamp_unix', *columns]
+
+    # String columns are dictionary-encoded on disk; read them as dictionaries -> categoricals
+    read_dictionary = None
+    if categories:
+        read_dictionary = [field.name for field in pq.read_schema(parquet_filename)
+                           if pa.types.is_string(field.type) or pa.types.is_dictionary(field.type)]
+
+    table = pq.read_table(parquet_filename, columns=columns, filters=filters or None,
+                          read_dictionary=read_dictionary)
+    df = table.to_pandas()
+
+    if iso_column:
+        tm.add_iso_column(df, iso_column)
+    return df
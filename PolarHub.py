@@ -0,0 +1,259 @@
+"""
+PolarHub Module
+
+Records several Polar straps at once (group sessions: 4-8 straps per acquisition host)
+from one thread running one asyncio event loop, instead of one PolarManager thread and
+event loop per strap.
+
+FLOW:
+    start()  one BLE scan collects every Polar strap in range (up to max_devices), then
+             one PolarManager per strap opens its files and all straps are connected and
+             streamed concurrently as tasks of the hub's loop (asyncio.gather). A strap that
+             fails to connect is reported without stopping the others.
+    stop()   ends every stream, stops the shared parser and closes every file.
+
+ROUTING:
+    Each strap is labelled with the serial in its advertised name ("Polar H10 ABCD1234"
+    -> "ABCD1234"). Its notifications are decoded and written by its own PolarManager,
+    so every strap has its own datasets:
+        per-strap files  <date>_<subject>_cardiac_data_<label>_<n>.h5
+        session file     cardiac/<label> (with cardiac/<label>/hrv, /ecg, /acc)
+    All BLE callbacks enqueue into one shared queue drained by one parser thread.
+    SessionAligner reads every strap as its own stream 'cardiac_<label>'; FeatureExtractor
+    refuses subjects with several straps.
+
+STATS:
+    stats() reports per strap: connection state and reconnect/gap counters, HR
+    notification rate and dropped notifications, and the PMD sample rate and dropped
+    samples (see PolarPMD). Each strap reconnects on its own after a dropout.
+"""
+import asyncio
+import queue
+import time
+from threading import Thread
+from typing import Dict, Optional
+
+from bleak import BleakScanner
+
+from MarkerTimeline import MarkerTimeline
+from PolarManager import PolarManager, run_notification_parser
+from PolarPMD import FakePolarDevice
+from SessionStore import SessionStore
+
+DEFAULT_MAX_DEVICES = 8
+DEFAULT_SCAN_TIMEOUT = 10.0
+DEVICE_NAME_FILTER = "Polar"
+
+
+def device_label(name: Optional[str], address: str) -> str:
+    """Serial from the advertised name ("Polar H10 ABCD1234" -> "ABCD1234"), else the address."""
+    if name and len(name.split()) > 2:
+        return name.split()[-1]
+    return address.replace(':', '').replace('-', '')
+
+
+class PolarHub:
+    def __init__(self, marker_timeline: MarkerTimeline = None, session_store: SessionStore = None,
+                 swmr: bool = False, max_devices: int = DEFAULT_MAX_DEVICES,
+                 scan_timeout: float = DEFAULT_SCAN_TIMEOUT, pmd_streams: tuple = (), fake_devices: int = 0):
+        """
+        Args:
+            marker_timeline (MarkerTimeline): Shared event marker/condition timeline.
+            session_store (SessionStore): Write every strap into the session file (optional).
+            swmr (bool): Write per-strap files in SWMR mode.
+            max_devices (int): Connect at most this many straps.
+            scan_timeout (float): Seconds of the single discovery scan.
+            pmd_streams (tuple): PMD waveforms to record from every strap ('ecg', 'acc').
+            fake_devices (int): Simulate this many straps (FakePolarDevice) instead of scanning.
+        """
+        self.marker_timeline = marker_timeline or MarkerTimeline()
+        self.session_store = session_store
+        self.swmr = swmr
+        self.max_devices = max_devices
+        self.scan_timeout = scan_timeout
+        self.pmd_streams = tuple(pmd_streams)
+        self.fake_devices = fake_devices
+        self.data_folder = None
+        self._metadata = None
+        self._subject_folder = None
+
+        # label -> PolarManager / address / advertised name / last error
+        self.devices: Dict[str, PolarManager] = {}
+        self._addresses = {}
+        self._names = {}
+        self._errors = {}
+
+        self._notifications = queue.SimpleQueue()
+        self._parser_thread = None
+        self._event_loop = None
+        self.thread = None
+        self._running = False
+        self._scan_done = False
+
+    @property
+    def running(self):
+        return self._running
+
+    def set_metadata(self, experiment_name: str, trial_name: str, subject_id: str,
+                     experimenter_name: str = 'Unknown'):
+        """Metadata applied to every strap's stream."""
+        if not all([experiment_name, trial_name, subject_id]):
+            raise ValueError("experiment_name, trial_name, and subject_id are required")
+        self._metadata = {
+            'experiment_name': experiment_name,
+            'trial_name': trial_name,
+            'subject_id': subject_id,
+            'experimenter_name': experimenter_name,
+        }
+
+    def set_data_folder(self, subject_folder):
+        """Subject folder; the straps write into its cardiac_data folder like PolarManager."""
+        self._subject_folder = subject_folder
+        self.data_folder = subject_folder
+
+    def start(self) -> str:
+        """Scan once and start streaming every strap found; returns a status message."""
+        if self._metadata is None or self._subject_folder is None:
+            raise ValueError("Call set_metadata() and set_data_folder() first.")
+        if self.thread is not None and self.thread.is_alive():
+            return f"Polar hub already streaming {len(self.devices)} device(s)."
+
+        self._running = True
+        self._scan_done = False
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+        # The scan is the only blocking step; files are opened right after it
+        deadline = time.monotonic() + self.scan_timeout + 5
+        while not self._scan_done and time.monotonic() < deadline:
+            time.sleep(0.2)
+
+        if not self.devices:
+            return "No Polar devices found. Please check that the straps are powered on and within range."
+        return f"Polar hub streaming {len(self.devices)} device(s): {', '.join(self.devices)}"
+
+    def stop(self) -> str:
+        """Stop every stream and close every file."""
+        self._running = False
+        for manager in self.devices.values():
+            manager.running = False
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout=10)
+
+        for label, manager in self.devices.items():
+            try:
+                manager.close_h5_file()
+                manager._file_opened = False
+            except Exception as e:
+                print(f"Error closing Polar {label} file: {e}")
+        print(f"Polar hub stopped ({len(self.devices)} device(s)).")
+        return "Polar hub stopped."
+
+    def reset(self) -> None:
+        """Stop streaming and forget the discovered straps."""
+        self.stop()
+        self.devices = {}
+        self._addresses = {}
+        self._names = {}
+        self._errors = {}
+        self._event_loop = None
+        self.thread = None
+
+    def stats(self) -> dict:
+        """Connection state, HR and PMD rates and drop counters of every strap."""
+        return {
+            label: {
+                'address': self._addresses.get(label),
+                'name': self._names.get(label),
+                'connected': manager._connected,
+                'connection': manager.connection_stats(),
+                'error': self._errors.get(label),
+                'hdf5_filename': manager.hdf5_filename,
+                'hdf5_group': manager.hdf5_group,
+                'hr': manager.hr_stats(),
+                'pmd': manager.pmd_stats(),
+            }
+            for label, manager in self.devices.items()
+        }
+
+    def _run(self):
+        """Hub thread: one event loop for the scan and every strap's connection."""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._event_loop = loop
+        self._parser_thread = Thread(target=run_notification_parser, args=(self._notifications,), daemon=True)
+        self._parser_thread.start()
+        try:
+            found = loop.run_until_complete(self._discover())
+            for label, (address, name, _, ble_device) in found.items():
+                try:
+                    self._add_device(label, address, name, ble_device)
+                except Exception as e:
+                    print(f"✗ Polar {label}: could not open its files: {e}")
+                    self._errors[label] = str(e)
+            self._scan_done = True
+            loop.run_until_complete(self._stream_all(found))
+        except Exception as e:
+            print(f"Error in Polar hub: {e}")
+        finally:
+            self._scan_done = True
+            self._notifications.put(None)
+            self._parser_thread.join(timeout=5)
+            self._parser_thread = None
+            loop.close()
+            self._running = False
+
+    async def _discover(self) -> dict:
+        """
+        label -> (address, name, FakePolarDevice or None, BLEDevice or None) of the straps to
+        connect. The BLEDevice is kept so (re)connects do not scan for the address again.
+        """
+        if self.fake_devices:
+            fakes = [FakePolarDevice(name=f"Polar H10 FAKE{i:04d}", address=f"00:00:00:00:00:{i:02X}", seed=i)
+                     for i in range(1, min(self.fake_devices, self.max_devices) + 1)]
+            return {device_label(fake.name, fake.address): (fake.address, fake.name, fake, None) for fake in fakes}
+
+        print(f"\nSearching for Polar devices ({self.scan_timeout:.0f} s)...", flush=True)
+        discovered = await BleakScanner.discover(timeout=self.scan_timeout)
+        found = {}
+        for device in discovered:
+            if device.name and DEVICE_NAME_FILTER in device.name and len(found) < self.max_devices:
+                found[device_label(device.name, device.address)] = (device.address, device.name, None, device)
+                print(f"Found Polar device: {device.name} at {device.address}")
+        return found
+
+    def _add_device(self, label: str, address: str, name: str, ble_device=None):
+        manager = PolarManager(marker_timeline=self.marker_timeline, session_store=self.session_store,
+                               swmr=self.swmr, pmd_streams=self.pmd_streams, device_label=label,
+                               notifications=self._notifications)
+        manager.set_metadata(**self._metadata)
+        manager.set_data_folder(self._subject_folder)
+        manager.set_filenames()
+        manager.initialize_hdf5_file()
+        manager._device_address = address
+        manager._ble_device = ble_device
+        manager.device_started = True
+        manager.running = True
+        self.devices[label] = manager
+        self._addresses[label] = address
+        self._names[label] = name
+
+    async def _stream_all(self, found: dict):
+        """Stream every strap as a task of this loop until stop()."""
+        labels = [label for label in found if label in self.devices]
+        results = await asyncio.gather(*(self._stream_device(label, found[label][2]) for label in labels),
+                                       return_exceptions=True)
+        for label, result in zip(labels, results):
+            if isinstance(result, Exception):
+                print(f"✗ Polar {label} stopped with error: {result}")
+                self._errors[label] = str(result)
+
+    async def _stream_device(self, label: str, fake: Optional[FakePolarDevice]):
+        manager = self.devices[label]
+        try:
+            if fake is not None:
+                await manager._stream_fake(fake)
+            else:
+                await manager._stream_data()
+        finally:
+            manager._streaming = False
@@ -1,28 +1,140 @@
 from typing import Optional
-import struct
 from bleak import BleakScanner, BleakClient
 import TimestampManager as tm
+from MarkerTimeline import MarkerTimeline, MarkerLog, MARKER_LOG_DTYPE, MARKER_LOG_GROUP
+from HDF5Appender import (HDF5Appender, create_stream_dataset, write_metadata_attrs, is_schema_v1, legacy_row,
+                          open_stream_file, close_stream_file)
+from SessionStore import SessionStore
+from HDF5Exporter import export_hdf5_to_csv, export_hdf5_to_parquet, print_progress
+from ParquetStore import parquet_path_for
+from SummaryPyramid import write_pyramid
+from StreamSlicer import write_marker_index
+from StreamingHRV import RRWindow, HRVFeatureEngine, HRV_FEATURES_DTYPE, DEFAULT_MAX_BEATS, DEFAULT_WINDOW_SECONDS
+from PolarPMD import (PMD_CONTROL_UUID, PMD_DATA_UUID, FakePolarDevice, pmd_streams_for, start_command,
+                      stop_command)
+from DeviceWorker import DeviceWorker
 from datetime import datetime, timezone
 import os
 import h5py
 import numpy as np
 import pandas as pd
-from collections import deque
 import asyncio
+import queue
 from threading import Thread
 import time
 
+# Group name in the session file when a SessionStore is used
+SESSION_STREAM = "cardiac"
+# Group holding the HRV feature rows ('data'), beside the HR/HRV dataset
+HRV_GROUP = "hrv"
+
+STREAM_DTYPE = np.dtype([
+    ('timestamp_unix', 'f8'),
+    ('HR', 'f4'),
+    ('HRV', 'f4'),
+])
+
 # Standard Bluetooth Heart Rate Service UUIDs
 HEART_RATE_SERVICE_UUID = "0000180d-0000-1000-8000-00805f9b34fb"
 HEART_RATE_MEASUREMENT_UUID = "00002a37-0000-1000-8000-00805f9b34fb"
 
+# RR intervals are sent in units of 1/1024 s
+RR_UNITS_TO_MS = 1000.0 / 1024.0
+NO_RR = np.zeros(0)
+# Heart Rate Measurement notifications arrive once per second; longer gaps count as drops
+HR_NOTIFY_INTERVAL = 1.0
+# Group holding the connection gaps ('data'): one row per dropout, written when it ends (reconnect or give-up)
+GAPS_GROUP = "gaps"
+GAP_DTYPE = np.dtype([
+    ('start_unix', 'f8'),
+    ('end_unix', 'f8'),
+    ('attempts', 'i4'),
+])
+# Reconnect to the cached BLEDevice: per-attempt connect timeout, pause between attempts and the
+# total time after which the dropout is treated as a crash. Only when connecting to the cached
+# device fails is the address scanned for again (for up to RECONNECT_SCAN_TIMEOUT seconds).
+RECONNECT_CONNECT_TIMEOUT = 5.0
+RECONNECT_SCAN_TIMEOUT = 10.0
+RECONNECT_DELAY = 0.2
+DEFAULT_RECONNECT_TIMEOUT = 120.0
+
+# Out-of-process acquisition (PolarSource in a DeviceWorker): every notification and gap is
+# forwarded as one packet row through the worker's shared-memory ring buffer
+PACKET_HR = 0
+PACKET_PMD = 1
+PACKET_GAP = 2
+# Largest BLE notification value (ATT MTU 517 minus the 3-byte header)
+PACKET_PAYLOAD_BYTES = 514
+PACKET_DTYPE = np.dtype([
+    ('timestamp_unix', 'f8'),
+    ('kind', 'u1'),
+    ('length', 'u2'),
+    ('payload', 'u1', (PACKET_PAYLOAD_BYTES,)),
+])
+# Gap packets carry (start_unix, attempts) as their payload
+GAP_PACKET_DTYPE = np.dtype([('start_unix', '<f8'), ('attempts', '<i4')])
+# Ring buffer rows (~15 minutes of HR + ECG + ACC packets)
+WORKER_CAPACITY_ROWS = 8192
+
+
+def parse_hr_packet(data) -> tuple:
+    """
+    Decode a Heart Rate Measurement characteristic value.
+
+    Returns:
+        (int, np.ndarray): Heart rate (bpm) and the RR intervals of the packet in ms.
+    """
+    flags = data[0]
+    if flags & 0x01:
+        hr_value = data[1] | (data[2] << 8)
+        offset = 3
+    else:
+        hr_value = data[1]
+        offset = 2
+    if flags & 0x08:
+        offset += 2  # energy expended
+    if not flags & 0x10 or len(data) < offset + 2:
+        return hr_value, NO_RR
+    # One call decodes the whole RR block in place (no per-value slicing)
+    rr_units = np.frombuffer(data, dtype='<u2', count=(len(data) - offset) // 2, offset=offset)
+    return hr_value, rr_units * RR_UNITS_TO_MS
+
+
+def run_notification_parser(notifications: queue.SimpleQueue) -> None:
+    """
+    Call handler(tsu, data) for every queued (handler, tsu, data, kind) notification until a
+    None sentinel arrives. kind (PACKET_HR / PACKET_PMD) is only used by PolarSource.
+    """
+    while True:
+        item = notifications.get()
+        if item is None:
+            break
+        handler, tsu, data, _ = item
+        handler(tsu, data)
+
+
+def _round_or_none(value: Optional[float], digits: int = 3) -> Optional[float]:
+    return None if value is None else round(value, digits)
+
+
 class PolarManager:
-    def __init__(self):
+    def __init__(self, marker_timeline: MarkerTimeline = None, session_store: SessionStore = None,
+                 swmr: bool = False, hrv_window_seconds: Optional[float] = DEFAULT_WINDOW_SECONDS,
+                 hrv_window_beats: Optional[int] = DEFAULT_MAX_BEATS, pmd_streams: tuple = (),
+                 fake_device: bool = False, device_label: Optional[str] = None,
+                 notifications: Optional[queue.SimpleQueue] = None,
+                 reconnect_timeout: Optional[float] = DEFAULT_RECONNECT_TIMEOUT, use_process: bool = False):
+        self.marker_timeline = marker_timeline or MarkerTimeline()
+        # When set, the stream is a group of the session file written by the store's thread
+        self.session_store = session_store
+        # Keep the file readable by LiveReader while recording (single-writer/multiple-reader)
+        self.swmr = swmr
+        self.hdf5_group = None
         self._device_address = None
+        # BLEDevice of the last discovery: BleakClient(address) would run a full scan on every reconnect
+        self._ble_device = None
         self._client: Optional[BleakClient] = None
-        self._event_marker = "start_up"
         self._experimenter_name = "unknown"
-        self._condition = "None"
         self._subject_id = None
         self._experiment_name = None
         self._trial_name = None
@@ -36,27 +148,77 @@ class PolarManager:
         self._crashed = False
         self._num_crashes = 0
         self._dataset = None
+        self._appender = None
+        self._hrv_appender = None
+        # Path of the HRV feature group in the file ('hrv', or 'cardiac/hrv' in a session file)
+        self.hrv_group = None
+        # history_rows: last ~hour of 1 Hz HR kept in memory for the live tail endpoint
+        self.appender_options = {"flush_rows": 32, "flush_interval": 1.0, "history_rows": 3600}
+        self.hdf5_layout = {"chunk_rows": 1024, "compression": "gzip", "compression_opts": 4, "shuffle": True}
         self._file_opened = False
+        # Metadata set while the file is in SWMR mode, written when it closes
+        self._deferred_metadata = None
         self.thread = None
         self._event_loop = None
+        # BLE callbacks only enqueue (handler, timestamp, packet); the parser thread does the rest.
+        # A PolarHub passes one shared queue to all of its devices and runs the parser itself.
+        self._owns_parser = notifications is None
+        self._notifications = queue.SimpleQueue() if notifications is None else notifications
+        self._parser_thread = None
+        # One strap of several (PolarHub): the label goes into file names and the session group
+        self.device_label = device_label
+        self.stream_name = f"{SESSION_STREAM}/{device_label}" if device_label else SESSION_STREAM
+        self._hr_notifications = 0
+        self._hr_dropped = 0
+        self._first_notification_time = None
+        self._last_notification_time = None
+
+        # On a dropout, reconnect to the cached device for up to reconnect_timeout seconds
+        # (None = never give up; 0 = no reconnect) and record the gap instead of starting a new file
+        self.reconnect_timeout = reconnect_timeout
+        self._connected = False
+        self._has_connected = False
+        self._gap_appender = None
+        self.gaps_group = None
+        self.gap_appender_options = {"flush_rows": 1, "flush_interval": 1.0, "history_rows": 256}
+        # Marker changes are written as they happen, so a crashed file still has its markers
+        self._marker_log = None
+        self.marker_log_options = {"flush_rows": 1, "flush_interval": 1.0}
+        self._disconnected_since = None
+        self._reconnects = 0
+        self._last_reconnect_seconds = None
+        self._total_gap_seconds = 0.0
         
         # Data storage
         self._current_row = {
-            "experiment_name": None,
-            "trial_name": None,
-            "subject_id": None,
-            "experimenter_name": None,
             "timestamp_unix": None,
-            "timestamp": None,
             "HR": None,
-            "HRV": None,
-            "event_marker": self._event_marker,
-            "condition": self._condition
+            "HRV": None
         }
         
-        # RR interval buffer for HRV calculation (30 second window)
-        self._rr_intervals = deque(maxlen=300)
+        # Running RMSSD over the last hrv_window_seconds of beats (capped at hrv_window_beats)
+        self._hrv = RRWindow(max_beats=hrv_window_beats, window_seconds=hrv_window_seconds)
+        # SDNN, pNN50, mean NN, LF/HF over the last 5 minutes, one row per second
+        self._hrv_engine = HRVFeatureEngine()
+        self.hrv_appender_options = {"flush_rows": 16, "flush_interval": 1.0, "history_rows": 3600}
         self._last_hr = None
+
+        # Raw waveforms from the PMD service ('ecg', 'acc'), each in its own group beside 'data'
+        self.pmd_streams = tuple(pmd_streams)
+        self._pmd = pmd_streams_for(self.pmd_streams)
+        self._pmd_by_type = {stream.measurement_type: stream for stream in self._pmd.values()}
+        self._pmd_appenders = {}
+        self.pmd_groups = {}
+        # Block writes: one append_rows per notification; ~30 s of samples kept for live views
+        self.pmd_appender_options = {"flush_rows": 2048, "flush_interval": 1.0}
+        self.pmd_layout = {"chunk_rows": 16384, "compression": "gzip", "compression_opts": 4, "shuffle": True}
+        # Generate notifications locally (FakePolarDevice) instead of scanning for a strap
+        self.fake_device = fake_device
+
+        # Out-of-process acquisition: BLE runs in a worker process (PolarSource) and its packets
+        # are decoded and written here, so this process's load cannot delay the notifications
+        self.use_process = use_process
+        self._worker = None
         
     @property
     def device_started(self):
@@ -76,19 +238,19 @@ class PolarManager:
 
     @property
     def event_marker(self):
-        return self._event_marker
+        return self.marker_timeline.event_marker
     
     @event_marker.setter
     def event_marker(self, value):
-        self._event_marker = value
+        self.marker_timeline.set_marker(value)
 
     @property
     def condition(self):
-        return self._condition
+        return self.marker_timeline.condition
     
     @condition.setter
     def condition(self, value):
-        self._condition = value
+        self.marker_timeline.set_condition(value)
 
     def set_metadata(self, experiment_name: str, trial_name: str, 
                  subject_id: str, experimenter_name: str = 'Unknown'):
@@ -101,8 +263,31 @@ class PolarManager:
         self._subject_id = subject_id
         self._experimenter_name = experimenter_name
         
+        self._write_metadata_attrs()
         print(f"Metadata set: {experiment_name}/{trial_name}/{subject_id}")
 
+    def _metadata(self) -> dict:
+        return {
+            'experiment_name': self._experiment_name,
+            'trial_name': self._trial_name,
+            'subject_id': self._subject_id,
+            'experimenter_name': self._experimenter_name,
+        }
+
+    def _write_metadata_attrs(self):
+        """Store the session metadata once as dataset attributes instead of in every row."""
+        metadata = self._metadata()
+        if self.hdf5_group is not None and self._appender is not None:
+            self._appender.submit(lambda group: write_metadata_attrs(group['data'], metadata), structural=True)
+            return
+        if self._dataset is None or 'experiment_name' in self._dataset.dtype.names:
+            return
+        if self.hdf5_file is not None and self.hdf5_file.swmr_mode:
+            # HDF5 cannot write attributes safely in SWMR mode; the close step writes them
+            self._deferred_metadata = metadata
+            return
+        write_metadata_attrs(self._dataset, metadata)
+
     def set_data_folder(self, subject_folder):
         """Set the data folder for storing cardiac data files."""
         self.data_folder = os.path.join(subject_folder, "cardiac_data")
@@ -118,18 +303,17 @@ class PolarManager:
         if not self._subject_id:
             raise ValueError("Subject ID not set. Call set_metadata() first.")
         
-        current_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        self.hdf5_filename = os.path.join(
-            self.data_folder, 
-            f"{current_date}_{self._subject_id}_cardiac_data_{self._num_crashes}.h5"
-        )
-        self.csv_filename = os.path.join(
-            self.data_folder,
-            f"{current_date}_{self._subject_id}_cardiac_data_{self._num_crashes}.csv"
-        )
+        self.hdf5_filename = self._data_filename(".h5")
+        self.csv_filename = self._data_filename(".csv")
         print(f"✓ Polar HDF5 filename set to: {self.hdf5_filename}")
         print(f"✓ Polar CSV filename set to: {self.csv_filename}")
 
+    def _data_filename(self, extension: str) -> str:
+        current_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        device = f"{self.device_label}_" if self.device_label else ""
+        return os.path.join(self.data_folder,
+                            f"{current_date}_{self._subject_id}_cardiac_data_{device}{self._num_crashes}{extension}")
+
     def initialize_hdf5_file(self):
         """Initialize the HDF5 file for data storage."""
         if not self.hdf5_filename:
@@ -144,41 +328,31 @@ class PolarManager:
         os.makedirs(os.path.dirname(self.hdf5_filename), exist_ok=True)
         
         try:
+            if self.session_store is not None:
+                self._open_session_stream()
+                return
+
             if self._crashed:
-                current_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")  
-                self.hdf5_filename = os.path.join(
-                    self.data_folder,
-                    f"{current_date}_{self._subject_id}_cardiac_data_{self._num_crashes}.h5"
-                )
-                self.csv_filename = os.path.join(
-                    self.data_folder,
-                    f"{current_date}_{self._subject_id}_cardiac_data_{self._num_crashes}.csv"
-                )
+                self.hdf5_filename = self._data_filename(".h5")
+                self.csv_filename = self._data_filename(".csv")
 
             print(f"Initializing Polar HDF5 file at: {self.hdf5_filename}")
-            self.hdf5_file = h5py.File(self.hdf5_filename, 'a')  
+            self.hdf5_file = open_stream_file(self.hdf5_filename, swmr=self.swmr)
 
             if 'data' not in self.hdf5_file:  
-                dtype = np.dtype([
-                    ('experiment_name', h5py.string_dtype(encoding='utf-8')),
-                    ('trial_name', h5py.string_dtype(encoding='utf-8')),
-                    ('subject_id', h5py.string_dtype(encoding='utf-8')),
-                    ('experimenter_name', h5py.string_dtype(encoding='utf-8')),
-                    ('timestamp_unix', 'f8'),
-                    ('timestamp', h5py.string_dtype(encoding='utf-8')),
-                    ('HR', 'f4'),
-                    ('HRV', 'f4'),
-                    ('event_marker', h5py.string_dtype(encoding='utf-8')),
-                    ('condition', h5py.string_dtype(encoding='utf-8')),
-                ])
-                self._dataset = self.hdf5_file.create_dataset(
-                    'data', shape=(0,), maxshape=(None,), dtype=dtype
-                )
+                self._dataset = create_stream_dataset(self.hdf5_file, 'data', STREAM_DTYPE, self.hdf5_layout)
                 print("✓ Created Polar HDF5 dataset")
             else:
                 self._dataset = self.hdf5_file['data']
                 print("✓ Using existing Polar HDF5 dataset")
 
+            self._write_metadata_attrs()
+            self._appender = HDF5Appender(self._dataset, swmr=self.swmr, **self.appender_options)
+            # Side datasets must exist before the file switches to SWMR mode
+            self._open_side_streams()
+            if self.swmr:
+                self.hdf5_file.swmr_mode = True
+
             self._file_opened = True
             print(f"✓ Polar HDF5 file initialized: {self.hdf5_filename}")
 
@@ -187,79 +361,158 @@ class PolarManager:
             print(f"✗ {error_msg}")
             raise RuntimeError(error_msg) from e
         
+    def _open_session_stream(self):
+        """Register this stream with the session store instead of opening a separate file."""
+        self.hdf5_filename = self.session_store.filename
+        self.hdf5_group = self.stream_name
+        self._appender = self.session_store.open_stream(self.stream_name, STREAM_DTYPE, self.hdf5_layout,
+                                                        **self.appender_options)
+        self._open_side_streams()
+        self._write_metadata_attrs()
+        self._file_opened = True
+        print(f"✓ Polar stream '{self.stream_name}' initialized in session file: {self.hdf5_filename}")
+
+    def _open_side_stream(self, name: str, dtype: np.dtype, layout: dict, options: dict):
+        """
+        Open the group `name` beside the HR/HRV data ('<name>', or '<stream_name>/<name>' in a
+        session file) and return (group path, appender).
+        """
+        if self.session_store is not None:
+            path = f"{self.stream_name}/{name}"
+            return path, self.session_store.open_stream(path, dtype, layout, **options)
+
+        parent = self.hdf5_file.require_group(name)
+        dataset = parent['data'] if 'data' in parent else create_stream_dataset(parent, 'data', dtype, layout)
+        return name, HDF5Appender(dataset, swmr=self.swmr, **options)
+
+    def _open_side_streams(self):
+        """HRV feature rows, connection gaps, the marker log and the enabled PMD waveforms."""
+        self.hrv_group, self._hrv_appender = self._open_side_stream(
+            HRV_GROUP, HRV_FEATURES_DTYPE, self.hdf5_layout, self.hrv_appender_options)
+        self.gaps_group, self._gap_appender = self._open_side_stream(
+            GAPS_GROUP, GAP_DTYPE, self.hdf5_layout, self.gap_appender_options)
+        _, marker_log_appender = self._open_side_stream(
+            MARKER_LOG_GROUP, MARKER_LOG_DTYPE, self.hdf5_layout, self.marker_log_options)
+        self._marker_log = MarkerLog(self.marker_timeline, marker_log_appender)
+        for name, stream in self._pmd.items():
+            options = dict(self.pmd_appender_options, history_rows=int(stream.sample_rate * 30))
+            self.pmd_groups[name], self._pmd_appenders[name] = self._open_side_stream(
+                name, stream.dtype, self.pmd_layout, options)
+
     def calculate_hrv_rmssd(self) -> Optional[float]:
-        """Calculate HRV using RMSSD."""
-        if len(self._rr_intervals) < 2:
-            return None
-        
-        rr_array = np.array(self._rr_intervals)
-        successive_diffs = np.diff(rr_array)
-        rmssd = np.sqrt(np.mean(successive_diffs ** 2))
-        
-        return float(rmssd)
+        """HRV as RMSSD (ms) over the current window; O(1), see StreamingHRV."""
+        return self._hrv.rmssd()
 
     def parse_heart_rate_measurement(self, sender, data: bytearray):
-        """Parse heart rate measurement data from Bluetooth."""
+        """BLE notification callback: timestamp the packet and hand it to the parser thread."""
+        self._notifications.put((self._process_notification, tm.get_timestamp_ns() * 1e-9, data, PACKET_HR))
+
+    def parse_pmd_data(self, sender, data: bytearray):
+        """BLE notification callback of the PMD data characteristic (see parse_heart_rate_measurement)."""
+        self._notifications.put((self._process_pmd_frame, tm.get_timestamp_ns() * 1e-9, data, PACKET_PMD))
+
+    def _start_parser(self):
+        """Start the thread that decodes queued notifications and writes the rows."""
+        if not self._owns_parser or (self._parser_thread is not None and self._parser_thread.is_alive()):
+            return
+        self._parser_thread = Thread(target=run_notification_parser, args=(self._notifications,), daemon=True)
+        self._parser_thread.start()
+
+    def _stop_parser(self):
+        """Process the notifications still queued, then stop the parser thread."""
+        if self._parser_thread is None:
+            return
+        self._notifications.put(None)
+        self._parser_thread.join(timeout=5)
+        self._parser_thread = None
+
+    def _process_notification(self, tsu: float, data: bytearray):
+        """Decode one Heart Rate Measurement notification received at tsu and record it."""
         try:
-            tsu = tm.get_timestamp("unix")
-            # FIX: Convert string timestamp to float
-            if isinstance(tsu, str):
-                tsu = float(tsu)
-            ts = datetime.fromtimestamp(tsu).isoformat()
-            
-            flags = data[0]
-            hr_format = flags & 0x01
-            has_energy = (flags >> 3) & 0x01
-            has_rr = (flags >> 4) & 0x01
-            
-            if hr_format == 0:
-                hr_value = data[1]
-                offset = 2
-            else:
-                hr_value = struct.unpack('<H', data[1:3])[0]
-                offset = 3
-            
+            hr_value, rr_ms = parse_hr_packet(data)
             self._last_hr = hr_value
-            
-            if has_energy:
-                offset += 2
-            
-            if has_rr and len(data) >= offset + 2:
-                num_rr = (len(data) - offset) // 2
-                for i in range(num_rr):
-                    rr_value = struct.unpack('<H', data[offset + i*2:offset + (i+1)*2])[0]
-                    rr_ms = (rr_value / 1024.0) * 1000.0
-                    self._rr_intervals.append(rr_ms)
-            
+            self._count_notification(tsu)
+
+            if len(rr_ms):
+                # The last beat of the notification ends at arrival; earlier beats are spaced by their RR
+                beat_times = tsu - (rr_ms.sum() - np.cumsum(rr_ms)) / 1000.0
+                for rr, beat_time in zip(rr_ms.tolist(), beat_times.tolist()):
+                    self._hrv.push(rr, beat_time)
+                    self._hrv_engine.push(rr, beat_time)
+
             hrv_value = self.calculate_hrv_rmssd()
-            
-            self._current_row["experiment_name"] = self._experiment_name
-            self._current_row["trial_name"] = self._trial_name
-            self._current_row["subject_id"] = self._subject_id
-            self._current_row["experimenter_name"] = self._experimenter_name
+
             self._current_row["timestamp_unix"] = tsu
-            self._current_row["timestamp"] = ts
             self._current_row["HR"] = self._last_hr
             self._current_row["HRV"] = hrv_value
-            self._current_row["event_marker"] = self.event_marker
-            self._current_row["condition"] = self.condition
-            
+
+            # NumPy work (LF/HF) runs at most once per second, not per notification
+            hrv_features = self._hrv_engine.update(tsu)
+
             if self._streaming:
                 self.write_to_hdf5(self._current_row)
+                if hrv_features is not None and self._hrv_appender is not None:
+                    self._hrv_appender.append(hrv_features)
                 hrv_display = f"{hrv_value:.1f}" if hrv_value is not None else "N/A"
                 print(f"✓ HR={self._last_hr} HRV={hrv_display}")
-                
+
         except Exception as e:
             print(f"Error parsing heart rate data: {e}")
             import traceback
             traceback.print_exc()
 
+    def _process_pmd_frame(self, tsu: float, data: bytearray):
+        """Decode one PMD frame into a block of rows and append it to the stream's dataset."""
+        try:
+            stream = self._pmd_by_type.get(data[0])
+            if stream is None:
+                return
+            rows = stream.frame_rows(tsu, data)
+            appender = self._pmd_appenders.get(stream.name)
+            if rows is not None and self._streaming and appender is not None:
+                appender.append_rows(rows)
+        except Exception as e:
+            print(f"Error parsing PMD data: {e}")
+
+    def _count_notification(self, tsu: float):
+        if self._last_notification_time is None:
+            self._first_notification_time = tsu
+        else:
+            gap = tsu - self._last_notification_time
+            if gap > 1.5 * HR_NOTIFY_INTERVAL:
+                self._hr_dropped += int(round(gap / HR_NOTIFY_INTERVAL)) - 1
+        self._last_notification_time = tsu
+        self._hr_notifications += 1
+
+    def hr_stats(self) -> dict:
+        """Heart Rate Measurement notification and drop counters and the achieved notification rate."""
+        elapsed = (self._last_notification_time - self._first_notification_time) \
+            if self._hr_notifications > 1 else 0.0
+        return {
+            'notifications': self._hr_notifications,
+            'dropped_notifications': self._hr_dropped,
+            'nominal_rate_hz': 1.0 / HR_NOTIFY_INTERVAL,
+            'rate_hz': round((self._hr_notifications - 1) / elapsed, 2) if elapsed > 0 else None,
+        }
+
+    def pmd_stats(self) -> dict:
+        """Sample, frame and drop counters and the achieved rate of each PMD stream."""
+        return {name: stream.stats() for name, stream in self._pmd.items()}
+
     def _scan_and_connect(self):
         """Internal method - runs in background thread with its own event loop"""
         try:
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
             self._event_loop = loop
+
+            if self.fake_device:
+                device = FakePolarDevice()
+                self._device_address = device.address
+                self._device_started = True
+                print(f"Streaming from fake Polar device {device.name}")
+                loop.run_until_complete(self._stream_fake(device))
+                return
             
             # Scan for device
             print("\nSearching for Polar H10...", flush=True)
@@ -276,6 +529,7 @@ class PolarManager:
                 return
             
             self._device_address = device.address
+            self._ble_device = device
             print(f"Found Polar device: {device.name} at {device.address}")
             self._device_started = True
             
@@ -296,32 +550,181 @@ class PolarManager:
             self._running = False
 
     async def _stream_data(self):
-        """Internal async method for streaming"""
+        """Internal async method for streaming; reconnects to the cached device after a dropout."""
         try:
-            async with BleakClient(self._device_address) as client:
-                self._client = client
-                self._streaming = True
-                
-                print(f"Connected to Polar H10 - streaming data...")
-                
-                await client.start_notify(
-                    HEART_RATE_MEASUREMENT_UUID,
-                    self.parse_heart_rate_measurement
-                )
-                
-                # Stream while running flag is True
-                while self._running:
-                    await asyncio.sleep(0.1)
-                
-                await client.stop_notify(HEART_RATE_MEASUREMENT_UUID)
-                print("Data collection complete.")
-                
-        except Exception as e:
-            print(f"Error during data collection: {e}")
+            self._start_parser()
+            self._has_connected = False
+            attempts = 0
+            while self._running:
+                try:
+                    attempts += 1
+                    await self._stream_connection(attempts)
+                    attempts = 0
+                except Exception as e:
+                    if not self._running:
+                        break
+                    if not self._may_reconnect():
+                        print(f"Error during data collection: {e}")
+                        self._close_open_gap(attempts)
+                        raise
+                    if attempts == 1:
+                        print(f"Polar connection lost ({e}); reconnecting to {self._device_address}...")
+                    await asyncio.sleep(RECONNECT_DELAY)
+                    continue
+
+                if self._running:
+                    # Disconnected while recording: reconnect right away, without a rescan
+                    if not self._may_reconnect():
+                        self._close_open_gap(attempts)
+                        raise ConnectionError("Polar H10 disconnected")
+                    print(f"Polar H10 disconnected; reconnecting to {self._device_address}...")
+            self._close_open_gap(attempts)
+            print("Data collection complete.")
+        finally:
+            self._connected = False
+            self._stop_parser()
+
+    async def _stream_connection(self, attempts: int):
+        """Connect, stream until stopped or disconnected, and close the gap the connection ends."""
+        disconnected = asyncio.Event()
+
+        def on_disconnect(_):
+            # The gap starts now, not when client.disconnect() returns (a stop is not a dropout)
+            if self._running:
+                self._mark_disconnected()
+            disconnected.set()
+
+        device = self._ble_device
+        if device is None:
+            # No cached BLEDevice, or connecting with it failed: scan for the address once
+            device = await BleakScanner.find_device_by_address(self._device_address, timeout=RECONNECT_SCAN_TIMEOUT)
+            if device is None:
+                raise ConnectionError(f"Polar H10 {self._device_address} not found")
+            self._ble_device = device
+
+        client = BleakClient(device, timeout=RECONNECT_CONNECT_TIMEOUT, disconnected_callback=on_disconnect)
+        try:
+            await client.connect()
+        except Exception:
+            self._ble_device = None
             raise
 
+        try:
+            self._client = client
+            self._streaming = True
+
+            await client.start_notify(
+                HEART_RATE_MEASUREMENT_UUID,
+                self.parse_heart_rate_measurement
+            )
+            if self.pmd_streams:
+                await self._start_pmd(client)
+            self._connected = True
+            self._has_connected = True
+            self._close_open_gap(attempts)
+            print(f"Connected to Polar H10 - streaming data...")
+
+            # Stream while running flag is True and the strap stays connected
+            while self._running and not disconnected.is_set():
+                await asyncio.sleep(0.1)
+
+            if not disconnected.is_set():
+                if self.pmd_streams:
+                    await self._stop_pmd(client)
+                await client.stop_notify(HEART_RATE_MEASUREMENT_UUID)
+        finally:
+            # What `async with BleakClient(...)` does on exit; connect() ran above so a failure
+            # with the cached device can drop it before the next attempt
+            await client.disconnect()
+
+        if disconnected.is_set():
+            self._mark_disconnected()
+
+    def _may_reconnect(self) -> bool:
+        """Whether a dropout should be bridged by reconnecting (within reconnect_timeout)."""
+        # A strap that never connected in this run is a failed start, not a dropout
+        if not self._running or not self._has_connected or self.reconnect_timeout == 0:
+            return False
+        self._mark_disconnected()
+        elapsed = tm.get_timestamp_ns() * 1e-9 - self._disconnected_since
+        return self.reconnect_timeout is None or elapsed < self.reconnect_timeout
+
+    def _mark_disconnected(self):
+        self._connected = False
+        if self._disconnected_since is None:
+            self._disconnected_since = tm.get_timestamp_ns() * 1e-9
+
+    def _close_open_gap(self, attempts: int):
+        """Record the current dropout (if any) as a gap ending now."""
+        if self._disconnected_since is not None:
+            self._record_gap(tm.get_timestamp_ns() * 1e-9, attempts)
+
+    def _record_gap(self, end_unix: float, attempts: int):
+        """Write the interval without a connection to the gaps dataset."""
+        start_unix = self._disconnected_since
+        self._disconnected_since = None
+        self._apply_gap(start_unix, end_unix, attempts)
+
+    def _apply_gap(self, start_unix: float, end_unix: float, attempts: int):
+        """Count a connection gap and append it to the gaps dataset."""
+        duration = end_unix - start_unix
+        self._reconnects += 1
+        self._last_reconnect_seconds = duration
+        self._total_gap_seconds += duration
+        if self._gap_appender is not None:
+            self._gap_appender.append({'start_unix': start_unix, 'end_unix': end_unix, 'attempts': attempts})
+        print(f"✓ Polar gap of {duration:.2f} s recorded ({attempts} connection attempt(s))")
+
+    def connection_stats(self) -> dict:
+        """Connection state and reconnect/gap counters."""
+        if self._worker is not None and self._worker.alive:
+            # The connection lives in the worker process; gaps arrive here as packets when they end
+            try:
+                state = self._worker.request('status')
+                self._connected = state.get('connected', False)
+                self._disconnected_since = state.get('disconnected_since')
+            except RuntimeError as e:
+                print(f"Error reading Polar worker status: {e}")
+        return {
+            'connected': self._connected,
+            'disconnected_since': self._disconnected_since,
+            'reconnects': self._reconnects,
+            'last_reconnect_seconds': _round_or_none(self._last_reconnect_seconds),
+            'total_gap_seconds': round(self._total_gap_seconds, 3),
+        }
+
+    async def _start_pmd(self, client):
+        """Subscribe to PMD data and start every enabled measurement on the control point."""
+        # Control point responses arrive as indications; they must be enabled for the writes
+        await client.start_notify(PMD_CONTROL_UUID, lambda sender, data: None)
+        await client.start_notify(PMD_DATA_UUID, self.parse_pmd_data)
+        for name in self.pmd_streams:
+            await client.write_gatt_char(PMD_CONTROL_UUID, start_command(name), response=True)
+            print(f"✓ Polar PMD stream '{name}' started")
+
+    async def _stop_pmd(self, client):
+        """Stop every enabled measurement and unsubscribe from the PMD characteristics."""
+        for name in self.pmd_streams:
+            await client.write_gatt_char(PMD_CONTROL_UUID, stop_command(name), response=True)
+        await client.stop_notify(PMD_DATA_UUID)
+        await client.stop_notify(PMD_CONTROL_UUID)
+
+    async def _stream_fake(self, device: FakePolarDevice):
+        """Same pipeline as _stream_data, fed by a FakePolarDevice instead of a BLE client."""
+        try:
+            self._streaming = True
+            self._connected = True
+            self._start_parser()
+            await device.stream(self.parse_heart_rate_measurement, self.parse_pmd_data, self.pmd_streams,
+                                running=lambda: self._running)
+        finally:
+            self._connected = False
+            self._stop_parser()
+
     def start(self) -> str:
         """Start the Polar manager - SYNCHRONOUS like Vernier"""
+        if self.use_process:
+            return self._start_worker()
         try:
             if self.thread is not None and self.thread.is_alive():
                 print("Stopping existing thread...")
@@ -352,9 +755,71 @@ class PolarManager:
             self._device_started = False
             return f"Error: {e}"
 
+    def _start_worker(self) -> str:
+        """Launch the acquisition worker process, connect the strap in it and start forwarding."""
+        try:
+            if self._worker is not None:
+                self._worker.close()
+            self._worker = DeviceWorker("PolarManager:PolarSource", self._on_worker_rows,
+                                        on_error=self._on_worker_error, capacity=WORKER_CAPACITY_ROWS)
+            self._worker.launch()
+            device = self._worker.open(timeout=30, pmd_streams=self.pmd_streams, fake_device=self.fake_device,
+                                       reconnect_timeout=self.reconnect_timeout)
+            self._device_address = device['address']
+            self._running = True
+            self._streaming = True
+            self._connected = True
+            self._worker.start()
+            self._device_started = True
+            print(f"Polar manager running (worker process, {self._device_address})...")
+            return "Polar device started."
+        except Exception as e:
+            print(f"Error starting Polar device worker: {e}")
+            if self._worker is not None:
+                self._worker.close()
+                self._worker = None
+            self._running = False
+            self._streaming = False
+            self._device_started = False
+            if "No Polar H10 device found" in str(e):
+                return "No Polar H10 device found. Please check that the device is powered on and within range."
+            return f"Error: {e}"
+
+    def _on_worker_rows(self, packets: np.ndarray):
+        """DeviceWorker drain thread: decode and write the packets forwarded by PolarSource."""
+        for packet in packets:
+            tsu = float(packet['timestamp_unix'])
+            payload = packet['payload'][:packet['length']]
+            if packet['kind'] == PACKET_HR:
+                self._process_notification(tsu, payload.tobytes())
+            elif packet['kind'] == PACKET_PMD:
+                self._process_pmd_frame(tsu, payload.tobytes())
+            elif packet['kind'] == PACKET_GAP:
+                gap = payload.view(GAP_PACKET_DTYPE)[0]
+                self._apply_gap(float(gap['start_unix']), tsu, int(gap['attempts']))
+
+    def _on_worker_error(self, error: str):
+        """DeviceWorker drain thread: the strap was lost for good; same handling as _scan_and_connect."""
+        print(f"Error in Polar connection: {error}")
+        self._crashed = True
+        self._num_crashes += 1
+        self._connected = False
+        self._streaming = False
+        self._running = False
+
+    def worker_status(self) -> Optional[dict]:
+        """Acquisition worker process and ring buffer state (see DeviceWorker); None without a worker."""
+        return self._worker.status() if self._worker is not None else None
+
     def stop(self) -> str:
         """Stop data collection - SYNCHRONOUS"""
         try:
+            if self._worker is not None:
+                # Delivers the packets still in the ring buffer before the files close
+                self._worker.stop()
+                self._worker.close()
+                self._worker = None
+                self._connected = False
             self._running = False
             self._streaming = False
             print("Stopping Polar manager...")
@@ -390,108 +855,240 @@ class PolarManager:
         except Exception as e:
             print(f"Error closing HDF5 file: {e}")
 
+        if self._worker is not None:
+            try:
+                self._worker.close()
+            except Exception as e:
+                print(f"Error closing Polar device worker: {e}")
+            self._worker = None
+
         self._device_started = False
         self._device_address = None
+        self._ble_device = None
         self._client = None
         self._dataset = None
         self._event_loop = None
         self._current_row = {
-            "experiment_name": None,
-            "trial_name": None,
-            "subject_id": None,
-            "experimenter_name": None,
             "timestamp_unix": None,
-            "timestamp": None,
             "HR": None,
-            "HRV": None,
-            "event_marker": self._event_marker, 
-            "condition": self._condition      
+            "HRV": None
         }
         self._streaming = False
         self._running = False
         self.hdf5_file = None
-        self._rr_intervals.clear()
+        self._hrv.reset()
+        self._hrv_engine.reset()
+        self.hrv_group = None
+        for stream in self._pmd.values():
+            stream.reset()
+        self.pmd_groups = {}
         self._last_hr = None
-
-    def _resize_dataset(self, new_size):
-        """Resize the HDF5 dataset."""
-        try:
-            current_size = self._dataset.shape[0]
-            if new_size > current_size:
-                self._dataset.resize(new_size, axis=0)
-        except Exception as e:
-            print(f"Error resizing dataset: {e}")
+        self._hr_notifications = 0
+        self._hr_dropped = 0
+        self._first_notification_time = None
+        self._last_notification_time = None
+        self.gaps_group = None
+        self._connected = False
+        self._disconnected_since = None
+        self._reconnects = 0
+        self._last_reconnect_seconds = None
+        self._total_gap_seconds = 0.0
 
     def write_to_hdf5(self, row: dict) -> None:
         """Write data to HDF5."""
         try:
-            if self.hdf5_file is None or self._dataset is None:
+            if self._appender is None:
                 print("HDF5 file or dataset is not initialized.")
                 return
 
-            new_data = np.zeros(1, dtype=self._dataset.dtype)  
-            new_data[0]['experiment_name'] = row.get('experiment_name', '')
-            new_data[0]['trial_name'] = row.get('trial_name', '')
-            new_data[0]['subject_id'] = row.get('subject_id', '')
-            new_data[0]['experimenter_name'] = row.get('experimenter_name', '')
-            new_data[0]['timestamp_unix'] = row.get('timestamp_unix', np.nan)
-            new_data[0]['timestamp'] = row.get('timestamp', '')  
-            new_data[0]['HR'] = row.get('HR', np.nan)
-            new_data[0]['HRV'] = row.get('HRV', np.nan)
-            new_data[0]['event_marker'] = row.get('event_marker', '')
-            new_data[0]['condition'] = row.get('condition', '')
-
-            new_size = self._dataset.shape[0] + 1
-            self._resize_dataset(new_size)  
-            self._dataset[-1] = new_data[0]
+            if is_schema_v1(self._dataset):
+                # Existing version 1 file: keep filling the columns rows no longer carry
+                row = legacy_row(row, self._metadata(), 'timestamp', local_iso=True,
+                                 extra={'event_marker': self.event_marker, 'condition': self.condition})
+            self._appender.append(row)
 
         except Exception as e:
             print(f"Error writing to HDF5: {e}")
 
+    def recent_rows(self, seconds: float = None):
+        """Newest rows kept in memory by the appender (see HDF5Appender.recent); None when not recording."""
+        if self._appender is None:
+            return None
+        return self._appender.recent(seconds)
+
+    def recent_hrv_features(self, seconds: float = None):
+        """Newest HRV feature rows kept in memory; None when not recording."""
+        if self._hrv_appender is None:
+            return None
+        return self._hrv_appender.recent(seconds)
+
+    @property
+    def latest_hrv_features(self) -> Optional[dict]:
+        """Most recent HRV feature row computed by the engine (also while not recording)."""
+        return self._hrv_engine.latest
+
+    def _finalize_stream(self, parent):
+        """Close-time objects written beside 'data': markers table, marker row index, summary pyramid."""
+        if self._deferred_metadata is not None:
+            write_metadata_attrs(parent['data'], self._deferred_metadata)
+            self._deferred_metadata = None
+        self.marker_timeline.write_to_hdf5(parent)
+        write_marker_index(parent)
+        write_pyramid(parent)
+
     def close_h5_file(self):
         """Close the HDF5 file."""
-        if self.hdf5_file:
-            self.hdf5_file.flush()
-            self.hdf5_file.close()
+        if self._hrv_appender is not None:
+            self._hrv_appender.close()
+            self._hrv_appender = None
+        if self._gap_appender is not None:
+            self._gap_appender.close()
+            self._gap_appender = None
+        if self._marker_log is not None:
+            self._marker_log.close()
+            self._marker_log = None
+        for appender in self._pmd_appenders.values():
+            appender.close()
+        self._pmd_appenders = {}
+        if self.hdf5_group is not None and self._appender is not None:
+            self._appender.close(finalize=self._finalize_stream)
+            self._appender = None
+            print(f"Stream '{self.hdf5_group}' closed in session file '{self.hdf5_filename}'.")
+        elif self.hdf5_file:
+            if self._appender is not None:
+                self._appender.close()
+                self._appender = None
+            close_stream_file(self.hdf5_file, finalize=self._finalize_stream)
             print(f"HDF5 file '{self.hdf5_filename}' closed.")
         else:
             print("HDF5 file is already closed or isn't initialized.")
         
-    def hdf5_to_csv(self):
-        """Convert HDF5 to CSV."""
+    def hdf5_to_csv(self, progress=print_progress):
+        """
+        Convert HDF5 to CSV.
+
+        Returns:
+            int: Rows written, or None if the conversion failed.
+        """
         try:
-            chunk_size = 1000
-            with h5py.File(self.hdf5_filename, 'r') as h5_file:
-                if 'data' not in h5_file:
-                    print(f"Dataset 'data' not found in the file {self.hdf5_filename}.")
-                    return
-                
-                dataset = h5_file['data']
-                field_names = dataset.dtype.names
-                first_chunk = True
-
-                for start in range(0, dataset.shape[0], chunk_size):
-                    end = min(start + chunk_size, dataset.shape[0])
-                    chunk = dataset[start:end]
-
-                    chunk_dict = {
-                        field: np.char.decode(chunk[field], 'utf-8') if chunk[field].dtype.kind == 'S' 
-                            else [x.decode('utf-8') if isinstance(x, bytes) else x for x in chunk[field]]
-                        for field in field_names
-                    }
-
-                    chunk_df = pd.DataFrame(chunk_dict)
-
-                    if first_chunk:
-                        chunk_df.to_csv(self.csv_filename, mode='w', index=False, header=True)
-                        first_chunk = False
-                    else:
-                        chunk_df.to_csv(self.csv_filename, mode='a', header=False, index=False)
-            
+            rows = export_hdf5_to_csv(self.hdf5_filename, self.csv_filename, iso_column='timestamp',
+                                      progress=progress, label='Polar', group=self.hdf5_group)
             print("CSV file created successfully.")
             print(f"HDF5 file '{self.hdf5_filename}' successfully converted to CSV file '{self.csv_filename}'.")
-        
+            return rows
+
+        except FileNotFoundError:
+            print(f"Error: The HDF5 file '{self.hdf5_filename}' was not found.")
+        except Exception as e:
+            print(f"Error converting HDF5 to CSV: {e}")
+
+    def hdf5_to_parquet(self, progress=print_progress):
+        """
+        Convert HDF5 to a Parquet file next to the CSV (see ParquetStore).
+
+        Returns:
+            int: Rows written, or None if the conversion failed.
+        """
+        try:
+            parquet_filename = parquet_path_for(self.csv_filename)
+            rows = export_hdf5_to_parquet(self.hdf5_filename, parquet_filename, iso_column='timestamp',
+                                          progress=progress, label='Polar', group=self.hdf5_group)
+            print(f"HDF5 file '{self.hdf5_filename}' successfully converted to Parquet file '{parquet_filename}'.")
+            return rows
+
         except FileNotFoundError:
             print(f"Error: The HDF5 file '{self.hdf5_filename}' was not found.")
         except Exception as e:
-            print(f"Error converting HDF5 to CSV: {e}")
\ No newline at end of file
+            print(f"Error converting HDF5 to Parquet: {e}")
+
+
+class _PacketForwarder:
+    """
+    Stands in for the notification queue and the gaps appender of the PolarManager inside a
+    PolarSource. put() runs in the BLE callback and only enqueues (tsu, kind, data); the
+    worker loop turns the queued items into PACKET_DTYPE rows (to_packets).
+    """
+
+    def __init__(self):
+        self.items = queue.SimpleQueue()
+        self.oversized = 0
+
+    def put(self, item):
+        if item is None:
+            return
+        _, tsu, data, kind = item
+        self.items.put((tsu, kind, data))
+
+    def append(self, gap: dict):
+        payload = np.array([(gap['start_unix'], gap['attempts'])], dtype=GAP_PACKET_DTYPE).tobytes()
+        self.items.put((gap['end_unix'], PACKET_GAP, payload))
+
+    def close(self):
+        pass
+
+    def to_packets(self, items: list) -> np.ndarray:
+        """PACKET_DTYPE rows of queued (tsu, kind, payload) items; oversized payloads are counted and skipped."""
+        packets = np.zeros(len(items), dtype=PACKET_DTYPE)
+        n = 0
+        for tsu, kind, payload in items:
+            if len(payload) > PACKET_PAYLOAD_BYTES:
+                self.oversized += 1
+                continue
+            packets['timestamp_unix'][n] = tsu
+            packets['kind'][n] = kind
+            packets['length'][n] = len(payload)
+            packets['payload'][n, :len(payload)] = np.frombuffer(payload, dtype=np.uint8)
+            n += 1
+        return packets[:n]
+
+
+class PolarSource:
+    """
+    Polar strap acquisition for a DeviceWorker process ("PolarManager:PolarSource"): a
+    PolarManager without files scans, connects and reconnects, and every notification it
+    timestamps is returned as a PACKET_DTYPE row for the recording process to decode.
+    """
+    dtype = PACKET_DTYPE
+
+    def __init__(self):
+        self._forwarder = _PacketForwarder()
+        self._manager = None
+
+    def open(self, pmd_streams: tuple = (), fake_device: bool = False,
+             reconnect_timeout: Optional[float] = DEFAULT_RECONNECT_TIMEOUT) -> dict:
+        """Find and connect the strap (RuntimeError if none is found)."""
+        self._manager = PolarManager(pmd_streams=pmd_streams, fake_device=fake_device,
+                                     notifications=self._forwarder, reconnect_timeout=reconnect_timeout)
+        self._manager._gap_appender = self._forwarder
+        result = self._manager.start()
+        if not self._manager.device_started:
+            raise RuntimeError(result)
+        return {'address': self._manager._device_address}
+
+    def read_block(self) -> Optional[np.ndarray]:
+        """Packets queued since the last call (waits up to 50 ms for the first one)."""
+        try:
+            items = [self._forwarder.items.get(timeout=0.05)]
+        except queue.Empty:
+            # The manager stops running when the strap could not be reconnected in time
+            if self._manager is not None and not self._manager.running:
+                raise ConnectionError("Polar H10 connection lost")
+            return None
+        while True:
+            try:
+                items.append(self._forwarder.items.get_nowait())
+            except queue.Empty:
+                break
+        return self._forwarder.to_packets(items)
+
+    def status(self) -> dict:
+        if self._manager is None:
+            return {}
+        return dict(self._manager.connection_stats(), address=self._manager._device_address,
+                    oversized_packets=self._forwarder.oversized)
+
+    def close(self) -> None:
+        if self._manager is not None:
+            self._manager.running = False
+            if self._manager.thread is not None:
+                self._manager.thread.join(timeout=10)
@@ -0,0 +1,262 @@
+"""
+PolarPMD Module
+
+Raw waveform streaming from Polar straps through the Polar Measurement Data (PMD) GATT
+service: ECG at 130 Hz and accelerometer at up to 200 Hz on the H10, next to the ~1 Hz
+HR/RR of the standard Heart Rate Measurement characteristic.
+
+PROTOCOL:
+    Control point (write + indicate):  start = [0x02, type, (setting, 1, uint16 value)...]
+                                       stop  = [0x03, type]
+    Data (notify), one frame per notification:
+        byte 0      measurement type (0 = ECG, 2 = ACC)
+        bytes 1-8   device timestamp of the last sample (uint64, ns)
+        byte 9      frame type (sample encoding)
+        bytes 10-   samples: ECG frame 0 = int24 uV; ACC frame 0/1/2 = int8/int16/int24 x,y,z in mG
+    Delta-compressed frames (frame type bit 7) are counted as unsupported and skipped.
+
+DECODING:
+    Each frame is decoded with one np.frombuffer over the payload (int24 values are
+    assembled from the byte columns) and becomes a structured block of rows written with
+    HDF5Appender.append_rows, so a 130 Hz stream costs one append per notification.
+    Sample times are the device timestamps mapped onto the host clock with the offset
+    observed at the first frame, spaced 1 / sample_rate apart.
+
+DROPS:
+    A frame whose first sample is more than 1.5 sample periods after the previous frame's
+    last sample adds the missing samples to dropped_samples.
+
+FakePolarDevice produces HR notifications and PMD frames with the same byte layout at
+the device rate, so the whole pipeline runs without a strap (PolarManager(fake_device=True)).
+"""
+import asyncio
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+import numpy as np
+
+PMD_SERVICE_UUID = "fb005c80-02e7-f387-1cad-8acd2d8df0c8"
+PMD_CONTROL_UUID = "fb005c81-02e7-f387-1cad-8acd2d8df0c8"
+PMD_DATA_UUID = "fb005c82-02e7-f387-1cad-8acd2d8df0c8"
+
+PMD_ECG = 0
+PMD_ACC = 2
+PMD_START = 0x02
+PMD_STOP = 0x03
+SETTING_SAMPLE_RATE = 0
+SETTING_RESOLUTION = 1
+SETTING_RANGE = 2
+PMD_HEADER_BYTES = 10
+COMPRESSED_FRAME = 0x80
+
+ECG_DTYPE = np.dtype([
+    ('timestamp_unix', 'f8'),
+    ('ecg_uv', 'i4'),
+])
+ACC_DTYPE = np.dtype([
+    ('timestamp_unix', 'f8'),
+    ('acc_x', 'i4'),
+    ('acc_y', 'i4'),
+    ('acc_z', 'i4'),
+])
+
+# name -> measurement type, dtype and start settings {setting: value}
+PMD_STREAMS = {
+    'ecg': {'type': PMD_ECG, 'dtype': ECG_DTYPE,
+            'settings': {SETTING_SAMPLE_RATE: 130, SETTING_RESOLUTION: 14}},
+    'acc': {'type': PMD_ACC, 'dtype': ACC_DTYPE,
+            'settings': {SETTING_SAMPLE_RATE: 200, SETTING_RESOLUTION: 16, SETTING_RANGE: 8}},
+}
+# Bytes per sample value of each uncompressed ACC frame type
+ACC_FRAME_BYTES = {0x00: 1, 0x01: 2, 0x02: 3}
+
+
+def start_command(name: str) -> bytearray:
+    """Control point command starting a PMD stream with its PMD_STREAMS settings."""
+    spec = PMD_STREAMS[name]
+    command = bytearray([PMD_START, spec['type']])
+    for setting, value in spec['settings'].items():
+        command += bytes([setting, 1]) + int(value).to_bytes(2, 'little')
+    return command
+
+
+def stop_command(name: str) -> bytearray:
+    return bytearray([PMD_STOP, PMD_STREAMS[name]['type']])
+
+
+def _decode_ints(payload: np.ndarray, width: int) -> np.ndarray:
+    """Little-endian signed integers of 1, 2 or 3 bytes from a uint8 array."""
+    if width == 1:
+        return payload.view(np.int8).astype(np.int32)
+    if width == 2:
+        return payload[:len(payload) // 2 * 2].view('<i2').astype(np.int32)
+    b = payload[:len(payload) // 3 * 3].reshape(-1, 3).astype(np.int32)
+    values = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+    return np.where(values & 0x800000, values - 0x1000000, values)
+
+
+def decode_frame(data) -> Optional[tuple]:
+    """
+    Decode one PMD data notification.
+
+    Returns:
+        (int, int, np.ndarray) | None: measurement type, device timestamp (ns) of the last
+            sample and the samples (ECG: shape (n,), ACC: shape (n, 3)); None for
+            compressed or unknown frames.
+    """
+    if len(data) < PMD_HEADER_BYTES:
+        return None
+    measurement_type = data[0]
+    device_ns = int.from_bytes(bytes(data[1:9]), 'little')
+    frame_type = data[9]
+    if frame_type & COMPRESSED_FRAME:
+        return None
+    payload = np.frombuffer(data, dtype=np.uint8, offset=PMD_HEADER_BYTES)
+    if measurement_type == PMD_ECG and frame_type == 0x00:
+        return measurement_type, device_ns, _decode_ints(payload, 3)
+    if measurement_type == PMD_ACC and frame_type in ACC_FRAME_BYTES:
+        width = ACC_FRAME_BYTES[frame_type]
+        samples = _decode_ints(payload[:len(payload) // (3 * width) * 3 * width], width)
+        return measurement_type, device_ns, samples.reshape(-1, 3)
+    return None
+
+
+class PMDStream:
+    """Decoding state and counters of one PMD measurement of one device."""
+
+    def __init__(self, name: str):
+        spec = PMD_STREAMS[name]
+        self.name = name
+        self.measurement_type = spec['type']
+        self.dtype = spec['dtype']
+        self.sample_rate = float(spec['settings'][SETTING_SAMPLE_RATE])
+        self.reset()
+
+    def reset(self) -> None:
+        self.samples = 0
+        self.frames = 0
+        self.dropped_samples = 0
+        self.unsupported_frames = 0
+        self._offset = None
+        self._last_device_time = None
+        self._first_host_time = None
+        self._first_frame_samples = 0
+        self._last_host_time = None
+
+    def frame_rows(self, tsu: float, data) -> Optional[np.ndarray]:
+        """Rows (self.dtype) of one data notification received at host time tsu, or None."""
+        decoded = decode_frame(data)
+        if decoded is None or decoded[0] != self.measurement_type:
+            self.unsupported_frames += 1
+            return None
+        _, device_ns, samples = decoded
+        n = len(samples)
+        if n == 0:
+            return None
+
+        period = 1.0 / self.sample_rate
+        last = device_ns * 1e-9
+        first = last - (n - 1) * period
+        if self._offset is None:
+            self._offset = tsu - last
+            self._first_host_time = tsu
+            self._first_frame_samples = n
+        elif first - self._last_device_time > 1.5 * period:
+            self.dropped_samples += int(round((first - self._last_device_time) / period)) - 1
+        self._last_device_time = last
+        self._last_host_time = tsu
+        self.samples += n
+        self.frames += 1
+
+        rows = np.empty(n, dtype=self.dtype)
+        rows['timestamp_unix'] = first + self._offset + np.arange(n) * period
+        if samples.ndim == 1:
+            rows['ecg_uv'] = samples
+        else:
+            rows['acc_x'], rows['acc_y'], rows['acc_z'] = samples[:, 0], samples[:, 1], samples[:, 2]
+        return rows
+
+    def stats(self) -> dict:
+        """Counters and the achieved sample rate (samples received per host second after the first frame)."""
+        elapsed = (self._last_host_time - self._first_host_time) if self.frames > 1 else 0.0
+        received = self.samples - self._first_frame_samples
+        return {
+            'samples': self.samples,
+            'frames': self.frames,
+            'dropped_samples': self.dropped_samples,
+            'unsupported_frames': self.unsupported_frames,
+            'nominal_rate_hz': self.sample_rate,
+            'rate_hz': round(received / elapsed, 2) if elapsed > 0 else None,
+        }
+
+
+class FakePolarDevice:
+    """
+    Stand-in for a Polar strap: HR notifications (with RR) once per second and PMD ECG/ACC
+    frames at the device rate, delivered to bleak-style callbacks(sender, data).
+    """
+
+    def __init__(self, name: str = "Polar H10 FAKE0001", address: str = "00:00:00:00:00:00",
+                 hr_bpm: float = 70.0, ecg_frame_samples: int = 73, acc_frame_samples: int = 36, seed: int = 0):
+        self.name = name
+        self.address = address
+        self.hr_bpm = hr_bpm
+        self.ecg_frame_samples = ecg_frame_samples
+        self.acc_frame_samples = acc_frame_samples
+        self._rng = np.random.default_rng(seed)
+        self._device_start_ns = 0
+
+    def hr_packet(self) -> bytearray:
+        """Heart Rate Measurement value: uint8 HR and the RR intervals of the last second."""
+        rr_s = 60.0 / self.hr_bpm + self._rng.normal(0, 0.02)
+        rr_units = int(round(rr_s * 1024))
+        return bytearray([0x10, int(round(self.hr_bpm))]) + rr_units.to_bytes(2, 'little')
+
+    def pmd_frame(self, name: str, first_sample: int) -> bytearray:
+        """PMD data frame of the configured size starting at sample index first_sample."""
+        spec = PMD_STREAMS[name]
+        rate = spec['settings'][SETTING_SAMPLE_RATE]
+        n = self.ecg_frame_samples if name == 'ecg' else self.acc_frame_samples
+        index = first_sample + np.arange(n)
+        t = index / rate
+        last_ns = self._device_start_ns + int(round(t[-1] * 1e9))
+        header = bytearray([spec['type']]) + last_ns.to_bytes(8, 'little')
+        if name == 'ecg':
+            # Narrow R peaks at the heart rate on a small baseline wander
+            phase = (t * self.hr_bpm / 60.0) % 1.0
+            ecg = 1200 * np.exp(-((phase - 0.5) / 0.012) ** 2) + 80 * np.sin(2 * np.pi * 0.25 * t)
+            values = np.round(ecg + self._rng.normal(0, 10, n)).astype('<i4')
+            payload = values.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+            return header + bytearray([0x00]) + payload
+        acc = np.stack([np.full(n, 20.0), np.full(n, -990.0), 40 * np.sin(2 * np.pi * 0.25 * t)], axis=1)
+        values = np.round(acc + self._rng.normal(0, 5, acc.shape)).astype('<i2')
+        return header + bytearray([0x01]) + values.tobytes()
+
+    async def stream(self, on_hr: Callable, on_pmd: Callable, pmd_streams: Iterable[str] = (),
+                     running: Callable[[], bool] = lambda: True, tick: float = 0.02) -> None:
+        """Deliver notifications in real time until running() returns False."""
+        self._device_start_ns = int(self._rng.integers(1, 10**12))
+        start = time.monotonic()
+        next_hr = 0.0
+        sent = {name: 0 for name in pmd_streams}
+        while running():
+            elapsed = time.monotonic() - start
+            if elapsed >= next_hr:
+                on_hr(self.address, self.hr_packet())
+                next_hr += 1.0
+            for name in sent:
+                rate = PMD_STREAMS[name]['settings'][SETTING_SAMPLE_RATE]
+                frame_samples = self.ecg_frame_samples if name == 'ecg' else self.acc_frame_samples
+                # A frame is sent once all of its samples have been "measured"
+                while (sent[name] + frame_samples) / rate <= elapsed:
+                    on_pmd(self.address, self.pmd_frame(name, sent[name]))
+                    sent[name] += frame_samples
+            await asyncio.sleep(tick)
+
+
+def pmd_streams_for(names: Iterable[str]) -> Dict[str, PMDStream]:
+    """PMDStream objects for the requested names (ValueError on unknown names)."""
+    unknown = set(names) - set(PMD_STREAMS)
+    if unknown:
+        raise ValueError(f"Unknown PMD streams {sorted(unknown)}; use {tuple(PMD_STREAMS)}")
+    return {name: PMDStream(name) for name in names}
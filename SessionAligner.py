@@ -0,0 +1,407 @@
+"""
+SessionAligner Module
+
+Puts every stream recorded for one subject on a common timeline and writes it as a
+single table, so analysis starts from one aligned frame instead of six files with
+different rates and clocks.
+
+STREAMS (found in the subject directory):
+    event_markers   <date>_<subject>_event_markers.h5 (markers interval table, or the rows)
+    cardiac         cardiac_data/*_cardiac_data_<N>.h5 (all crash-numbered files, in time order)
+    cardiac_<LABEL> cardiac_data/*_cardiac_data_<LABEL>_<N>.h5, one stream per strap of a
+                    PolarHub group session (never merged into one HR series)
+    respiratory     respiratory_data/*_respiratory_data_<N>.h5
+                    (or the /event_markers, /cardiac (/cardiac/<LABEL> for a hub),
+                    /respiratory groups of *_session.h5)
+    emotibit_<TAG>  emotibit_data/*_<TAG>.csv (LocalTimestamp, metric in the last column)
+    ser             *_SER.csv (timestamp_unix, SER_* columns)
+    audio           <date>_<exp>_<trial>_<subject>.csv (unix_timestamp .. time_stopped_unix)
+
+ALIGNMENT:
+    The grid is t_start + k / rate_hz over the span of all sensor streams. Every stream
+    is joined onto it as-of (last sample at or before each grid time) with one
+    np.searchsorted per stream; a grid row gets NaN/None when the last sample is older
+    than the stream's tolerance, or, for streams with an interval end (audio), when the
+    grid time is past the end of that interval. method='linear' interpolates numeric
+    sensor columns between neighbouring samples instead (still NaN across gaps).
+    event_marker/condition come from the markers interval table (MarkerTable.lookup).
+
+OUTPUT (in the subject directory):
+    <subject>_aligned.parquet   (needs pyarrow)
+    <subject>_aligned.h5        /data: timestamp_unix, event_marker, condition, <stream>_<column>...
+
+    python SessionAligner.py experiments/subject_data/<exp>/<trial>/<subject> --rate 10
+"""
+import argparse
+import glob
+import os
+import re
+from typing import Dict, Iterable, Optional, Tuple
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from HDF5Appender import METADATA_FIELDS, create_stream_dataset, valid_rows
+from HDF5Exporter import structured_to_frame
+from LiveReader import open_live_file
+from MarkerTimeline import MarkerTable, attach_markers
+from ParquetStore import PARQUET_AVAILABLE, write_frame_to_parquet
+
+TIME_FIELD = 'timestamp_unix'
+END_FIELD = 'end_unix'
+DEFAULT_ALIGN_RATE_HZ = 10.0
+ALIGN_METHODS = ("asof", "linear")
+ALIGN_FORMATS = ("parquet", "hdf5")
+ALIGNED_SUFFIX = '_aligned'
+
+# Oldest sample (seconds) a grid row may take from each kind of stream; None = no limit.
+# The Polar strap reports about once per second, Vernier at 10 Hz, EmotiBit at 15-25 Hz.
+DEFAULT_TOLERANCES = {
+    'event_markers': None,
+    'cardiac': 3.0,
+    'respiratory': 1.0,
+    'emotibit': 1.0,
+    'ser': 10.0,
+    'audio': None,
+}
+# Streams that define the grid span (SER/audio rows only mark utterances)
+SENSOR_KINDS = ('cardiac', 'respiratory', 'emotibit')
+
+ALIGNED_LAYOUT = {"chunk_rows": 16384, "compression": "gzip", "compression_opts": 4, "shuffle": True}
+SESSION_GROUPS = ('event_markers', 'cardiac', 'respiratory')
+AUDIO_COLUMNS = ('audio_file', 'transcription', 'question_set', 'question_index')
+# Columns already on the grid (markers) or constant per session
+SKIP_COLUMNS = {'event_marker', 'condition', 'pid', 'class_name', *METADATA_FIELDS}
+
+
+def stream_kind(name: str) -> str:
+    """'emotibit_EA' -> 'emotibit', 'cardiac_ABCD1234' -> 'cardiac'; other stream names are their own kind."""
+    if name.startswith('emotibit_'):
+        return 'emotibit'
+    return 'cardiac' if name.startswith('cardiac_') else name
+
+
+def _crash_number(path: str) -> int:
+    match = re.search(r'_(\d+)\.h5$', path)
+    return int(match.group(1)) if match else 0
+
+
+def _stream_file_name(path: str, name: str) -> str:
+    """'cardiac' for <date>_<subject>_cardiac_data_<N>.h5, 'cardiac_<LABEL>' for a hub strap's file."""
+    match = re.search(rf'_{name}_data_(?:(.+)_)?\d+\.h5$', os.path.basename(path))
+    return f'{name}_{match.group(1)}' if match and match.group(1) else name
+
+
+def _session_cardiac_groups(h5_file) -> Dict[str, str]:
+    """{stream name: group} of the cardiac data in a session file: /cardiac, or /cardiac/<LABEL> per hub strap."""
+    if 'cardiac' not in h5_file:
+        return {}
+    cardiac = h5_file['cardiac']
+    if 'data' in cardiac:
+        return {'cardiac': 'cardiac'}
+    return {f'cardiac_{label}': f'cardiac/{label}' for label in cardiac
+            if isinstance(cardiac[label], h5py.Group) and 'data' in cardiac[label]}
+
+
+def _read_hdf5_stream(sources: Iterable[Tuple[str, Optional[str]]]) -> Tuple[pd.DataFrame, Optional[MarkerTable]]:
+    """Concatenate the valid rows of (filename, group) stream sources; also return the first markers table."""
+    frames, table = [], None
+    for filename, group in sources:
+        with open_live_file(filename) as h5_file:
+            parent = h5_file[group] if group else h5_file
+            if 'data' not in parent:
+                continue
+            dataset = parent['data']
+            frames.append(structured_to_frame(dataset[:valid_rows(dataset)]))
+            if table is None:
+                table = MarkerTable.read_from_hdf5(parent)
+    if not frames:
+        return pd.DataFrame(), table
+    return pd.concat(frames, ignore_index=True), table
+
+
+def _read_emotibit_csv(csv_path: str) -> Tuple[str, pd.DataFrame]:
+    """One DataParser per-type CSV -> ('emotibit_<TAG>', frame of timestamp_unix and the metric)."""
+    tag = os.path.splitext(os.path.basename(csv_path))[0].split('_')[-1]
+    name = f'emotibit_{tag}'
+    df = pd.read_csv(csv_path)
+    return name, pd.DataFrame({TIME_FIELD: df['LocalTimestamp'].astype('f8'), name: df[df.columns[-1]]})
+
+
+def _read_ser_csv(csv_path: str) -> pd.DataFrame:
+    df = pd.read_csv(csv_path)
+    columns = [column for column in df.columns if column.startswith('SER_')]
+    return df[[TIME_FIELD] + columns]
+
+
+def _read_audio_csv(csv_path: str) -> pd.DataFrame:
+    df = pd.read_csv(csv_path)
+    out = pd.DataFrame({TIME_FIELD: df['unix_timestamp'].astype('f8')})
+    if 'time_stopped_unix' in df.columns:
+        out[END_FIELD] = pd.to_numeric(df['time_stopped_unix'], errors='coerce')
+    for column in AUDIO_COLUMNS:
+        if column in df.columns:
+            out[column] = df[column]
+    return out
+
+
+def collect_subject_streams(subject_dir: str) -> Tuple[Dict[str, pd.DataFrame], Optional[MarkerTable]]:
+    """
+    Load every stream of a subject directory (see STREAMS).
+
+    Returns:
+        (dict, MarkerTable | None): {stream name: DataFrame with timestamp_unix} and the
+            markers interval table (from the event file when it has one).
+    """
+    subject_dir = os.path.abspath(subject_dir)
+    hdf5_sources = {name: [] for name in SESSION_GROUPS}
+    hdf5_sources['event_markers'] = [(path, None) for path in
+                                     sorted(glob.glob(os.path.join(subject_dir, '*_event_markers.h5')))]
+    for name in ('cardiac', 'respiratory'):
+        paths = glob.glob(os.path.join(subject_dir, f'{name}_data', f'*_{name}_data_*.h5'))
+        for path in sorted(paths, key=_crash_number):
+            hdf5_sources.setdefault(_stream_file_name(path, name), []).append((path, None))
+    for session_file in sorted(glob.glob(os.path.join(subject_dir, '*_session.h5'))):
+        with open_live_file(session_file) as h5_file:
+            groups = {name: name for name in SESSION_GROUPS if name != 'cardiac' and name in h5_file}
+            groups.update(_session_cardiac_groups(h5_file))
+        for name, group in groups.items():
+            hdf5_sources.setdefault(name, []).append((session_file, group))
+
+    streams, table = {}, None
+    for name in hdf5_sources:
+        df, stream_table = _read_hdf5_stream(hdf5_sources[name])
+        if table is None:
+            table = stream_table
+        if not df.empty:
+            streams[name] = df
+
+    for csv_path in sorted(glob.glob(os.path.join(subject_dir, 'emotibit_data', '*.csv'))):
+        try:
+            name, df = _read_emotibit_csv(csv_path)
+        except (KeyError, ValueError, pd.errors.ParserError) as e:
+            print(f"Skipping EmotiBit file {csv_path}: {e}")
+            continue
+        streams[name] = pd.concat([streams[name], df], ignore_index=True) if name in streams else df
+
+    for csv_path in sorted(glob.glob(os.path.join(subject_dir, '*.csv'))):
+        filename = os.path.basename(csv_path)
+        if filename.endswith(('_event_markers.csv', '_ground_truth.csv')):
+            continue
+        try:
+            if filename.endswith('_SER.csv'):
+                streams['ser'] = _read_ser_csv(csv_path)
+            elif 'unix_timestamp' in pd.read_csv(csv_path, nrows=0).columns:
+                streams['audio'] = _read_audio_csv(csv_path)
+        except (KeyError, ValueError, pd.errors.ParserError) as e:
+            print(f"Skipping {csv_path}: {e}")
+
+    for name, df in streams.items():
+        df = df[np.isfinite(df[TIME_FIELD].to_numpy(dtype='f8'))]
+        streams[name] = df.sort_values(TIME_FIELD, kind='stable').reset_index(drop=True)
+    return streams, table
+
+
+def make_grid(streams: Dict[str, pd.DataFrame], rate_hz: float = DEFAULT_ALIGN_RATE_HZ) -> np.ndarray:
+    """Grid timestamps covering the sensor streams (all streams if there are none)."""
+    if rate_hz <= 0:
+        raise ValueError("rate_hz must be positive")
+    spans = [df[TIME_FIELD] for name, df in streams.items() if stream_kind(name) in SENSOR_KINDS and len(df)]
+    if not spans:
+        spans = [df[TIME_FIELD] for df in streams.values() if len(df)]
+    if not spans:
+        return np.zeros(0)
+    t_start = min(float(ts.iloc[0]) for ts in spans)
+    t_end = max(float(ts.iloc[-1]) for ts in spans)
+    n = int(np.floor((t_end - t_start) * rate_hz)) + 1
+    return t_start + np.arange(n) / rate_hz
+
+
+def align_stream(df: pd.DataFrame, grid: np.ndarray, tolerance: Optional[float] = None,
+                 method: str = "asof", prefix: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """
+    Join one stream onto grid timestamps.
+
+    Args:
+        df (pd.DataFrame): Rows sorted by timestamp_unix; an end_unix column bounds each row's validity.
+        grid (np.ndarray): Grid timestamps (sorted).
+        tolerance (float): Maximum age in seconds of the sample used for a grid row (None = no limit).
+        method (str): 'asof' or 'linear' (numeric columns interpolated between neighbours).
+        prefix (str): Output column prefix ('<prefix>_<column>'; columns already starting with it are kept as is).
+
+    Returns:
+        dict: {column: values on the grid}; NaN (numeric) or None where no sample applies.
+    """
+    if method not in ALIGN_METHODS:
+        raise ValueError(f"method must be one of {ALIGN_METHODS}")
+
+    ts = df[TIME_FIELD].to_numpy(dtype='f8')
+    idx = np.searchsorted(ts, grid, side='right') - 1
+    valid = idx >= 0
+    idx = np.clip(idx, 0, None)
+    if END_FIELD in df.columns:
+        valid &= grid < df[END_FIELD].to_numpy(dtype='f8')[idx]
+    elif tolerance is not None:
+        valid &= grid - ts[idx] <= tolerance
+
+    if method == "linear":
+        # Both neighbours must lie within the tolerance of the grid time
+        nxt = np.clip(idx + 1, 0, len(ts) - 1)
+        linear_valid = valid & (ts[nxt] >= grid)
+        if tolerance is not None:
+            linear_valid &= ts[nxt] - grid <= tolerance
+
+    columns = {}
+    for column in df.columns:
+        if column in (TIME_FIELD, END_FIELD) or column in SKIP_COLUMNS:
+            continue
+        name = column if prefix is None or column.lower().startswith(prefix.lower()) else f'{prefix}_{column}'
+        values = df[column].to_numpy()
+        if values.dtype.kind in 'fiub':
+            values = values.astype('f8')
+            if method == "linear" and len(ts) > 1:
+                out = np.interp(grid, ts, values)
+                out[~linear_valid] = np.nan
+            else:
+                out = values[idx]
+                out[~valid] = np.nan
+        else:
+            out = values.astype(object)[idx]
+            out[~valid] = None
+        columns[name] = out
+    return columns
+
+
+def align_streams(streams: Dict[str, pd.DataFrame], rate_hz: float = DEFAULT_ALIGN_RATE_HZ,
+                  table: Optional[MarkerTable] = None, tolerances: Optional[dict] = None,
+                  method: str = "asof", clock_offsets: Optional[Dict[str, float]] = None) -> pd.DataFrame:
+    """
+    Align streams onto one grid.
+
+    Args:
+        streams (dict): {stream name: DataFrame with timestamp_unix}, e.g. from collect_subject_streams().
+        rate_hz (float): Grid rate.
+        table (MarkerTable): Markers for event_marker/condition; without it the event_markers stream is joined as-of.
+        tolerances (dict): Overrides of DEFAULT_TOLERANCES by stream kind.
+        method (str): 'asof' or 'linear' for the sensor streams (markers, SER and audio are always as-of).
+        clock_offsets (dict): Seconds added to a stream's timestamps to bring it onto the unix clock.
+
+    Returns:
+        pd.DataFrame: One row per grid time.
+    """
+    tolerances = {**DEFAULT_TOLERANCES, **(tolerances or {})}
+    clock_offsets = clock_offsets or {}
+    streams = dict(streams)
+    for name, offset in clock_offsets.items():
+        if name in streams and offset:
+            shifted = streams[name].copy()
+            shifted[TIME_FIELD] += offset
+            if END_FIELD in shifted.columns:
+                shifted[END_FIELD] += offset
+            streams[name] = shifted
+
+    grid = make_grid(streams, rate_hz)
+    aligned = pd.DataFrame({TIME_FIELD: grid})
+    events = streams.pop('event_markers', None)
+    if table is not None and len(table):
+        aligned = attach_markers(aligned, table)
+    elif events is not None:
+        # Same semantics as MarkerTable.lookup: rows before the first event get its labels
+        idx = np.searchsorted(events[TIME_FIELD].to_numpy(dtype='f8'), grid, side='right') - 1
+        np.clip(idx, 0, None, out=idx)
+        aligned['event_marker'] = events['event_marker'].to_numpy(dtype=object)[idx]
+        aligned['condition'] = events['condition'].to_numpy(dtype=object)[idx]
+
+    for name, df in streams.items():
+        kind = stream_kind(name)
+        stream_method = method if kind in SENSOR_KINDS else "asof"
+        for column, values in align_stream(df, grid, tolerances.get(kind), stream_method, prefix=name).items():
+            aligned[column] = values
+    return aligned
+
+
+def write_aligned_hdf5(df: pd.DataFrame, hdf5_path: str, attrs: Optional[dict] = None) -> int:
+    """Write an aligned frame as /data (numeric columns f8, others vlen strings). Replaces the file."""
+    string_dtype = h5py.string_dtype(encoding='utf-8')
+    fields = []
+    for column in df.columns:
+        numeric = pd.api.types.is_numeric_dtype(df[column]) and not pd.api.types.is_bool_dtype(df[column])
+        fields.append((column, 'f8' if numeric else string_dtype))
+    rows = np.zeros(len(df), dtype=np.dtype(fields))
+    for column, kind in fields:
+        if kind == 'f8':
+            rows[column] = df[column].to_numpy(dtype='f8', na_value=np.nan)
+        else:
+            rows[column] = [value if isinstance(value, str) else ('' if pd.isna(value) else str(value))
+                            for value in df[column].to_numpy(dtype=object)]
+
+    with h5py.File(hdf5_path, 'w') as h5_file:
+        dataset = create_stream_dataset(h5_file, 'data', rows.dtype, ALIGNED_LAYOUT)
+        dataset.resize(len(rows), axis=0)
+        dataset[:] = rows
+        dataset.attrs['rows_written'] = len(rows)
+        for key, value in (attrs or {}).items():
+            h5_file.attrs[key] = value
+    return len(rows)
+
+
+def align_subject(subject_dir: str, rate_hz: float = DEFAULT_ALIGN_RATE_HZ,
+                  formats: Iterable[str] = None, method: str = "asof",
+                  tolerances: Optional[dict] = None, output_dir: Optional[str] = None) -> Dict[str, str]:
+    """
+    Align all streams of one subject and write <subject>_aligned.<ext>.
+
+    Args:
+        subject_dir (str): experiments/subject_data/<exp>/<trial>/<subject>.
+        rate_hz (float): Grid rate.
+        formats (iterable): Subset of ALIGN_FORMATS (default: both, HDF5 only without pyarrow).
+        method (str): 'asof' or 'linear'.
+        tolerances (dict): Overrides of DEFAULT_TOLERANCES.
+        output_dir (str): Where to write (default: subject_dir).
+
+    Returns:
+        dict: {format: path written}
+    """
+    formats = list(formats or (ALIGN_FORMATS if PARQUET_AVAILABLE else ("hdf5",)))
+    unknown = set(formats) - set(ALIGN_FORMATS)
+    if unknown:
+        raise ValueError(f"Unknown formats {sorted(unknown)}; use {ALIGN_FORMATS}")
+
+    streams, table = collect_subject_streams(subject_dir)
+    if not streams:
+        raise FileNotFoundError(f"No streams found in {subject_dir}")
+    aligned = align_streams(streams, rate_hz, table, tolerances, method)
+
+    subject = os.path.basename(os.path.normpath(subject_dir))
+    base = os.path.join(output_dir or subject_dir, f'{subject}{ALIGNED_SUFFIX}')
+    written = {}
+    if "parquet" in formats:
+        write_frame_to_parquet(aligned, base + '.parquet')
+        written["parquet"] = base + '.parquet'
+    if "hdf5" in formats:
+        write_aligned_hdf5(aligned, base + '.h5', attrs={'rate_hz': float(rate_hz), 'method': method,
+                                                         'streams': ','.join(streams)})
+        written["hdf5"] = base + '.h5'
+    print(f"Aligned {len(streams)} streams of {subject} onto {len(aligned)} rows at {rate_hz:g} Hz")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Align all streams of subject directories onto one timeline.")
+    parser.add_argument('subject_dirs', nargs='+', help="experiments/subject_data/<exp>/<trial>/<subject>")
+    parser.add_argument('--rate', type=float, default=DEFAULT_ALIGN_RATE_HZ, help="Grid rate in Hz")
+    parser.add_argument('--method', choices=ALIGN_METHODS, default="asof")
+    parser.add_argument('--formats', nargs='+', choices=ALIGN_FORMATS, default=None)
+    args = parser.parse_args()
+
+    for subject_dir in args.subject_dirs:
+        try:
+            for file_format, path in align_subject(subject_dir, args.rate, args.formats, args.method).items():
+                print(f"  {file_format}: {path}")
+        except (OSError, ValueError) as e:
+            print(f"Skipping {subject_dir}: {e}")
+
+
+if __name__ == '__main__':
+    main()
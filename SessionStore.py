@@ -0,0 +1,385 @@
+"""
+SessionStore Module
+
+One HDF5 file per session with one group per stream, written by a single thread.
+
+Instead of each manager opening its own h5py.File and writing from its own thread,
+managers register a stream with the session's store and get back a StreamWriter:
+
+    /event_markers/data      EventManager
+    /cardiac/data            PolarManager
+    /respiratory/data        VernierManager
+    /<stream>/markers        marker interval table (written when the stream closes)
+
+StreamWriter has the same interface as HDF5Appender (append, append_rows, flush,
+close, rows_written, n_rows, closed), so managers use it as their appender.
+
+THREADING:
+    - append()/append_rows() only push onto the stream's collections.deque, under a
+      per-stream lock that close() also takes to mark the stream closed, so a row is
+      either queued before close() drains the stream or refused with RuntimeError.
+      append() queues a copy of the row dict, because managers reuse
+      one dict for every row; the writer thread is woken once wake_rows rows are queued and
+      otherwise every flush_interval seconds.
+    - every HDF5 call (dataset creation, attribute writes, row writes, markers,
+      flushes) runs on the writer thread. Other work is handed over with submit().
+    - queued rows of every stream are drained before each submitted command runs, so
+      a command sees all rows appended before it was submitted (e.g. close). A command
+      submitted from the writer thread itself (e.g. by a finalize hook) runs inline.
+
+Readers open the file read-only and use the stream group as the parent of 'data'
+(HDF5Exporter functions take group=<stream>).
+
+SWMR:
+    With swmr=True the file is kept in SWMR mode so LiveReader can tail streams while
+    they are written. HDF5 cannot create groups, datasets or attributes in SWMR mode,
+    so structural commands (open_stream, the finalize step of StreamWriter.close,
+    submit(..., structural=True)) briefly reopen the file normally on the writer
+    thread and switch SWMR mode back on afterwards. Streams with variable-length fields
+    (the event stream's string columns) are refused in SWMR mode.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+import h5py
+import numpy as np
+
+from HDF5Appender import (HDF5Appender, create_stream_dataset, open_stream_file, DEFAULT_FLUSH_INTERVAL,
+                          DEFAULT_FLUSH_ROWS)
+
+DEFAULT_WAKE_ROWS = 256
+
+
+def has_vlen_fields(dtype: np.dtype) -> bool:
+    """Whether a (structured) dtype has variable-length string or sequence fields."""
+    dtype = np.dtype(dtype)
+    fields = [dtype[name] for name in dtype.names] if dtype.names else [dtype]
+    return any(h5py.check_vlen_dtype(field) is not None for field in fields)
+
+
+class StreamWriter:
+    """Producer-side handle for one stream of a SessionStore."""
+
+    def __init__(self, store: 'SessionStore', name: str, wake_rows: int = DEFAULT_WAKE_ROWS):
+        self.store = store
+        self.name = name
+        self.wake_rows = wake_rows
+        self._queue = deque()
+        self._group = None
+        self._appender = None
+        self._closed = False
+        self._lock = threading.Lock()    # orders appends against close()
+
+    # Properties #####################################################
+    @property
+    def rows_written(self) -> int:
+        """Rows already flushed to the dataset."""
+        return self._appender.rows_written if self._appender is not None else 0
+
+    @property
+    def n_rows(self) -> int:
+        """Rows flushed or staged by the writer thread, plus queued items (a queued block counts once)."""
+        staged = self._appender.n_rows if self._appender is not None else 0
+        return staged + len(self._queue)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    ##################################################################
+    # Methods ########################################################
+    def append(self, row: dict) -> None:
+        """Queue a copy of a single row given as {field: value}."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"Cannot append to closed stream '{self.name}'.")
+            # The caller may reuse and change the dict before the writer thread drains it
+            self._queue.append(dict(row))
+        if len(self._queue) >= self.wake_rows:
+            self.store.wake()
+
+    def append_rows(self, rows: np.ndarray) -> None:
+        """Queue a block of rows given as a structured array with the stream's dtype."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"Cannot append to closed stream '{self.name}'.")
+            if not len(rows):
+                return
+            self._queue.append(rows)
+        self.store.wake()
+
+    def recent(self, seconds: Optional[float] = None) -> np.ndarray:
+        """
+        Rows in the appender's history ring (HDF5Appender.recent). Rows still queued for
+        the writer thread (at most flush_interval old) are not included yet.
+        """
+        return self._appender.recent(seconds)
+
+    def submit(self, fn: Callable, wait: bool = False, structural: bool = False):
+        """
+        Run fn(group) on the writer thread. Returns the result if wait, else a Future.
+        Set structural if fn creates objects or attributes (see SWMR in the module docstring).
+        """
+        return self.store.submit(lambda h5_file: fn(h5_file[self.name]), wait, structural)
+
+    def set_attrs(self, attrs: dict) -> None:
+        """Update attributes of the stream's 'data' dataset (asynchronously)."""
+        def update(group):
+            for key, value in attrs.items():
+                group['data'].attrs[key] = value
+        self.submit(update, structural=True)
+
+    def flush(self) -> int:
+        """Write every queued row to the file. Returns the number of rows written."""
+        return self.submit(lambda group: self._appender.flush(), wait=True)
+
+    def close(self, finalize: Optional[Callable] = None) -> None:
+        """
+        Write the remaining rows, trim the dataset and detach the stream.
+
+        Args:
+            finalize (callable): Optional finalize(group), run on the writer thread after
+                the last rows are written (e.g. attributes, the markers table).
+        """
+        with self._lock:
+            if self._closed:
+                return
+            # Rows queued before this point are drained below; later appends raise
+            self._closed = True
+
+        def close_stream(group):
+            self._drain()
+            self._appender.close()
+            if finalize is not None:
+                self.store._without_swmr(lambda h5_file: finalize(h5_file[self.name]))
+            self.store._file.flush()
+
+        try:
+            self.submit(close_stream, wait=True)
+        finally:
+            self.store._detach(self)
+
+    def _attach(self, group, appender: HDF5Appender) -> None:
+        """Writer thread only."""
+        self._group = group
+        self._appender = appender
+
+    def _rebind(self, group) -> None:
+        """Point the stream at its group in a reopened file. Writer thread only."""
+        self._group = group
+        self._appender.rebind(group['data'])
+
+    def _drain(self) -> None:
+        """Move queued rows into the appender. Writer thread only."""
+        if self._appender is None:
+            return
+        while True:
+            try:
+                item = self._queue.popleft()
+            except IndexError:
+                return
+            if isinstance(item, np.ndarray):
+                self._appender.append_rows(item)
+            else:
+                self._appender.append(item)
+
+
+class SessionStore:
+    def __init__(self, filename: str, flush_interval: float = DEFAULT_FLUSH_INTERVAL, swmr: bool = False):
+        """
+        Args:
+            filename (str): Session HDF5 file (created or appended to).
+            flush_interval (float): Maximum seconds between flushes to disk.
+            swmr (bool): Keep the file readable by LiveReader while it is written.
+        """
+        self.filename = filename
+        self.flush_interval = flush_interval
+        self.swmr = swmr
+        self._file = None
+        self._streams = {}
+        self._commands = deque()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._closed = False
+
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.submit(self._open_file, wait=True)
+        print(f"✓ Session store opened: {self.filename}")
+
+    # Properties #####################################################
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def streams(self) -> list:
+        return list(self._streams)
+
+    ##################################################################
+    # Methods ########################################################
+    def open_stream(self, name: str, dtype: np.dtype, layout: dict = None, attrs: dict = None,
+                    flush_rows: Optional[int] = DEFAULT_FLUSH_ROWS, **appender_options) -> StreamWriter:
+        """
+        Create (or reopen) the group for a stream and return its writer.
+
+        Args:
+            name (str): Group name, e.g. 'cardiac'.
+            dtype (np.dtype): Row dtype of the stream's 'data' dataset.
+            layout (dict): Chunk/compression layout (see HDF5Appender.create_stream_dataset).
+            attrs (dict): Attributes set on the dataset when it is created.
+            flush_rows (int): Staged rows that trigger a write on the writer thread.
+            appender_options: Further HDF5Appender options (initial_capacity, growth_factor).
+                flush_interval/background are ignored; the store's writer thread flushes.
+        """
+        if self._closed:
+            raise RuntimeError("Session store is closed.")
+        if name in self._streams:
+            raise ValueError(f"Stream '{name}' is already open.")
+        if self.swmr and has_vlen_fields(dtype):
+            raise ValueError(f"Stream '{name}' has variable-length fields, which HDF5 does not support in SWMR mode.")
+
+        appender_options.pop('flush_interval', None)
+        appender_options.pop('background', None)
+        writer = StreamWriter(self, name, wake_rows=flush_rows or DEFAULT_WAKE_ROWS)
+
+        def create(h5_file):
+            group = h5_file.require_group(name)
+            if 'data' in group:
+                dataset = group['data']
+            else:
+                dataset = create_stream_dataset(group, 'data', dtype, layout)
+                for key, value in (attrs or {}).items():
+                    dataset.attrs[key] = value
+            writer._attach(group, HDF5Appender(dataset, flush_rows=flush_rows, flush_interval=None,
+                                               background=False, swmr=self.swmr, **appender_options))
+
+        self.submit(create, wait=True, structural=True)
+        self._streams[name] = writer
+        print(f"✓ Stream '{name}' opened in session store")
+        return writer
+
+    def submit(self, fn: Callable, wait: bool = False, structural: bool = False):
+        """
+        Run fn(h5_file) on the writer thread after all rows queued so far are written.
+        Returns the result if wait, else a concurrent.futures.Future.
+        Set structural if fn creates objects or attributes (see SWMR in the module docstring).
+        """
+        if self._stopping and threading.current_thread() is not self._thread:
+            raise RuntimeError("Session store is closed.")
+        if structural:
+            command = fn
+            fn = lambda h5_file: self._without_swmr(command)
+        future = Future()
+        if threading.current_thread() is self._thread:
+            # Queuing would deadlock a waiting caller: the writer thread runs the command now
+            self._drain_all()
+            try:
+                future.set_result(fn(self._file))
+            except Exception as e:
+                future.set_exception(e)
+            return future.result() if wait else future
+        self._commands.append((fn, future))
+        self._wakeup.set()
+        return future.result() if wait else future
+
+    def wake(self) -> None:
+        """Ask the writer thread to drain the queues now."""
+        self._wakeup.set()
+
+    def flush(self) -> None:
+        """Write all queued rows of every stream and flush the file."""
+        def flush_all(h5_file):
+            for writer in list(self._streams.values()):
+                writer._appender.flush()
+            h5_file.flush()
+        self.submit(flush_all, wait=True)
+
+    def close(self) -> None:
+        """Close every open stream, then the file, and stop the writer thread."""
+        if self._closed:
+            return
+        for writer in list(self._streams.values()):
+            try:
+                writer.close()
+            except Exception as e:
+                print(f"Error closing stream '{writer.name}': {e}")
+
+        self.submit(self._close_file, wait=True)
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join(timeout=5.0)
+        if self._thread.is_alive():
+            print("WARNING: Session store writer thread did not stop cleanly within timeout!")
+        self._closed = True
+        print(f"Session store '{self.filename}' closed.")
+
+    def _detach(self, writer: StreamWriter) -> None:
+        if self._streams.get(writer.name) is writer:
+            del self._streams[writer.name]
+
+    def _open_file(self, _):
+        self._file = open_stream_file(self.filename, swmr=self.swmr)
+        if self.swmr:
+            self._file.swmr_mode = True
+
+    def _without_swmr(self, fn: Callable):
+        """Run fn(h5_file) with the file opened normally. Writer thread only."""
+        if not self.swmr:
+            return fn(self._file)
+
+        for writer in list(self._streams.values()):
+            if writer._appender is not None:
+                writer._appender.flush()
+        self._file.close()
+        self._file = h5py.File(self.filename, 'a', libver='latest')
+        try:
+            return fn(self._file)
+        finally:
+            for writer in list(self._streams.values()):
+                if writer._appender is not None:
+                    writer._rebind(self._file[writer.name])
+            self._file.swmr_mode = True
+
+    def _close_file(self, _):
+        if self._file is not None:
+            self._file.flush()
+            self._file.close()
+            self._file = None
+
+    def _drain_all(self) -> None:
+        for writer in list(self._streams.values()):
+            writer._drain()
+
+    def _run(self) -> None:
+        last_flush = time.monotonic()
+        while True:
+            self._wakeup.wait(timeout=self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self._drain_all()
+                while self._commands:
+                    fn, future = self._commands.popleft()
+                    self._drain_all()
+                    try:
+                        future.set_result(fn(self._file))
+                    except Exception as e:
+                        future.set_exception(e)
+
+                now = time.monotonic()
+                if self._file is not None and now - last_flush >= self.flush_interval:
+                    for writer in list(self._streams.values()):
+                        if writer._appender is not None:
+                            writer._appender.flush()
+                    self._file.flush()
+                    last_flush = now
+            except Exception as e:
+                print(f"Error in session store writer: {e}")
+
+            if self._stopping and not self._commands:
+                break
@@ -0,0 +1,204 @@
+"""
+StreamSlicer Module
+
+Reads one time range or one event marker's intervals out of a stream file without
+reading the rest of the stream.
+
+SEARCH:
+    Stream rows are appended in acquisition order, so timestamp_unix is monotonic.
+    search_timestamp() bisects the dataset by reading single timestamps (one chunk
+    each) until the candidate range fits in one block, then finishes with
+    np.searchsorted on that block: O(log n) small reads instead of a full column scan.
+
+MARKER INDEX:
+    When a stream is closed, write_marker_index() stores markers/row_ranges next to the
+    markers interval table: (start_row, end_row) of every interval in this stream's
+    'data', i.e. interval i covers rows [start_row, end_row). slice_marker() uses it
+    directly; files without it (or still being written) fall back to searching.
+
+    python StreamSlicer.py --marker stressor_test_2 experiments/subject_data/**/*.h5
+"""
+import argparse
+import glob
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from HDF5Appender import valid_rows
+from HDF5Exporter import stream_parent, structured_to_frame
+from LiveReader import open_live_file
+from MarkerTimeline import MarkerTable, MARKERS_GROUP, attach_markers
+
+TIME_FIELD = 'timestamp_unix'
+ROW_INDEX_NAME = 'row_ranges'
+ROW_RANGE_DTYPE = np.dtype([('start_row', 'i8'), ('end_row', 'i8')])
+DEFAULT_SEARCH_BLOCK_ROWS = 4096
+
+
+def search_timestamp(dataset, value: float, n_rows: Optional[int] = None, side: str = 'left',
+                     time_field: str = TIME_FIELD, block_rows: int = DEFAULT_SEARCH_BLOCK_ROWS) -> int:
+    """
+    np.searchsorted(dataset[time_field][:n_rows], value, side) without reading the column.
+
+    Args:
+        dataset (h5py.Dataset): Stream dataset with a non-decreasing time field.
+        value (float): Timestamp to locate.
+        n_rows (int): Valid rows (default valid_rows(dataset)).
+        side (str): 'left' or 'right', as for np.searchsorted.
+        time_field (str): Timestamp field.
+        block_rows (int): Range size at which bisection stops and a block is read.
+    """
+    if n_rows is None:
+        n_rows = valid_rows(dataset)
+    timestamps = dataset.fields(time_field)
+    lo, hi = 0, n_rows
+    while hi - lo > block_rows:
+        mid = (lo + hi) // 2
+        t = timestamps[mid]
+        if t < value or (side == 'right' and t == value):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo + int(np.searchsorted(timestamps[lo:hi], value, side=side))
+
+
+def time_range_rows(dataset, t0: float, t1: float, n_rows: Optional[int] = None,
+                    time_field: str = TIME_FIELD) -> Tuple[int, int]:
+    """Row range [start, stop) holding the samples with t0 <= timestamp < t1."""
+    if n_rows is None:
+        n_rows = valid_rows(dataset)
+    start = search_timestamp(dataset, t0, n_rows, 'left', time_field)
+    stop = search_timestamp(dataset, t1, n_rows, 'left', time_field) if np.isfinite(t1) else n_rows
+    return start, max(start, stop)
+
+
+def write_marker_index(parent, time_field: str = TIME_FIELD) -> None:
+    """
+    Persist markers/row_ranges for parent['data'] (call after the markers table is written).
+    No-op if the stream has no markers table.
+    """
+    if MARKERS_GROUP not in parent:
+        return
+    group = parent[MARKERS_GROUP]
+    dataset = parent['data']
+    n_rows = valid_rows(dataset)
+    intervals = group['intervals'][:]
+
+    timestamps = dataset.fields(time_field)[:n_rows]
+    ranges = np.zeros(len(intervals), dtype=ROW_RANGE_DTYPE)
+    ranges['start_row'] = np.searchsorted(timestamps, intervals['start_unix'], side='left')
+    ranges['end_row'] = np.searchsorted(timestamps, intervals['end_unix'], side='left')
+
+    if ROW_INDEX_NAME in group:
+        del group[ROW_INDEX_NAME]
+    index = group.create_dataset(ROW_INDEX_NAME, data=ranges)
+    index.attrs['stream_rows'] = n_rows
+
+
+def marker_row_ranges(parent, event_marker: str, table: Optional[MarkerTable] = None) -> np.ndarray:
+    """
+    (start_row, end_row) of every interval labelled event_marker, in time order.
+    Uses the persisted index when it matches the current row count.
+
+    Args:
+        parent: File or stream group holding 'data' (and 'markers' once closed).
+        event_marker (str): Marker label.
+        table (MarkerTable): Interval table to use instead of the file's, e.g. a
+            MarkerTimeline.snapshot() while the stream is still recording.
+    """
+    from_file = table is None
+    if from_file:
+        table = MarkerTable.read_from_hdf5(parent)
+    if table is None:
+        return np.zeros(0, dtype=ROW_RANGE_DTYPE)
+    mask = np.isin(table.intervals['marker_id'], np.flatnonzero(table.marker_labels == event_marker))
+
+    dataset = parent['data']
+    n_rows = valid_rows(dataset)
+    if from_file:
+        group = parent[MARKERS_GROUP]
+        if ROW_INDEX_NAME in group and group[ROW_INDEX_NAME].attrs.get('stream_rows') == n_rows:
+            return group[ROW_INDEX_NAME][:][mask]
+
+    ranges = np.zeros(int(mask.sum()), dtype=ROW_RANGE_DTYPE)
+    for i, interval in enumerate(table.intervals[mask]):
+        ranges[i] = time_range_rows(dataset, interval['start_unix'], interval['end_unix'], n_rows)
+    return ranges
+
+
+def slice_time(parent, t0: float, t1: float) -> np.ndarray:
+    """Rows of parent['data'] with t0 <= timestamp_unix < t1."""
+    dataset = parent['data']
+    start, stop = time_range_rows(dataset, t0, t1)
+    return dataset[start:stop]
+
+
+def slice_marker(parent, event_marker: str, table: Optional[MarkerTable] = None) -> np.ndarray:
+    """Rows of parent['data'] recorded during any interval labelled event_marker (see marker_row_ranges)."""
+    dataset = parent['data']
+    ranges = marker_row_ranges(parent, event_marker, table)
+    blocks = [dataset[start:stop] for start, stop in ranges if stop > start]
+    return np.concatenate(blocks) if blocks else dataset[0:0]
+
+
+def _to_frame(parent, rows: np.ndarray, table: Optional[MarkerTable] = None) -> pd.DataFrame:
+    df = structured_to_frame(rows)
+    return attach_markers(df, table if table is not None else MarkerTable.read_from_hdf5(parent))
+
+
+def load_time_range(filename: str, t0: float, t1: float, group: Optional[str] = None,
+                    table: Optional[MarkerTable] = None) -> pd.DataFrame:
+    """
+    Rows of a stream file in [t0, t1) as a DataFrame with event_marker/condition attached.
+
+    Args:
+        filename (str): Stream HDF5 file (may still be written, see LiveReader).
+        t0, t1 (float): Unix seconds.
+        group (str): Stream group in a session file (None for per-manager files).
+        table (MarkerTable): Marker table for files still being written (see marker_row_ranges).
+    """
+    with open_live_file(filename) as h5_file:
+        parent = stream_parent(h5_file, group)
+        return _to_frame(parent, slice_time(parent, t0, t1), table)
+
+
+def load_marker(filename: str, event_marker: str, group: Optional[str] = None,
+                table: Optional[MarkerTable] = None) -> pd.DataFrame:
+    """Rows of a stream file recorded during event_marker, with event_marker/condition attached."""
+    with open_live_file(filename) as h5_file:
+        parent = stream_parent(h5_file, group)
+        return _to_frame(parent, slice_marker(parent, event_marker, table), table)
+
+
+def load_marker_across(filenames: Iterable[str], event_marker: str,
+                       group: Optional[str] = None) -> Dict[str, pd.DataFrame]:
+    """load_marker() for many files (e.g. one stream of every subject). Unreadable files are skipped."""
+    frames = {}
+    for filename in filenames:
+        try:
+            frames[filename] = load_marker(filename, event_marker, group)
+        except (OSError, KeyError) as e:
+            print(f"Skipping {filename}: {e}")
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Slice one event marker out of stream HDF5 files.")
+    parser.add_argument('files', nargs='+', help="Stream files or glob patterns")
+    parser.add_argument('--marker', required=True, help="event_marker to extract")
+    parser.add_argument('--group', default=None, help="Stream group inside session files")
+    args = parser.parse_args()
+
+    filenames = sorted({match for pattern in args.files for match in glob.glob(pattern, recursive=True)})
+    start = time.perf_counter()
+    frames = load_marker_across(filenames, args.marker, args.group)
+    elapsed = time.perf_counter() - start
+    for filename, df in frames.items():
+        print(f"{filename}: {len(df)} rows")
+    print(f"{len(frames)} files sliced in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
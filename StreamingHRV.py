@@ -0,0 +1,278 @@
+"""
+StreamingHRV Module
+
+Heart rate variability statistics maintained incrementally as RR intervals arrive from
+the strap, so every BLE notification costs O(1) regardless of the window length.
+
+WINDOW (RRWindow):
+    The window holds the most recent beats, limited by a beat count (max_beats), a time
+    span (window_seconds, measured between beat times), or both. Every push appends one
+    beat and evicts beats that fell out of the window from the front.
+
+TIME DOMAIN (O(1) per beat):
+    Running sums are updated when a beat enters and when one leaves the window:
+        mean NN / SDNN   sum and sum of squares of (rr - offset)
+        RMSSD            sum of squared successive differences
+        pNN50            count of successive differences > 50 ms
+    The sums are recomputed exactly from the window once every `resync_every` pushes so
+    floating-point error from the running subtraction cannot accumulate.
+
+FREQUENCY DOMAIN (HRVFeatureEngine):
+    LF (0.04-0.15 Hz) and HF (0.15-0.4 Hz) power of the unevenly sampled RR series from
+    a Lomb-Scargle periodogram (vectorized over frequencies), in ms^2. The engine only
+    does NumPy work when a feature row is due (every update_interval seconds), not per
+    beat, and needs min_spectral_seconds of beats before reporting LF/HF.
+"""
+import math
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+DEFAULT_MAX_BEATS = 300
+DEFAULT_WINDOW_SECONDS = 30.0
+DEFAULT_RESYNC_EVERY = 4096
+NN50_THRESHOLD_MS = 50.0
+
+LF_BAND = (0.04, 0.15)
+HF_BAND = (0.15, 0.40)
+DEFAULT_FEATURE_WINDOW_SECONDS = 300.0
+DEFAULT_UPDATE_INTERVAL = 1.0
+DEFAULT_MIN_SPECTRAL_SECONDS = 60.0
+DEFAULT_SPECTRAL_BINS = 128
+
+HRV_FEATURES_DTYPE = np.dtype([
+    ('timestamp_unix', 'f8'),
+    ('beats', 'i4'),
+    ('mean_nn', 'f4'),
+    ('sdnn', 'f4'),
+    ('rmssd', 'f4'),
+    ('pnn50', 'f4'),
+    ('lf_power', 'f4'),
+    ('hf_power', 'f4'),
+    ('lf_hf', 'f4'),
+])
+
+
+class RRWindow:
+    """Running time-domain HRV over a beat-count and/or time window of RR intervals (milliseconds)."""
+
+    def __init__(self, max_beats: Optional[int] = DEFAULT_MAX_BEATS,
+                 window_seconds: Optional[float] = DEFAULT_WINDOW_SECONDS,
+                 resync_every: int = DEFAULT_RESYNC_EVERY):
+        """
+        Args:
+            max_beats (int): Keep at most this many beats (None = no limit).
+            window_seconds (float): Keep beats within this many seconds of the newest beat (None = no limit).
+            resync_every (int): Pushes between exact recomputations of the running sums.
+        """
+        if max_beats is None and window_seconds is None:
+            raise ValueError("Set max_beats, window_seconds or both")
+        self.max_beats = max_beats
+        self.window_seconds = window_seconds
+        self.resync_every = resync_every
+        self._rr = deque()
+        self._times = deque()
+        self.reset()
+
+    def __len__(self):
+        return len(self._rr)
+
+    def push(self, rr_ms: float, timestamp: Optional[float] = None) -> None:
+        """
+        Add one RR interval.
+
+        Args:
+            rr_ms (float): RR interval in milliseconds.
+            timestamp (float): Time of the beat ending this interval (unix seconds). Defaults to
+                the running sum of the intervals, which ignores gaps in the recording.
+        """
+        if timestamp is None:
+            timestamp = self._clock + rr_ms / 1000.0
+        self._clock = timestamp
+
+        if self._rr:
+            diff = rr_ms - self._rr[-1]
+            self._sum_sq_diff += diff * diff
+            self._nn50 += abs(diff) > NN50_THRESHOLD_MS
+        else:
+            # Sums of (rr - offset) keep SDNN precise for RR values around 1000 ms
+            self._offset = rr_ms
+        centered = rr_ms - self._offset
+        self._sum += centered
+        self._sum_sq += centered * centered
+        self._rr.append(rr_ms)
+        self._times.append(timestamp)
+
+        while self.max_beats is not None and len(self._rr) > self.max_beats:
+            self._evict()
+        while self.window_seconds is not None and timestamp - self._times[0] > self.window_seconds:
+            self._evict()
+
+        self._pushes += 1
+        if self._pushes >= self.resync_every:
+            self._resync()
+
+    def rmssd(self) -> Optional[float]:
+        """RMSSD of the window in milliseconds, or None with fewer than two beats."""
+        n = len(self._rr)
+        if n < 2:
+            return None
+        return math.sqrt(max(self._sum_sq_diff, 0.0) / (n - 1))
+
+    def mean_nn(self) -> Optional[float]:
+        """Mean RR interval in milliseconds, or None without beats."""
+        n = len(self._rr)
+        return self._offset + self._sum / n if n else None
+
+    def sdnn(self) -> Optional[float]:
+        """Sample standard deviation of the RR intervals in milliseconds, or None with fewer than two beats."""
+        n = len(self._rr)
+        if n < 2:
+            return None
+        return math.sqrt(max(self._sum_sq - self._sum * self._sum / n, 0.0) / (n - 1))
+
+    def pnn50(self) -> Optional[float]:
+        """Percentage of successive differences above 50 ms, or None with fewer than two beats."""
+        n = len(self._rr)
+        return 100.0 * self._nn50 / (n - 1) if n >= 2 else None
+
+    def arrays(self):
+        """(beat times, RR intervals) of the window as float arrays (allocates; for batched work)."""
+        return np.fromiter(self._times, dtype='f8', count=len(self._times)), \
+            np.fromiter(self._rr, dtype='f8', count=len(self._rr))
+
+    def reset(self) -> None:
+        self._rr.clear()
+        self._times.clear()
+        self._sum_sq_diff = 0.0
+        self._nn50 = 0
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self._offset = 0.0
+        self._clock = 0.0
+        self._pushes = 0
+
+    def _evict(self) -> None:
+        oldest = self._rr.popleft()
+        self._times.popleft()
+        centered = oldest - self._offset
+        self._sum -= centered
+        self._sum_sq -= centered * centered
+        if self._rr:
+            diff = self._rr[0] - oldest
+            self._sum_sq_diff -= diff * diff
+            self._nn50 -= abs(diff) > NN50_THRESHOLD_MS
+        else:
+            self._sum_sq_diff = 0.0
+            self._sum = 0.0
+            self._sum_sq = 0.0
+
+    def _resync(self) -> None:
+        self._pushes = 0
+        if not self._rr:
+            return
+        _, rr = self.arrays()
+        diffs = np.diff(rr)
+        self._offset = float(rr[0])
+        centered = rr - self._offset
+        self._sum = float(centered.sum())
+        self._sum_sq = float(centered @ centered)
+        self._sum_sq_diff = float(diffs @ diffs)
+        self._nn50 = int(np.count_nonzero(np.abs(diffs) > NN50_THRESHOLD_MS))
+
+
+def lomb_scargle_band_powers(times: np.ndarray, rr: np.ndarray, bands=(LF_BAND, HF_BAND),
+                             bins: int = DEFAULT_SPECTRAL_BINS) -> list:
+    """
+    Power (ms^2) of an unevenly sampled RR series in each frequency band.
+
+    Args:
+        times (np.ndarray): Beat times in seconds.
+        rr (np.ndarray): RR intervals in milliseconds.
+        bands (tuple): (low, high) bands in Hz.
+        bins (int): Frequencies evaluated per band.
+
+    Returns:
+        list: One power per band (NaN with fewer than 3 beats).
+    """
+    if len(rr) < 3:
+        return [np.nan] * len(bands)
+    t = times - times[0]
+    y = rr - rr.mean()
+    span = t[-1] - t[0]
+    powers = []
+    for low, high in bands:
+        df = (high - low) / bins
+        f = low + (np.arange(bins) + 0.5) * df
+        w = 2 * np.pi * f[:, None]
+        tau = np.arctan2(np.sin(2 * w * t).sum(axis=1), np.cos(2 * w * t).sum(axis=1))[:, None] / (2 * w)
+        arg = w * (t - tau)
+        c, s = np.cos(arg), np.sin(arg)
+        periodogram = 0.5 * ((c @ y) ** 2 / (c * c).sum(axis=1) + (s @ y) ** 2 / (s * s).sum(axis=1))
+        # One-sided PSD: 2 * P / fs with fs = beats / span
+        psd = 2.0 * periodogram * span / len(y)
+        powers.append(float(psd.sum() * df))
+    return powers
+
+
+def _optional_float(value) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+class HRVFeatureEngine:
+    """
+    Sliding-window HRV features from a stream of RR intervals.
+
+    push() is O(1) per beat; update() returns a feature row (HRV_FEATURES_DTYPE fields)
+    at most once per update_interval.
+    """
+
+    def __init__(self, window_seconds: float = DEFAULT_FEATURE_WINDOW_SECONDS,
+                 update_interval: float = DEFAULT_UPDATE_INTERVAL,
+                 min_spectral_seconds: float = DEFAULT_MIN_SPECTRAL_SECONDS,
+                 bins: int = DEFAULT_SPECTRAL_BINS):
+        self.window = RRWindow(max_beats=None, window_seconds=window_seconds)
+        self.update_interval = update_interval
+        self.min_spectral_seconds = min_spectral_seconds
+        self.bins = bins
+        self.latest = None
+        self._next_update = None
+
+    def push(self, rr_ms: float, timestamp: Optional[float] = None) -> None:
+        self.window.push(rr_ms, timestamp)
+
+    def update(self, now: float) -> Optional[dict]:
+        """Compute a feature row if one is due at `now` (unix seconds), else None."""
+        if self._next_update is not None and now < self._next_update:
+            return None
+        self._next_update = now + self.update_interval
+        return self.compute(now)
+
+    def compute(self, now: float) -> dict:
+        """Feature row of the current window, stamped `now`."""
+        window = self.window
+        row = {
+            'timestamp_unix': float(now),
+            'beats': len(window),
+            'mean_nn': _optional_float(window.mean_nn()),
+            'sdnn': _optional_float(window.sdnn()),
+            'rmssd': _optional_float(window.rmssd()),
+            'pnn50': _optional_float(window.pnn50()),
+            'lf_power': None,
+            'hf_power': None,
+            'lf_hf': None,
+        }
+        if len(window) >= 3:
+            times, rr = window.arrays()
+            if times[-1] - times[0] >= self.min_spectral_seconds:
+                lf, hf = lomb_scargle_band_powers(times, rr, (LF_BAND, HF_BAND), self.bins)
+                row['lf_power'], row['hf_power'] = lf, hf
+                row['lf_hf'] = lf / hf if hf > 0 else None
+        self.latest = row
+        return row
+
+    def reset(self) -> None:
+        self.window.reset()
+        self.latest = None
+        self._next_update = None
@@ -0,0 +1,167 @@
+"""
+StreamingRespiration Module
+
+Breath-by-breath respiration from the raw Vernier belt force signal while it is recorded,
+instead of the device's slowly updating "Respiration Rate" channel.
+
+BUFFER:
+    Force samples are pushed in blocks (one per device read) into a sliding buffer of the
+    last buffer_seconds. push() only copies the block; all NumPy/SciPy work runs in
+    update(), at most once per update_interval.
+
+DETECTION (update):
+    1. Band-pass (Butterworth, BREATH_BAND = 0.1-1.0 Hz, i.e. 6-60 breaths/min) the whole
+       buffer forwards and backwards (sosfiltfilt), so peak times are not delayed.
+    2. Inhalation peaks (maxima) and exhalation troughs (minima) with scipy find_peaks over
+       the buffer: at least min_breath_seconds apart and with a prominence of at least
+       prominence_fraction of the filtered signal's standard deviation.
+    3. Peaks younger than settle_seconds are left for a later update (the filter edge still
+       moves them); older peaks after the last reported one become breaths.
+
+OUTPUT (BREATH_DTYPE, one row per breath):
+    timestamp_unix   time of the inhalation peak
+    exhale_unix      time of the preceding exhalation trough (NaN if none in the buffer)
+    interval_s       time since the previous inhalation peak (NaN for the first breath)
+    rate_bpm         60 / interval_s
+    amplitude        peak minus trough of the filtered force (N)
+"""
+from typing import Optional
+
+import numpy as np
+import scipy.signal as signal
+
+BREATH_BAND = (0.1, 1.0)
+FILTER_ORDER = 2
+DEFAULT_BUFFER_SECONDS = 40.0
+DEFAULT_UPDATE_INTERVAL = 0.5
+DEFAULT_SETTLE_SECONDS = 2.0
+DEFAULT_MIN_BREATH_SECONDS = 1.0
+DEFAULT_PROMINENCE_FRACTION = 0.5
+# Seconds of samples needed before the first detection pass
+MIN_DETECT_SECONDS = 10.0
+
+BREATH_DTYPE = np.dtype([
+    ('timestamp_unix', 'f8'),
+    ('exhale_unix', 'f8'),
+    ('interval_s', 'f4'),
+    ('rate_bpm', 'f4'),
+    ('amplitude', 'f4'),
+])
+
+
+def _finite_or_none(value) -> Optional[float]:
+    return float(value) if np.isfinite(value) else None
+
+
+class BreathDetector:
+    """Online breath detection on a sliding buffer of belt force samples."""
+
+    def __init__(self, sample_rate: float, buffer_seconds: float = DEFAULT_BUFFER_SECONDS,
+                 update_interval: float = DEFAULT_UPDATE_INTERVAL, settle_seconds: float = DEFAULT_SETTLE_SECONDS,
+                 min_breath_seconds: float = DEFAULT_MIN_BREATH_SECONDS,
+                 prominence_fraction: float = DEFAULT_PROMINENCE_FRACTION, band: tuple = BREATH_BAND):
+        """
+        Args:
+            sample_rate (float): Force sample rate in Hz (must exceed twice the band's upper edge).
+            buffer_seconds (float): Length of the sliding buffer.
+            update_interval (float): Seconds between detection passes.
+            settle_seconds (float): Age a peak needs before it is reported.
+            min_breath_seconds (float): Minimum time between two peaks (caps the rate at 60 / this).
+            prominence_fraction (float): Minimum peak prominence as a fraction of the filtered std.
+            band (tuple): Band-pass edges in Hz.
+        """
+        if sample_rate <= 2 * band[1]:
+            raise ValueError(f"sample_rate must exceed {2 * band[1]} Hz for the {band} Hz band")
+        self.sample_rate = float(sample_rate)
+        self.update_interval = update_interval
+        self.settle_seconds = settle_seconds
+        self.min_breath_seconds = min_breath_seconds
+        self.prominence_fraction = prominence_fraction
+        self._sos = signal.butter(FILTER_ORDER, band, btype='bandpass', fs=self.sample_rate, output='sos')
+        # Room for the buffer plus the blocks pushed between two updates
+        self._capacity = int(buffer_seconds * self.sample_rate)
+        self._times = np.zeros(2 * self._capacity)
+        self._force = np.zeros(2 * self._capacity)
+        # sosfiltfilt needs more than its pad length of samples
+        self._min_samples = max(3 * (2 * len(self._sos) + 1) + 1, int(MIN_DETECT_SECONDS * self.sample_rate))
+        self.reset()
+
+    def reset(self) -> None:
+        self._n = 0
+        self._next_update = None
+        self._last_peak_time = None
+        self.breaths = 0
+        self.latest = None
+
+    def push(self, times: np.ndarray, force: np.ndarray) -> None:
+        """Append a block of samples (unix seconds, force in N)."""
+        times = np.asarray(times, dtype='f8')
+        force = np.asarray(force, dtype='f8')
+        n = len(force)
+        if n == 0:
+            return
+        if self._n + n > len(self._force):
+            self._compact(n)
+        self._times[self._n:self._n + n] = times[-len(self._times):]
+        self._force[self._n:self._n + n] = force[-len(self._force):]
+        self._n = min(self._n + n, len(self._force))
+
+    def _compact(self, incoming: int) -> None:
+        """Keep the newest samples so that `incoming` more fit (at most the buffer length)."""
+        keep = max(0, min(self._n, self._capacity, len(self._force) - incoming))
+        self._times[:keep] = self._times[self._n - keep:self._n]
+        self._force[:keep] = self._force[self._n - keep:self._n]
+        self._n = keep
+
+    def update(self, now: float) -> Optional[np.ndarray]:
+        """Breaths (BREATH_DTYPE rows) newly confirmed by a detection pass due at `now`, else None."""
+        if self._next_update is not None and now < self._next_update:
+            return None
+        self._next_update = now + self.update_interval
+        return self.detect()
+
+    def detect(self) -> Optional[np.ndarray]:
+        """Run one detection pass over the buffer; None when no new breath was confirmed."""
+        if self._n > self._capacity:
+            self._compact(0)
+        if self._n < self._min_samples:
+            return None
+        times = self._times[:self._n]
+        x = signal.sosfiltfilt(self._sos, self._force[:self._n] - self._force[:self._n].mean())
+
+        distance = max(1, int(self.min_breath_seconds * self.sample_rate))
+        prominence = self.prominence_fraction * x.std()
+        if prominence <= 0:
+            return None
+        peaks, _ = signal.find_peaks(x, distance=distance, prominence=prominence)
+        troughs, _ = signal.find_peaks(-x, distance=distance, prominence=prominence)
+
+        peak_times = times[peaks]
+        new = peak_times <= times[-1] - self.settle_seconds
+        if self._last_peak_time is not None:
+            # Peaks shift slightly between passes; anything close to the last one is the same breath
+            new &= peak_times > self._last_peak_time + 0.5 * self.min_breath_seconds
+        peaks = peaks[new]
+        if len(peaks) == 0:
+            return None
+
+        rows = np.zeros(len(peaks), dtype=BREATH_DTYPE)
+        rows['timestamp_unix'] = times[peaks]
+        previous = np.concatenate(([np.nan if self._last_peak_time is None else self._last_peak_time],
+                                   times[peaks[:-1]]))
+        rows['interval_s'] = rows['timestamp_unix'] - previous
+        rows['rate_bpm'] = 60.0 / rows['interval_s']
+
+        # Exhalation trough preceding each peak
+        rows['exhale_unix'] = np.nan
+        rows['amplitude'] = np.nan
+        before = np.searchsorted(troughs, peaks) - 1
+        has_trough = before >= 0
+        trough = troughs[before[has_trough]]
+        rows['exhale_unix'][has_trough] = times[trough]
+        rows['amplitude'][has_trough] = x[peaks[has_trough]] - x[trough]
+
+        self._last_peak_time = float(rows['timestamp_unix'][-1])
+        self.breaths += len(rows)
+        self.latest = {name: _finite_or_none(rows[name][-1]) for name in BREATH_DTYPE.names}
+        return rows
@@ -174,6 +174,14 @@ class SubjectManager:
         df = pd.read_csv(self.csv_file_path)
         return df.to_dict('records')
 
+    def export_parquet(self) -> str:
+        """Write the subject CSV as a Parquet file next to it. Returns the Parquet path."""
+        if not self.csv_file_path:
+            raise ValueError("Subject has not been set. Call 'set_subject' first.")
+
+        from ParquetStore import csv_to_parquet
+        return csv_to_parquet(self.csv_file_path)
+
     def reset_subject(self) -> None:
         """Reset the subject details and clear the CSV file reference."""
         self.subject_id = None
@@ -0,0 +1,180 @@
+"""
+SummaryPyramid Module
+
+Precomputed multi-resolution aggregates of a stream, written beside its 'data' dataset
+when the stream is closed, so overview plots and whole-session QA read a few thousand
+rows instead of the full dataset.
+
+LAYOUT (under the stream's parent: the file, or the stream group of a session file):
+    /data                 raw rows
+    /summary/1s           one row per 1 s bucket
+    /summary/10s          one row per 10 s bucket
+    /summary/60s          one row per 60 s bucket
+
+Each summary row holds the bucket start time (same field name as the source time field),
+'count' (rows in the bucket, i.e. the achieved sample rate for QA) and <field>_min,
+<field>_mean, <field>_max for every numeric field. NaN samples are ignored; a bucket
+with no valid samples of a field gets NaN. String fields (markers) are not summarised.
+
+COMPUTATION:
+    The dataset is read once in chunks. Every chunk is reduced to per-bucket partial
+    aggregates (count, valid count, sum, min, max) with np.*.reduceat at the finest
+    level; coarser levels are reduced from those partials, not from the raw rows.
+"""
+import json
+from typing import Dict, Iterable, Optional
+
+import h5py
+import numpy as np
+
+from HDF5Appender import valid_rows
+
+SUMMARY_GROUP = 'summary'
+DEFAULT_LEVELS = (1, 10, 60)
+DEFAULT_SUMMARY_CHUNK_ROWS = 262144
+TIME_FIELD = 'timestamp_unix'
+
+
+def level_name(seconds: float) -> str:
+    return f"{seconds:g}s"
+
+
+def numeric_fields(dtype: np.dtype, time_field: str = TIME_FIELD) -> list:
+    """Fields of a row dtype that get min/mean/max columns."""
+    return [name for name in dtype.names if name != time_field and dtype[name].kind in 'fiub']
+
+
+def summary_dtype(fields: Iterable[str], time_field: str = TIME_FIELD) -> np.dtype:
+    columns = [(time_field, 'f8'), ('count', 'i8')]
+    for field in fields:
+        columns += [(f'{field}_min', 'f8'), (f'{field}_mean', 'f8'), (f'{field}_max', 'f8')]
+    return np.dtype(columns)
+
+
+def _reduce(partial: Dict[str, np.ndarray], bucket: np.ndarray, fields: list) -> Dict[str, np.ndarray]:
+    """Merge partial aggregates that share a bucket id."""
+    order = np.argsort(bucket, kind='stable')
+    bucket = bucket[order]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket)) + 1))
+
+    merged = {'bucket': bucket[starts], 'count': np.add.reduceat(partial['count'][order], starts)}
+    for field in fields:
+        merged[f'{field}_n'] = np.add.reduceat(partial[f'{field}_n'][order], starts)
+        merged[f'{field}_sum'] = np.add.reduceat(partial[f'{field}_sum'][order], starts)
+        merged[f'{field}_min'] = np.fmin.reduceat(partial[f'{field}_min'][order], starts)
+        merged[f'{field}_max'] = np.fmax.reduceat(partial[f'{field}_max'][order], starts)
+    return merged
+
+
+def _partial_from_rows(rows: np.ndarray, fields: list, seconds: float, time_field: str) -> Dict[str, np.ndarray]:
+    """Per-bucket partial aggregates of raw rows."""
+    partial = {'count': np.ones(len(rows), dtype='i8')}
+    for field in fields:
+        values = rows[field].astype('f8')
+        valid = ~np.isnan(values)
+        partial[f'{field}_n'] = valid.astype('i8')
+        partial[f'{field}_sum'] = np.where(valid, values, 0.0)
+        partial[f'{field}_min'] = values
+        partial[f'{field}_max'] = values
+    bucket = np.floor(rows[time_field] / seconds).astype(np.int64)
+    return _reduce(partial, bucket, fields)
+
+
+def _concat(partials: list, fields: list) -> Dict[str, np.ndarray]:
+    keys = ['bucket', 'count'] + [f'{field}_{part}' for field in fields for part in ('n', 'sum', 'min', 'max')]
+    return {key: np.concatenate([partial[key] for partial in partials]) for key in keys}
+
+
+def _finish(partial: Dict[str, np.ndarray], fields: list, seconds: float, time_field: str) -> np.ndarray:
+    """Turn partial aggregates into summary rows."""
+    level = np.zeros(len(partial['bucket']), dtype=summary_dtype(fields, time_field))
+    level[time_field] = partial['bucket'] * seconds
+    level['count'] = partial['count']
+    for field in fields:
+        n = partial[f'{field}_n']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            level[f'{field}_mean'] = np.where(n > 0, partial[f'{field}_sum'] / n, np.nan)
+        level[f'{field}_min'] = partial[f'{field}_min']
+        level[f'{field}_max'] = partial[f'{field}_max']
+    return level
+
+
+def compute_pyramid(chunks: Iterable[np.ndarray], fields: list, levels=DEFAULT_LEVELS,
+                    time_field: str = TIME_FIELD) -> Dict[float, np.ndarray]:
+    """
+    Summaries of a stream given as consecutive chunks of rows.
+
+    Args:
+        chunks (iterable): Structured arrays of raw rows.
+        fields (list): Numeric fields to summarise.
+        levels (tuple): Bucket sizes in seconds; every level must be a multiple of the finest.
+        time_field (str): Timestamp field in seconds.
+
+    Returns:
+        dict: {seconds: structured summary array}
+    """
+    levels = sorted(levels)
+    finest = levels[0]
+    partials = [_partial_from_rows(rows, fields, finest, time_field) for rows in chunks if len(rows)]
+    if not partials:
+        return {seconds: np.zeros(0, dtype=summary_dtype(fields, time_field)) for seconds in levels}
+
+    merged = _concat(partials, fields)
+    base = _reduce(merged, merged['bucket'], fields)
+    pyramid = {}
+    for seconds in levels:
+        factor = seconds / finest
+        if seconds == finest:
+            partial = base
+        else:
+            partial = _reduce(base, np.floor(base['bucket'] / factor).astype(np.int64), fields)
+        pyramid[seconds] = _finish(partial, fields, seconds, time_field)
+    return pyramid
+
+
+def write_pyramid(parent, levels=DEFAULT_LEVELS, time_field: str = TIME_FIELD,
+                  chunk_rows: int = DEFAULT_SUMMARY_CHUNK_ROWS) -> Dict[float, int]:
+    """
+    Compute the summary levels of parent['data'] and write (or replace) parent['summary'].
+
+    Args:
+        parent (h5py.File | h5py.Group): Open for writing; holds the 'data' dataset.
+        levels (tuple): Bucket sizes in seconds.
+        time_field (str): Timestamp field in seconds.
+        chunk_rows (int): Rows read per chunk.
+
+    Returns:
+        dict: {seconds: rows written}
+    """
+    dataset = parent['data']
+    n_rows = valid_rows(dataset)
+    fields = numeric_fields(dataset.dtype, time_field)
+    # Only the time and numeric fields are read (string columns are skipped entirely)
+    columns = dataset.fields([time_field] + fields)
+    chunks = (columns[start:min(start + chunk_rows, n_rows)] for start in range(0, n_rows, chunk_rows))
+    pyramid = compute_pyramid(chunks, fields, levels, time_field)
+
+    if SUMMARY_GROUP in parent:
+        del parent[SUMMARY_GROUP]
+    group = parent.create_group(SUMMARY_GROUP)
+    group.attrs['source_rows'] = n_rows
+    group.attrs['fields'] = json.dumps(fields)
+    for seconds, level in pyramid.items():
+        level_dataset = group.create_dataset(level_name(seconds), data=level)
+        level_dataset.attrs['seconds'] = seconds
+    return {seconds: len(level) for seconds, level in pyramid.items()}
+
+
+def read_summary(parent, seconds: float) -> Optional[np.ndarray]:
+    """Summary rows of one level, or None if the stream has no such level."""
+    name = level_name(seconds)
+    if SUMMARY_GROUP not in parent or name not in parent[SUMMARY_GROUP]:
+        return None
+    return parent[SUMMARY_GROUP][name][:]
+
+
+def load_summary(filename: str, seconds: float, group: Optional[str] = None) -> Optional[np.ndarray]:
+    """read_summary() for a stream file (group = stream group in a session file)."""
+    with h5py.File(filename, 'r') as h5_file:
+        parent = h5_file[group] if group else h5_file
+        return read_summary(parent, seconds)
@@ -5,6 +5,13 @@ IDENTITY:
 - Module: TimestampManager
 - Purpose: Provide microsecond-precision timestamps via C++ singleton
 - Interface: Python wrapper for C++ timestamp_manager library
+- Fallback: Pure-Python backend on time.clock_gettime_ns when the compiled
+  library is unavailable (e.g. Linux, where only the darwin .so is shipped)
+
+BACKEND SELECTION (at import):
+- "native": timestamp_manager extension imported successfully
+- "python": extension missing or built for another platform
+- BACKEND holds the selected name
 
 GUARANTEES:
 - Precision: Microsecond accuracy (0.000001s)
@@ -21,6 +28,14 @@ get_timestamp(type: str = "unix") -> str
     
 get_unix_timestamp_double() -> float
     ACCEPTS: No parameters
+
+get_timestamp_ns() -> int
+get_monotonic_ns() -> int
+get_timestamp_pair_ns() -> tuple[int, int]
+    ACCEPTS: No parameters
+
+format_iso_array(unix_seconds) -> np.ndarray
+    ACCEPTS: Array-like of Unix timestamps in seconds (float)
     
 OUTPUT CONTRACTS:
 get_timestamp() RETURNS:
@@ -31,6 +46,18 @@ get_timestamp() RETURNS:
 get_unix_timestamp_double() RETURNS:
     - float: Unix timestamp with microsecond precision
 
+get_timestamp_ns() RETURNS:
+    - int: Unix wall-clock time in nanoseconds (CLOCK_REALTIME)
+
+get_monotonic_ns() RETURNS:
+    - int: Monotonic clock in nanoseconds (CLOCK_MONOTONIC), unaffected by clock steps
+
+get_timestamp_pair_ns() RETURNS:
+    - (int, int): (wall, monotonic) nanoseconds read back to back
+
+format_iso_array() RETURNS:
+    - np.ndarray[str]: "YYYY-MM-DDTHH:MM:SS.ffffffZ" per element, same format as get_timestamp("iso")
+
 INVARIANTS:
 - Singleton instance persists for process lifetime
 - All timestamps monotonically increase (system clock dependent)
@@ -39,12 +66,12 @@ INVARIANTS:
 - Microsecond precision maintained across all formats
 
 DEPENDENCIES:
-- REQUIRED: timestamp_manager C++ shared library
-- REQUIRED: C++11+ runtime
-- REQUIRED: Python C API compatibility
+- OPTIONAL: timestamp_manager C++ shared library (native backend)
+- OPTIONAL: C++11+ runtime
+- OPTIONAL: Python C API compatibility
 
 FAILURE MODES:
-- Library import failure: Module initialization fails
+- Library import failure: Falls back to the pure-Python backend
 - Timeout exceeded: Exception after 500ms
 - System clock unavailable: Falls back to system defaults
 - Thread contention: Non-blocking with automatic retry
@@ -53,6 +80,7 @@ PERFORMANCE:
 - Latency: Sub-millisecond for uncontended access
 - Blocking: Maximum 500ms under contention
 - Overhead: Minimal Python wrapper cost
+- Hot paths: Use the *_ns functions; they never build or parse a string
 - Scalability: Supports high-frequency concurrent access
 
 USAGE PATTERN:
@@ -60,10 +88,57 @@ USAGE PATTERN:
 >>> iso = get_timestamp("iso")           # "2024-01-01T10:30:45.123456Z"
 >>> unix_str = get_timestamp("unix")     # "1704110445.123456"
 >>> unix_float = get_unix_timestamp_double()  # 1704110445.123456
+>>> wall_ns, mono_ns = get_timestamp_pair_ns()  # (1704110445123456789, 81234567890)
 """
-import timestamp_manager as tm
+import threading
+import time
+from datetime import datetime, timezone
+import numpy as np
+
+if hasattr(time, "clock_gettime_ns"):
+    def _wall_ns() -> int:
+        return time.clock_gettime_ns(time.CLOCK_REALTIME)
+
+    def _monotonic_ns() -> int:
+        return time.clock_gettime_ns(time.CLOCK_MONOTONIC)
+else:
+    _wall_ns = time.time_ns
+    _monotonic_ns = time.monotonic_ns
+
+
+class _PythonTimestampManager:
+    """Pure-Python stand-in for the C++ TimestampManager singleton."""
+    _instance = None
+    _instance_lock = threading.Lock()
 
-mgr = tm.TimestampManager.get_instance()
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def get_timestamp(self, type: str = "unix") -> str:
+        ns = _wall_ns()
+        if type == "iso":
+            seconds, remainder = divmod(ns, 1_000_000_000)
+            dt = datetime.fromtimestamp(seconds, tz=timezone.utc)
+            return dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{remainder // 1000:06d}Z"
+        if type in ("unix", "unix_double"):
+            return f"{ns / 1e9:.6f}"
+        raise ValueError(f"Invalid timestamp type: {type}. Use 'iso', 'unix' or 'unix_double'.")
+
+    def get_unix_timestamp_double(self) -> float:
+        return _wall_ns() / 1e9
+
+
+try:
+    import timestamp_manager as tm
+    mgr = tm.TimestampManager.get_instance()
+    BACKEND = "native"
+except ImportError:
+    mgr = _PythonTimestampManager.get_instance()
+    BACKEND = "python"
 
 def get_timestamp(type: str = "unix") -> str:
     """
@@ -84,4 +159,69 @@ def get_unix_timestamp_double() -> float:
     Returns:
         float: The current Unix timestamp as a double.
     """
-    return mgr.get_unix_timestamp_double()
\ No newline at end of file
+    return mgr.get_unix_timestamp_double()
+
+def get_timestamp_ns() -> int:
+    """
+    Get the current Unix wall-clock time as integer nanoseconds.
+    
+    Returns:
+        int: Nanoseconds since the Unix epoch (UTC).
+    """
+    return _wall_ns()
+
+def get_monotonic_ns() -> int:
+    """
+    Get the monotonic clock as integer nanoseconds, for measuring intervals.
+    
+    Returns:
+        int: Nanoseconds on the monotonic clock (arbitrary epoch).
+    """
+    return _monotonic_ns()
+
+def get_timestamp_pair_ns() -> tuple[int, int]:
+    """
+    Get a (wall, monotonic) nanosecond pair read back to back.
+    
+    Returns:
+        tuple[int, int]: Unix wall-clock nanoseconds and monotonic nanoseconds.
+    """
+    return _wall_ns(), _monotonic_ns()
+
+def format_iso(unix_seconds: float) -> str:
+    """
+    Format a single Unix timestamp (seconds) as a UTC ISO string.
+    """
+    return str(format_iso_array(np.array([unix_seconds]))[0])
+
+def format_iso_array(unix_seconds) -> np.ndarray:
+    """
+    Format Unix timestamps (seconds) as UTC ISO strings in one vectorized pass.
+    Used at export time so sample paths only ever store numeric timestamps.
+    
+    Args:
+        unix_seconds: Array-like of float Unix timestamps.
+    
+    Returns:
+        np.ndarray: Strings in the get_timestamp("iso") format.
+    """
+    micros = np.round(np.asarray(unix_seconds, dtype='f8') * 1e6).astype('int64')
+    iso = np.datetime_as_string(micros.astype('datetime64[us]'), unit='us')
+    return np.char.add(iso, 'Z')
+
+def add_iso_column(df, column: str = 'timestamp_iso'):
+    """
+    Derive an ISO string column from df['timestamp_unix'] and insert it right after it.
+    No-op if the column already exists (files written before numeric-only storage).
+    
+    Args:
+        df (pd.DataFrame): Frame with a 'timestamp_unix' column.
+        column (str): Name of the ISO column to add.
+    
+    Returns:
+        pd.DataFrame: The same frame, modified in place.
+    """
+    if column not in df.columns and 'timestamp_unix' in df.columns:
+        df.insert(df.columns.get_loc('timestamp_unix') + 1, column,
+                  format_iso_array(df['timestamp_unix'].to_numpy()))
+    return df
@@ -1,7 +1,18 @@
+from typing import Optional
 from godirect import GoDirect
 import asyncio
 import logging
 import TimestampManager as tm
+from MarkerTimeline import MarkerTimeline, MarkerLog, MARKER_LOG_DTYPE, MARKER_LOG_GROUP
+from HDF5Appender import (HDF5Appender, create_stream_dataset, write_metadata_attrs, is_schema_v1, legacy_row,
+                          open_stream_file, close_stream_file)
+from SessionStore import SessionStore
+from HDF5Exporter import export_hdf5_to_csv, export_hdf5_to_parquet, print_progress
+from ParquetStore import parquet_path_for
+from SummaryPyramid import write_pyramid
+from StreamSlicer import write_marker_index
+from StreamingRespiration import BreathDetector, BREATH_DTYPE, BREATH_BAND
+from DeviceWorker import DeviceWorker
 from threading import Thread
 from collections import deque
 import os
@@ -13,12 +24,205 @@ import numpy as np
 import scipy.signal as signal
 from bleak import BleakClient, BleakError
 
-class VernierManager:
+# Group name in the session file when a SessionStore is used
+SESSION_STREAM = "respiratory"
+
+STREAM_DTYPE = np.dtype([
+    ('timestamp_unix', 'f8'),
+    ('force', 'f4'),
+    ('RR', 'f4'),
+])
+
+# Go Direct sample period in milliseconds: 100 ms (10 Hz) by default, down to the belt's
+# native 20 ms (50 Hz) for the raw force waveform
+DEFAULT_SAMPLE_PERIOD_MS = 100
+MIN_SAMPLE_PERIOD_MS = 20
+# Seconds of rows kept in memory for the live tail endpoint
+HISTORY_SECONDS = 600
+# Group holding the breath-by-breath rows ('data'), beside the force/RR dataset
+BREATHS_GROUP = "breaths"
+# Ring buffer rows between the acquisition worker and this process (~20 minutes at 50 Hz)
+WORKER_CAPACITY_ROWS = 65536
+# Block timestamps: fraction of the offset to the read time corrected per block, and the offset
+# after which the sample clock is re-anchored to the read time (lost samples, paused device)
+CLOCK_DRIFT_GAIN = 0.01
+CLOCK_RESYNC_SECONDS = 1.0
+
+
+class SampleClock:
+    """
+    Timestamps for blocks of device samples from a running sample counter (t0 + k * period)
+    instead of the jittery read times. The counter is steered towards the read times by
+    CLOCK_DRIFT_GAIN of the offset per block, so device/host clock drift is followed slowly,
+    and timestamps never step backwards.
+    """
+
+    def __init__(self, period: float, drift_gain: float = CLOCK_DRIFT_GAIN,
+                 resync_seconds: float = CLOCK_RESYNC_SECONDS):
+        self.period = period
+        self.drift_gain = drift_gain
+        self.resync_seconds = resync_seconds
+        self.reset()
+
+    def reset(self) -> None:
+        self._next = None
+        self._last = None
+        self.resyncs = 0
+
+    def stamp(self, n: int, tsu: float) -> np.ndarray:
+        """Times of n samples read at host time tsu (the newest sample was measured at or before tsu)."""
+        period = self.period
+        if self._next is None or abs(tsu - (self._next + (n - 1) * period)) > self.resync_seconds:
+            start = tsu - (n - 1) * period
+            if self._last is not None:
+                start = max(start, self._last + period)
+                self.resyncs += 1
+        else:
+            start = self._next
+        times = start + np.arange(n) * period
+        # Move the next block by a small part of the offset, but never back by half a period or more
+        correction = max(self.drift_gain * (tsu - times[-1]), -0.5 * period)
+        self._last = float(times[-1])
+        self._next = self._last + period + correction
+        return times
+
+
+def sensor_block(values: dict, tsu: float, last_rr: Optional[float],
+                 clock: Optional[SampleClock] = None) -> Optional[np.ndarray]:
+    """
+    Rows (STREAM_DTYPE) of the samples drained from the sensors at one read at host time tsu.
+
+    Args:
+        values (dict): {sensor_description: float array of its buffered values}.
+        last_rr (float): Respiration Rate carried forward into rows without a new value.
+        clock (SampleClock): Stamps the samples of the block; without one every row is
+            stamped tsu (one-row reads).
+
+    Returns:
+        np.ndarray | None: The rows, or None when no force sample was buffered.
+    """
+    force = values.get("Force", np.zeros(0))
+    n = len(force)
+    if n == 0:
+        return None
+
+    rows = np.zeros(n, dtype=STREAM_DTYPE)
+    rows['timestamp_unix'] = clock.stamp(n, tsu) if clock is not None else tsu
+    rows['force'] = force
+    # Align the newest Respiration Rate values with the newest force samples; rows without
+    # one carry the previous value forward
+    rr = values.get("Respiration Rate", np.zeros(0))[-n:]
+    rows['RR'] = np.nan if last_rr is None else last_rr
+    if len(rr):
+        rows['RR'][n - len(rr):] = rr
+    return rows
+
+
+def _finite_or_none(value) -> Optional[float]:
+    return float(value) if np.isfinite(value) else None
+
+
+class VernierSource:
+    """
+    Go Direct belt acquisition for a DeviceWorker process ("VernierManager:VernierSource"):
+    opens the device, reads and timestamps its samples and returns them as STREAM_DTYPE rows.
+    """
+    dtype = STREAM_DTYPE
+
     def __init__(self):
+        self._godirect = None
+        self._device = None
+        self._sensors = None
+        self.sample_period_ms = DEFAULT_SAMPLE_PERIOD_MS
+        self.block_mode = False
+        self._last_force = None
+        self._last_rr = None
+        self._clock = None
+        self._samples = 0
+        self._reads = 0
+
+    def open(self, sample_period_ms: int = DEFAULT_SAMPLE_PERIOD_MS, block_mode: bool = False) -> dict:
+        """Connect to the first Go Direct device and start sampling (RuntimeError if none is found)."""
+        self.sample_period_ms = int(sample_period_ms)
+        self.block_mode = block_mode
+        self._clock = SampleClock(self.sample_period_ms / 1000.0) if block_mode else None
+        self._godirect = GoDirect(use_ble=True, use_usb=True)
+        print("GoDirect v" + str(self._godirect.get_version()))
+        self._device = self._godirect.get_device(threshold=-100)
+        if self._device is None or not self._device.open(auto_start=False):
+            raise RuntimeError("No Vernier device found. Please check your hardware connection.")
+        self._device.enable_sensors([1, 2])
+        self._device.start(period=self.sample_period_ms)
+        self._sensors = self._device.get_enabled_sensors()
+        print(f"Connected to {self._device.name}, sampling every {self.sample_period_ms} ms")
+        return {'name': self._device.name, 'sensors': [sensor.sensor_description for sensor in self._sensors]}
+
+    def read_block(self) -> Optional[np.ndarray]:
+        """Rows of one device read (ConnectionError when the device is gone)."""
+        if not self._device.read():
+            raise ConnectionError("Vernier device disconnected")
+        tsu = tm.get_timestamp_ns() * 1e-9
+        values = {}
+        for sensor in self._sensors:
+            values[sensor.sensor_description] = np.asarray(sensor.values, dtype='f8')
+            sensor.clear()
+        if not self.block_mode:
+            # One row per read with the first value of each sensor, like collect_data
+            values = {name: value[:1] for name, value in values.items()}
+            if not len(values.get("Force", ())) and self._last_force is not None:
+                values["Force"] = np.array([self._last_force])
+        rows = sensor_block(values, tsu, self._last_rr, self._clock)
+        if rows is None:
+            return None
+        self._last_force = float(rows['force'][-1])
+        self._last_rr = _finite_or_none(rows['RR'][-1])
+        self._samples += len(rows)
+        self._reads += 1
+        return rows
+
+    def status(self) -> dict:
+        return {'device': self._device.name if self._device is not None else None,
+                'samples': self._samples, 'reads': self._reads,
+                'clock_resyncs': self._clock.resyncs if self._clock is not None else None}
+
+    def close(self) -> None:
+        try:
+            if self._device is not None:
+                self._device.stop()
+                self._device.close()
+        finally:
+            if self._godirect is not None:
+                self._godirect.quit()
+            self._device = None
+            self._godirect = None
+
+
+class VernierManager:
+    def __init__(self, marker_timeline: MarkerTimeline = None, session_store: SessionStore = None,
+                 swmr: bool = False, sample_period_ms: int = DEFAULT_SAMPLE_PERIOD_MS, block_mode: bool = False,
+                 breath_detection: bool = True, use_process: bool = False):
+        """
+        Args:
+            sample_period_ms (int): Device sample period, >= MIN_SAMPLE_PERIOD_MS (default 100 ms = 10 Hz).
+            block_mode (bool): Drain every sample buffered by the device on each read() and write
+                them as one block, instead of one row (the first value) per read.
+            breath_detection (bool): Detect breaths from the force channel while recording and
+                write them to the 'breaths' group (see StreamingRespiration).
+            use_process (bool): Read the device in a separate worker process (VernierSource in a
+                DeviceWorker) and only write and analyse its rows in this process.
+        """
+        if sample_period_ms < MIN_SAMPLE_PERIOD_MS:
+            raise ValueError(f"sample_period_ms must be >= {MIN_SAMPLE_PERIOD_MS} ms")
+        self.sample_period_ms = int(sample_period_ms)
+        self.block_mode = block_mode
+        self.marker_timeline = marker_timeline or MarkerTimeline()
+        # When set, the stream is a group of the session file written by the store's thread
+        self.session_store = session_store
+        # Keep the file readable by LiveReader while recording (single-writer/multiple-reader)
+        self.swmr = swmr
+        self.hdf5_group = None
         self._device = None
         self._sensors = None
-        self._event_marker = "start_up"
-        self._condition = 'None'
         self._experimenter_name = None
         self._experiment_name = None
         self._trial_name = None
@@ -31,15 +235,8 @@ class VernierManager:
         self._running = False
         self._streaming = False
         self._current_row = {
-                                "experiment_name": None,
-                                "trial_name": None,
-                                "subject_id": None,
-                                "experimenter_name": None,
                                 "timestamp_unix": None, 
-                                "timestamp": None, "force": 
-                                None, "RR": None, 
-                                "event_marker": self._event_marker, 
-                                "condition": self._condition
+                                "force": None, "RR": None
                             }
         
         self._device_started = False
@@ -48,7 +245,33 @@ class VernierManager:
         self._num_crashes = 0
         self._godirect = None
         self._dataset = None
+        self._appender = None
+        # history_rows: last ~10 minutes at the sample rate kept in memory for the live tail endpoint
+        rate_hz = 1000.0 / self.sample_period_ms
+        self.appender_options = {"flush_rows": max(64, int(rate_hz * 4)), "flush_interval": 1.0,
+                                 "history_rows": int(HISTORY_SECONDS * rate_hz)}
+        self._samples = 0
+        self._reads = 0
+        self.hdf5_layout = {"chunk_rows": 4096, "compression": "gzip", "compression_opts": 4, "shuffle": True}
         self._file_opened = False
+        # Metadata set while the file is in SWMR mode, written when it closes
+        self._deferred_metadata = None
+
+        # Breath-by-breath intervals and rate from the force signal (needs > 2 Hz sampling)
+        # Block timestamps from a running sample counter (monotonic despite read-time jitter)
+        self._clock = SampleClock(self.sample_period_ms / 1000.0)
+        self._breaths = BreathDetector(rate_hz) if breath_detection and rate_hz > 2 * BREATH_BAND[1] else None
+        self._breath_appender = None
+        # Path of the breaths group in the file ('breaths', or 'respiratory/breaths' in a session file)
+        self.breaths_group = None
+        self.breath_appender_options = {"flush_rows": 8, "flush_interval": 1.0, "history_rows": 3600}
+        # Marker changes are written as they happen, so a crashed file still has its markers
+        self._marker_log = None
+        self.marker_log_options = {"flush_rows": 1, "flush_interval": 1.0}
+
+        # Out-of-process acquisition: rows arrive through the worker's shared-memory ring buffer
+        self.use_process = use_process
+        self._worker = None
     
     @property
     def device_started(self):
@@ -68,19 +291,19 @@ class VernierManager:
 
     @property
     def event_marker(self):
-        return self._event_marker
+        return self.marker_timeline.event_marker
     
     @event_marker.setter
     def event_marker(self, value):
-        self._event_marker = value
+        self.marker_timeline.set_marker(value)
 
     @property
     def condition(self):
-        return self._condition
+        return self.marker_timeline.condition
     
     @condition.setter
     def condition(self, value):
-        self._condition = value
+        self.marker_timeline.set_condition(value)
 
     def set_metadata(self, experiment_name: str, trial_name: str, 
                  subject_id: str, experimenter_name: str = 'Unknown'):
@@ -97,8 +320,31 @@ class VernierManager:
         self._subject_id = subject_id
         self._experimenter_name = experimenter_name
         
+        self._write_metadata_attrs()
         print(f"Metadata set: {experiment_name}/{trial_name}/{subject_id}")
         
+    def _metadata(self) -> dict:
+        return {
+            'experiment_name': self._experiment_name,
+            'trial_name': self._trial_name,
+            'subject_id': self._subject_id,
+            'experimenter_name': self._experimenter_name,
+        }
+
+    def _write_metadata_attrs(self):
+        """Store the session metadata once as dataset attributes instead of in every row."""
+        metadata = self._metadata()
+        if self.hdf5_group is not None and self._appender is not None:
+            self._appender.submit(lambda group: write_metadata_attrs(group['data'], metadata), structural=True)
+            return
+        if self._dataset is None or 'experiment_name' in self._dataset.dtype.names:
+            return
+        if self.hdf5_file is not None and self.hdf5_file.swmr_mode:
+            # HDF5 cannot write attributes safely in SWMR mode; the close step writes them
+            self._deferred_metadata = metadata
+            return
+        write_metadata_attrs(self._dataset, metadata)
+
     def set_data_folder(self, subject_folder):
         self.data_folder = os.path.join(subject_folder, "respiratory_data")
         if not os.path.exists(self.data_folder):
@@ -132,35 +378,33 @@ class VernierManager:
         os.makedirs(os.path.dirname(self.hdf5_filename), exist_ok=True)
         
         try:
+            if self.session_store is not None:
+                self._open_session_stream()
+                return
+
             if self._crashed:
                 current_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")  
                 self.hdf5_filename = os.path.join(self.data_folder, f"{current_date}_{self._subject_id}_respiratory_data_{self._num_crashes}.h5")
                 self.csv_filename = os.path.join(self.data_folder, f"{current_date}_{self._subject_id}_respiratory_data_{self._num_crashes}.csv")
 
             print(f"Initializing Vernier HDF5 file at: {self.hdf5_filename}")
-            self.hdf5_file = h5py.File(self.hdf5_filename, 'a')  
+            self.hdf5_file = open_stream_file(self.hdf5_filename, swmr=self.swmr)
 
             if 'data' not in self.hdf5_file:  
-                dtype = np.dtype([
-                    ('experiment_name', h5py.string_dtype(encoding='utf-8')),
-                    ('trial_name', h5py.string_dtype(encoding='utf-8')),
-                    ('subject_id', h5py.string_dtype(encoding='utf-8')),
-                    ('experimenter_name', h5py.string_dtype(encoding='utf-8')),
-                    ('timestamp_unix', 'f8'),
-                    ('timestamp', h5py.string_dtype(encoding='utf-8')),
-                    ('force', 'f4'),
-                    ('RR', 'f4'),
-                    ('event_marker', h5py.string_dtype(encoding='utf-8')),
-                    ('condition', h5py.string_dtype(encoding='utf-8')),
-                ])
-                self._dataset = self.hdf5_file.create_dataset(
-                    'data', shape=(0,), maxshape=(None,), dtype=dtype
-                )
+                self._dataset = create_stream_dataset(self.hdf5_file, 'data', STREAM_DTYPE, self.hdf5_layout)
                 print("✓ Created Vernier HDF5 dataset")
             else:
                 self._dataset = self.hdf5_file['data']
                 print("✓ Using existing Vernier HDF5 dataset")
 
+            self._write_metadata_attrs()
+            self._appender = HDF5Appender(self._dataset, swmr=self.swmr, **self.appender_options)
+            # Side datasets must exist before the file switches to SWMR mode
+            self._open_breath_stream()
+            self._open_marker_log()
+            if self.swmr:
+                self.hdf5_file.swmr_mode = True
+
             self._file_opened = True
             print(f"✓ Vernier HDF5 file initialized: {self.hdf5_filename}")
 
@@ -169,6 +413,45 @@ class VernierManager:
             print(f"✗ {error_msg}")
             raise RuntimeError(error_msg) from e
 
+    def _open_session_stream(self):
+        """Register this stream with the session store instead of opening a separate file."""
+        self.hdf5_filename = self.session_store.filename
+        self.hdf5_group = SESSION_STREAM
+        self._appender = self.session_store.open_stream(SESSION_STREAM, STREAM_DTYPE, self.hdf5_layout,
+                                                        **self.appender_options)
+        self._open_breath_stream()
+        self._open_marker_log()
+        self._write_metadata_attrs()
+        self._file_opened = True
+        print(f"✓ Vernier stream '{SESSION_STREAM}' initialized in session file: {self.hdf5_filename}")
+
+    def _open_breath_stream(self):
+        """Open the breaths group beside 'data' (or in the session file) when detection is enabled."""
+        if self._breaths is None:
+            return
+        if self.session_store is not None:
+            self.breaths_group = f"{SESSION_STREAM}/{BREATHS_GROUP}"
+            self._breath_appender = self.session_store.open_stream(self.breaths_group, BREATH_DTYPE, self.hdf5_layout,
+                                                                   **self.breath_appender_options)
+            return
+        parent = self.hdf5_file.require_group(BREATHS_GROUP)
+        dataset = parent['data'] if 'data' in parent else create_stream_dataset(parent, 'data', BREATH_DTYPE,
+                                                                                self.hdf5_layout)
+        self.breaths_group = BREATHS_GROUP
+        self._breath_appender = HDF5Appender(dataset, swmr=self.swmr, **self.breath_appender_options)
+
+    def _open_marker_log(self):
+        """Open the marker log beside 'data' (or in the session file) and start following the timeline."""
+        if self.session_store is not None:
+            appender = self.session_store.open_stream(f"{SESSION_STREAM}/{MARKER_LOG_GROUP}", MARKER_LOG_DTYPE,
+                                                      self.hdf5_layout, **self.marker_log_options)
+        else:
+            parent = self.hdf5_file.require_group(MARKER_LOG_GROUP)
+            dataset = parent['data'] if 'data' in parent else create_stream_dataset(parent, 'data', MARKER_LOG_DTYPE,
+                                                                                    self.hdf5_layout)
+            appender = HDF5Appender(dataset, swmr=self.swmr, **self.marker_log_options)
+        self._marker_log = MarkerLog(self.marker_timeline, appender)
+
     def reset(self) -> None:
         # Immediately close the HDF5 file and convert it to CSV
         try:
@@ -183,6 +466,13 @@ class VernierManager:
                 print(f"Error converting HDF5 to CSV: {inner_e}")
         except Exception as e:
             print(f"Error closing HDF5 file: {e}")
+
+        if self._worker is not None:
+            try:
+                self._worker.close()
+            except Exception as e:
+                print(f"Error closing Vernier device worker: {e}")
+            self._worker = None
             
         # Quit the GoDirect instance and close the event loop
         try:
@@ -209,20 +499,23 @@ class VernierManager:
         self._sensors = None
         self._godirect = None
         self._current_row = {
-                                "experiment_name": None,
-                                "trial_name": None,
-                                "subject_id": None,
-                                "experimenter_name": None,
                                 "timestamp_unix": None, 
-                                "timestamp": None, "force": None, 
-                                "RR": None, "event_marker": self._event_marker, 
-                                "condition": self._condition, 
+                                "force": None, 
+                                "RR": None
                              }
         self._streaming = False
         self.running = False
         self.hdf5_file = None
+        self._samples = 0
+        self._reads = 0
+        self.breaths_group = None
+        if self._breaths is not None:
+            self._breaths.reset()
+        self._clock.reset()
 
     def start(self) -> str:
+        if self.use_process:
+            return self._start_worker()
         try:
             loop = asyncio.get_event_loop()
             if hasattr(loop, "is_closed") and loop.is_closed():
@@ -251,7 +544,8 @@ class VernierManager:
                 sensor_list = self._device.list_sensors()
                 print("Sensors found: "+ str(sensor_list))
                 self._device.enable_sensors([1,2])
-                self._device.start(period=100) 
+                self._device.start(period=self.sample_period_ms)
+                print(f"Sampling every {self.sample_period_ms} ms ({1000.0 / self.sample_period_ms:g} Hz)")
                 print("Connecting to Vernier device...")
                 print("Connected to " + self._device.name)
                 self._sensors = self._device.get_enabled_sensors()
@@ -268,6 +562,33 @@ class VernierManager:
             self._sensors = None
             self._device_started = False
             return f"Error connecting to Vernier device: {str(e)}"
+
+    def _start_worker(self) -> str:
+        """Launch the acquisition worker process and open the device in it."""
+        try:
+            if self._worker is not None:
+                self._worker.close()
+            self._worker = DeviceWorker("VernierManager:VernierSource", self._on_worker_rows,
+                                        on_error=self._on_worker_error, capacity=WORKER_CAPACITY_ROWS)
+            self._worker.launch()
+            device = self._worker.open(timeout=30, sample_period_ms=self.sample_period_ms,
+                                       block_mode=self.block_mode)
+            print("Connected to " + device['name'] + " (worker process)")
+            self._device_started = True
+            return "Vernier device started."
+        except Exception as e:
+            print(f"Error starting Vernier device worker: {e}")
+            if self._worker is not None:
+                self._worker.close()
+                self._worker = None
+            self._device_started = False
+            if "No Vernier device found" in str(e):
+                return "No Vernier device found. Please check your hardware connection."
+            return f"Error connecting to Vernier device: {str(e)}"
+
+    def worker_status(self) -> Optional[dict]:
+        """Acquisition worker process and ring buffer state (see DeviceWorker); None without a worker."""
+        return self._worker.status() if self._worker is not None else None
     
     def collect_data(self):
         if not self.running:
@@ -277,19 +598,13 @@ class VernierManager:
         while self._streaming and self.running:
             try:
                 if self._device.read():
-                    tsu = tm.get_timestamp("unix")
-                    if isinstance(tsu, str):
-                        tsu = float(tsu)
-                    ts = datetime.fromtimestamp(tsu).isoformat()
-
-                    self._current_row["experiment_name"] = self._experiment_name
-                    self._current_row["trial_name"] = self._trial_name
-                    self._current_row["subject_id"] = self._subject_id
-                    self._current_row["experimenter_name"] = self._experimenter_name
+                    tsu = tm.get_timestamp_ns() * 1e-9
+
+                    if self.block_mode:
+                        self._write_block(tsu)
+                        continue
+
                     self._current_row["timestamp_unix"] = tsu
-                    self._current_row["timestamp"] = ts
-                    self._current_row["event_marker"] = self.event_marker
-                    self._current_row["condition"] = self.condition
                     
                     for sensor in self._sensors:
                         if sensor.sensor_description == "Force":
@@ -310,6 +625,8 @@ class VernierManager:
                         sensor.clear()
 
                     self.write_to_hdf5(self._current_row)
+                    if self._current_row["force"] is not None:
+                        self._detect_breaths(tsu, np.array([tsu]), np.array([self._current_row["force"]]))
 
                 else:
                     print("DEVICE HAS DISCONNECTED - RESTART VERNIER MANAGER.")
@@ -328,6 +645,58 @@ class VernierManager:
                 self.reset()
                 return
 
+    def _sensor_values(self) -> dict:
+        """Drain every enabled sensor: {sensor_description: float array of its buffered values}."""
+        values = {}
+        for sensor in self._sensors:
+            values[sensor.sensor_description] = np.asarray(sensor.values, dtype='f8')
+            sensor.clear()
+        return values
+
+    def _write_block(self, tsu: float) -> None:
+        """
+        Write all samples buffered since the last read() as one block, stamped by the
+        sample clock (see SampleClock).
+        """
+        rows = sensor_block(self._sensor_values(), tsu, self._current_row["RR"], self._clock)
+        if rows is not None:
+            self._record_block(rows)
+
+    def _record_block(self, rows: np.ndarray) -> None:
+        """Write a block of STREAM_DTYPE rows and feed its force samples to the breath detector."""
+        tsu = float(rows['timestamp_unix'][-1])
+        self._current_row["timestamp_unix"] = tsu
+        self._current_row["force"] = float(rows['force'][-1])
+        self._current_row["RR"] = _finite_or_none(rows['RR'][-1])
+        self._samples += len(rows)
+        self._reads += 1
+        self.write_block_to_hdf5(rows)
+        self._detect_breaths(tsu, rows['timestamp_unix'], rows['force'])
+
+    def _on_worker_rows(self, rows: np.ndarray) -> None:
+        """DeviceWorker drain thread: rows read by VernierSource in the worker process."""
+        if self._streaming:
+            self._record_block(rows)
+
+    def _on_worker_error(self, error: str) -> None:
+        """DeviceWorker drain thread: the worker lost the device; same handling as collect_data."""
+        print(f"DEVICE HAS DISCONNECTED ({error}) - RESTART VERNIER MANAGER.")
+        self._crashed = True
+        self._num_crashes += 1
+        self.reset()
+
+    def _detect_breaths(self, now: float, times: np.ndarray, force: np.ndarray) -> None:
+        """Feed force samples to the breath detector and write the breaths it confirms."""
+        if self._breaths is None:
+            return
+        try:
+            self._breaths.push(times, force)
+            breaths = self._breaths.update(now)
+            if breaths is not None and self._breath_appender is not None:
+                self._breath_appender.append_rows(breaths)
+        except Exception as e:
+            print(f"Error detecting breaths: {e}")
+
     def run(self):
         try:
             # Check if the thread exists and is alive
@@ -339,8 +708,14 @@ class VernierManager:
                 self.thread.join()
                 print("Thread stopped.")
             
+            if self._device_started and self._worker is not None:
+                self.running = True
+                self._streaming = True
+                self._worker.start()
+                print("Vernier manager running (worker process)...")
+
             # If the device has started, start a new thread
-            if self._device_started:
+            elif self._device_started:
                 self.running = True
                 self._streaming = True
                 self.thread = Thread(target=self.collect_data, daemon=True)
@@ -355,10 +730,24 @@ class VernierManager:
                  
     def stop(self) -> str:
         try:
+            worker_mode = self._device_started and self._worker is not None
+            if worker_mode:
+                # Delivers the rows still in the ring buffer before the files close;
+                # _on_worker_rows drops rows once _streaming is cleared, so clear it after
+                self._worker.stop()
+                self._worker.close()
+                self._worker = None
             self.running = False
             self._streaming = False
             print("Stopping Vernier manager...")
-            if self._device_started:
+            if worker_mode:
+                if self._file_opened:
+                    print("Stop is closing HDF5 file...")
+                    self.close_h5_file()
+                self._device_started = False
+                print("Vernier manager stopped.")
+                return "Vernier manager stopped."
+            elif self._device_started:
                 if self.thread is not None and self.thread.is_alive():
                     self.thread.join()
                     print("Thread stopped.")
@@ -393,95 +782,131 @@ class VernierManager:
             print(f"An error occurred: {e}")
             return f"An error occurred: {e}"
         
-    def _resize_dataset(self, new_size):
-        """Resize the HDF5 dataset while ensuring thread synchronization."""
+    def write_to_hdf5(self, row: dict) -> None:
+        """Stage the incoming dictionary as a single row; HDF5Appender writes it in blocks."""
         try:
-            current_size = self._dataset.shape[0]
-            if new_size > current_size:
-                self._dataset.resize(new_size, axis=0)
+            if self._appender is None:
+                print("HDF5 file or dataset is not initialized.")
+                return
+
+            if is_schema_v1(self._dataset):
+                # Existing version 1 file: keep filling the columns rows no longer carry
+                row = legacy_row(row, self._metadata(), 'timestamp', local_iso=True,
+                                 extra={'event_marker': self.event_marker, 'condition': self.condition})
+            self._appender.append(row)
 
         except Exception as e:
-            print(f"Error resizing dataset: {e}")
+            print(f"Error writing to HDF5: {e}")
 
-    def write_to_hdf5(self, row: dict) -> None:
-        """Write the incoming dictionary to the HDF5 dataset as a single row."""
+    def write_block_to_hdf5(self, rows: np.ndarray) -> None:
+        """Stage a structured block of rows (STREAM_DTYPE) with one vectorized append."""
         try:
-            if self.hdf5_file is None or self._dataset is None:
+            if self._appender is None:
                 print("HDF5 file or dataset is not initialized.")
                 return
 
-            new_data = np.zeros(1, dtype=self._dataset.dtype)  
-            new_data[0]['experiment_name'] = row.get('experiment_name', '')
-            new_data[0]['trial_name'] = row.get('trial_name', '')
-            new_data[0]['subject_id'] = row.get('subject_id', '')
-            new_data[0]['experimenter_name'] = row.get('experimenter_name', '')
-            new_data[0]['timestamp_unix'] = row.get('timestamp_unix', np.nan)
-            new_data[0]['timestamp'] = row.get('timestamp', '')  
-            new_data[0]['force'] = row.get('force', np.nan)
-            new_data[0]['RR'] = row.get('RR', np.nan)
-            new_data[0]['event_marker'] = row.get('event_marker', '')
-            new_data[0]['condition'] = row.get('condition', '')
-            
-            new_size = self._dataset.shape[0] + 1
-            self._resize_dataset(new_size)  
-            self._dataset[-1] = new_data[0]
+            self._appender.append_rows(rows)
 
         except Exception as e:
             print(f"Error writing to HDF5: {e}")
 
+    def sampling_stats(self) -> dict:
+        """Configured sample period and, in block mode, the samples drained per read."""
+        return {
+            'sample_period_ms': self.sample_period_ms,
+            'rate_hz': 1000.0 / self.sample_period_ms,
+            'block_mode': self.block_mode,
+            'samples': self._samples,
+            'reads': self._reads,
+            'samples_per_read': round(self._samples / self._reads, 2) if self._reads else None,
+            'clock_resyncs': self._clock.resyncs,
+        }
+
+    def recent_rows(self, seconds: float = None):
+        """Newest rows kept in memory by the appender (see HDF5Appender.recent); None when not recording."""
+        if self._appender is None:
+            return None
+        return self._appender.recent(seconds)
+
+    def recent_breaths(self, seconds: float = None):
+        """Newest breath rows kept in memory; None when not recording or detection is disabled."""
+        if self._breath_appender is None:
+            return None
+        return self._breath_appender.recent(seconds)
+
+    @property
+    def latest_breath(self) -> Optional[dict]:
+        """Most recent breath found by the detector (None before the first one)."""
+        return self._breaths.latest if self._breaths is not None else None
+
+    def _finalize_stream(self, parent):
+        """Close-time objects written beside 'data': markers table, marker row index, summary pyramid."""
+        if self._deferred_metadata is not None:
+            write_metadata_attrs(parent['data'], self._deferred_metadata)
+            self._deferred_metadata = None
+        self.marker_timeline.write_to_hdf5(parent)
+        write_marker_index(parent)
+        write_pyramid(parent)
+
     def close_h5_file(self):
-        if self.hdf5_file:
-            self.hdf5_file.flush()
-            self.hdf5_file.close()
+        if self._breath_appender is not None:
+            self._breath_appender.close()
+            self._breath_appender = None
+        if self._marker_log is not None:
+            self._marker_log.close()
+            self._marker_log = None
+        if self.hdf5_group is not None and self._appender is not None:
+            self._appender.close(finalize=self._finalize_stream)
+            self._appender = None
+            print(f"Stream '{self.hdf5_group}' closed in session file '{self.hdf5_filename}'.")
+            return
+        elif self.hdf5_file:
+            if self._appender is not None:
+                self._appender.close()
+                self._appender = None
+            close_stream_file(self.hdf5_file, finalize=self._finalize_stream)
             print(f"HDF5 file '{self.hdf5_filename}' closed.")
             return 
         else:
             print("HDF5 file is already closed or isn't initialized.")
             return  
         
-    def hdf5_to_csv(self):
+    def hdf5_to_csv(self, progress=print_progress):
         """
         Convert an HDF5 file to a CSV file.
         Dependencies:
             h5_filename (str): The path to the HDF5 file.
             csv_filename (str): The path to the CSV file to be created.
+        Returns:
+            int: Rows written, or None if the conversion failed.
         """
         try:
-            chunk_size = 1000
-            with h5py.File(self.hdf5_filename, 'r') as h5_file:
-                if 'data' not in h5_file:
-                    print(f"Dataset 'data' not found in the file {self.hdf5_filename}.")
-                    return
-                
-                dataset = h5_file['data']
-                field_names = dataset.dtype.names
-                first_chunk = True
-
-                for start in range(0, dataset.shape[0], chunk_size):
-                    end = min(start + chunk_size, dataset.shape[0])
-                    chunk = dataset[start:end]
-
-                    chunk_dict = {
-                        field: np.char.decode(chunk[field], 'utf-8') if chunk[field].dtype.kind == 'S' 
-                            else [x.decode('utf-8') if isinstance(x, bytes) else x for x in chunk[field]]
-                        for field in field_names
-                    }
-
-                    chunk_df = pd.DataFrame(chunk_dict)
-
-                    if first_chunk:
-                        chunk_df.to_csv(self.csv_filename, mode='w', index=False, header=True)
-                        first_chunk = False
-                    else:
-                        chunk_df.to_csv(self.csv_filename, mode='a', header=False, index=False)
-            
+            rows = export_hdf5_to_csv(self.hdf5_filename, self.csv_filename, iso_column='timestamp',
+                                      progress=progress, label='Vernier', group=self.hdf5_group)
             print("CSV file created successfully.")
             print(f"HDF5 file '{self.hdf5_filename}' successfully converted to CSV file '{self.csv_filename}'.")
-            return 
-        
+            return rows
+
         except FileNotFoundError:
             print(f"Error: The HDF5 file '{self.hdf5_filename}' was not found.")
-            return 
         except Exception as e:
             print(f"Error converting HDF5 to CSV: {e}")
-            return 
\ No newline at end of file
+
+    def hdf5_to_parquet(self, progress=print_progress):
+        """
+        Convert HDF5 to a Parquet file next to the CSV (see ParquetStore).
+
+        Returns:
+            int: Rows written, or None if the conversion failed.
+        """
+        try:
+            parquet_filename = parquet_path_for(self.csv_filename)
+            rows = export_hdf5_to_parquet(self.hdf5_filename, parquet_filename, iso_column='timestamp',
+                                          progress=progress, label='Vernier', group=self.hdf5_group)
+            print(f"HDF5 file '{self.hdf5_filename}' successfully converted to Parquet file '{parquet_filename}'.")
+            return rows
+
+        except FileNotFoundError:
+            print(f"Error: The HDF5 file '{self.hdf5_filename}' was not found.")
+        except Exception as e:
+            print(f"Error converting HDF5 to Parquet: {e}")
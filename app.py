@@ -16,6 +16,7 @@ GLOBAL STATE:
     ACTIVE_SESSIONS (dict): Active experiment sessions {session_id: session_data}
     
     Manager instances:
+        marker_timeline (MarkerTimeline): Shared event marker/condition interval table for all streams
         event_manager (EventManager): EmotiBit event marker management
         subject_manager (SubjectManager): Participant data management
         audio_file_manager (AudioFileManager): Audio file storage
@@ -25,8 +26,12 @@ GLOBAL STATE:
         form_manager (FormManager): Google Forms URL customization
         vernier_manager (VernierManager): Respiratory sensor streaming
         polar_manager (PolarManager): Polar H10 heart rate streaming
+        polar_hub (PolarHub): Several Polar straps on one event loop (only when POLAR_HUB_MAX_DEVICES
+            is set; replaces polar_manager)
         lsl_manager (LSLManager): Lab Streaming Layer markers
         transcription_manager (TranscriptionManager): Audio-to-text conversion
+        session_store (SessionStore): Single-writer session HDF5 file shared by event/vernier/polar
+            streams (only when USE_SESSION_STORE is set; see attach_session_store)
 
 CONSTANTS:
     EXPERIMENT_TEMPLATES_DIR (str): "experiments/templates" - Saved experiment designs
@@ -36,6 +41,27 @@ CONSTANTS:
     HEARTBEAT_TIMEOUT (int): 60 seconds - Max time between heartbeats before stale
     HEARTBEAT_GRACE_ATTEMPTS (int): 3 - Missed heartbeats before cleanup
     SHUTDOWN_FLAG (threading.Event): Signal for graceful shutdown
+    HDF5_SWMR (bool): env HDF5_SWMR (default false) - Write the Polar/Vernier stream files in HDF5
+        single-writer/multiple-reader mode so they can be read while recording (see LiveReader).
+        The event file and the session file (USE_SESSION_STORE) hold variable-length strings,
+        which HDF5 does not support in SWMR mode, so they are never written in SWMR mode;
+        metadata changed while a file is in SWMR mode is written when the file closes
+    USE_SESSION_STORE (bool): env USE_SESSION_STORE - Write all sensor streams of a session into
+        one <date>_<subject>_session.h5 (groups /event_markers, /cardiac, /respiratory) instead
+        of one HDF5 file per manager
+    POLAR_PMD_STREAMS (tuple): env POLAR_PMD_STREAMS (comma list, e.g. "ecg,acc"; default none) - Raw
+        Polar PMD waveforms recorded next to HR/RR (ECG 130 Hz, accelerometer 200 Hz; see PolarPMD)
+    POLAR_FAKE_DEVICE (bool): env POLAR_FAKE_DEVICE - Feed PolarManager from PolarPMD.FakePolarDevice
+        instead of scanning for a strap
+    VERNIER_SAMPLE_PERIOD_MS (int): env VERNIER_SAMPLE_PERIOD_MS (default 100) - Go Direct sample period;
+        down to 20 ms (50 Hz) for the raw respiration force waveform
+    VERNIER_BLOCK_MODE (bool): env VERNIER_BLOCK_MODE - Drain every buffered sample per device read and
+        append them as one block (needed above 10 Hz)
+    POLAR_HUB_MAX_DEVICES (int): env POLAR_HUB_MAX_DEVICES (default 0 = off) - Record up to this many
+        straps with one PolarHub (group sessions); with POLAR_FAKE_DEVICE the hub simulates that many
+    DEVICE_WORKERS (set): env DEVICE_WORKERS (comma list of "vernier", "polar"; default none) - Run
+        these managers' device acquisition in a separate worker process that hands its rows over
+        through a shared-memory ring buffer (see DeviceWorker); files and detectors stay here
 
 CONFIGURATION:
     Database config loaded from .env:
@@ -259,6 +285,8 @@ POST /start_event_manager
         - Starts event_manager and lsl_manager
     RETURNS: {success: true, message}
     ERRORS: 400 if data_folder not set, 500 on error
+    NOTES: event_manager records one row per marker/condition change; the 100 Hz grid
+           is rebuilt from those transitions at CSV export
 
 POST /stop_event_manager
     DESCRIPTION: Stops EmotiBit event marker collection
@@ -280,6 +308,26 @@ POST /stop_polar_manager
     RETURNS: {success: true, message}
     ERRORS: 400 if not initialized
 
+POST /api/polar-hub/start
+    DESCRIPTION: Scans once and streams every Polar strap found (up to POLAR_HUB_MAX_DEVICES)
+    PROCESSING:
+        - Requires the participant to be saved (metadata and subject folder are set then)
+        - All straps run as tasks of one asyncio loop; each has its own file or session group
+    RETURNS: {success: true, message, devices: [label]} OR {success: false, warning, message} if none found
+    ERRORS: 400 if the hub is not enabled or the participant is not set, 500 on error
+
+POST /api/polar-hub/stop
+    DESCRIPTION: Stops every strap of the hub and closes their files
+    RETURNS: {success: true, message}
+    ERRORS: 400 if the hub is not enabled
+
+GET /api/polar-hub/status
+    DESCRIPTION: Per-strap connection state, rates and drop counters
+    RETURNS: {success: true, running: bool, devices: {label: {address, name, connected, connection: {...},
+              error, hdf5_filename, hdf5_group, hr: {notifications, dropped_notifications,
+              nominal_rate_hz, rate_hz}, pmd: {ecg|acc: {...}}}}}
+    ERRORS: 400 if the hub is not enabled
+
 POST /start_vernier_manager
     DESCRIPTION: Starts Vernier respiratory sensor streaming
     PROCESSING:
@@ -296,15 +344,74 @@ POST /stop_vernier_manager
     ERRORS: 400 if not initialized
 
 GET /api/manager-status
-    DESCRIPTION: Gets running status of all managers
-    RETURNS: {success: true, status: {event_manager: bool, vernier_manager: bool, polar_manager: bool}, any_running: bool}
+    DESCRIPTION: Gets running status of all managers and the newest data of their streams
+    PROCESSING:
+        - Stream files are read through LiveReader (SWMR) while the managers write them
+    RETURNS: {success: true, status: {event_manager: bool, vernier_manager: bool, polar_manager: bool},
+              data: {<manager>: {rows: int, latest: {field: value} | null} | {error},
+                     vernier_sampling: {sample_period_ms, rate_hz, block_mode, samples, reads,
+                                        samples_per_read, clock_resyncs},
+                     polar_connection: {connected, disconnected_since, reconnects,
+                                        last_reconnect_seconds, total_gap_seconds},
+                     polar_pmd: {ecg|acc: {samples, frames, dropped_samples, unsupported_frames,
+                                           nominal_rate_hz, rate_hz}} (only with POLAR_PMD_STREAMS),
+                     device_workers: {vernier|polar: {source, alive, pid, rows_read, dropped_rows,
+                                                      backlog_rows, streaming, rows_written, error,
+                                                      <source status>}} (only with DEVICE_WORKERS)},
+              any_running: bool}
     ERRORS: 500 on error
 
+GET /api/sessions/<session_id>/streams/<stream_name>/tail
+    DESCRIPTION: Decimated newest samples of a sensor stream for live plots
+    PARAMETERS: stream_name in {event_markers, cardiac, respiratory}
+    QUERY: seconds (default 60), points (default 800), method ('lttb' | 'minmax', default 'lttb')
+    PROCESSING:
+        - Reads the manager's in-memory history while recording: rows of the last `seconds` up to
+          now (empty if the device stopped delivering). Otherwise the stream file (LiveReader): the
+          `seconds` before its newest row
+        - event_markers in transitions mode (one row per change): the change in effect at the
+          window start is included, stamped at the window start, so a window without changes still
+          shows the current marker (in memory; file reads return the changes inside the window only)
+        - Numeric fields decimated to <= points points; marker/condition fields reduced to change points
+    RETURNS: {success: true, stream, source: 'memory'|'file', method, seconds, rows,
+              series: {field: {timestamp_unix: [...], values: [...]}}}
+    ERRORS: 400 bad parameters, 404 unknown session/stream or no data, 500 on error
+
+GET /api/sessions/<session_id>/streams/<stream_name>/slice
+    DESCRIPTION: Rows of a sensor stream for one time range or one event marker
+    QUERY: event_marker, or t0 [, t1] (unix seconds, rows with t0 <= timestamp_unix < t1)
+    PROCESSING:
+        - StreamSlicer binary-searches timestamp_unix in the stream file; marker slices use the
+          markers/row_ranges index persisted at close (searched on the fly while recording)
+    RETURNS: {success: true, stream, event_marker, rows, data: [{field: value}]}
+    ERRORS: 400 bad parameters, 404 unknown session/stream or no data, 500 on error
+
+GET /api/sessions/<session_id>/hrv
+    DESCRIPTION: Live HRV features of the Polar stream (StreamingHRV.HRVFeatureEngine)
+    QUERY: seconds (default 300) - history of feature rows to return
+    PROCESSING:
+        - One row per second over a 5 minute beat window: beats, mean_nn, sdnn, rmssd, pnn50 (ms / %),
+          lf_power, hf_power (ms^2, Lomb-Scargle), lf_hf
+        - Rows come from memory while recording, otherwise from the stream file's hrv dataset
+    RETURNS: {success: true, source: 'memory'|'file', latest: {feature: value} | null, rows, data: [{feature: value}]}
+    ERRORS: 400 bad parameters, 404 unknown session or no HRV data, 500 on error
+
+GET /api/sessions/<session_id>/breaths
+    DESCRIPTION: Breath-by-breath respiration from the Vernier force signal (StreamingRespiration)
+    QUERY: seconds (default 300) - history of breaths to return
+    PROCESSING:
+        - Band-passed force, inhalation peaks and exhalation troughs detected on a sliding buffer
+          while recording; one row per breath: timestamp_unix (peak), exhale_unix (trough),
+          interval_s, rate_bpm, amplitude
+        - Rows come from memory while recording, otherwise from the stream file's breaths dataset
+    RETURNS: {success: true, source: 'memory'|'file', latest: {field: value} | null, rows, data: [{field: value}]}
+    ERRORS: 400 bad parameters, 404 unknown session or no breath data, 500 on error
+
 POST /set_event_marker
     DESCRIPTION: Sets event marker for managers
     REQUEST: {event_marker: str}
     PROCESSING:
-        - Sets event_marker on event_manager, vernier_manager, polar_manager
+        - Sets event_marker once on marker_timeline (shared by event_manager, vernier_manager, polar_manager)
         - Sends marker via lsl_manager
     RETURNS: {status: "Event marker set."}
     ERRORS: 400 on error
@@ -312,7 +419,7 @@ POST /set_event_marker
 POST /set_condition
     DESCRIPTION: Sets experimental condition
     REQUEST: {condition: str}
-    PROCESSING: Sets event_manager.condition
+    PROCESSING: Sets the condition on marker_timeline
     RETURNS: {success: true, message}
     ERRORS: 400 if condition empty, 500 on error
 
@@ -374,6 +481,7 @@ POST /process_audio_files
           timestamp_unix, timestamp_iso, file_name, transcription, SER_Emotion_Label_1-3,
           SER_Confidence_1-3
         - Saves to: {subject_folder}/{date}_{experiment}_{trial}_{subject}_SER.csv
+          (plus a .parquet copy when pyarrow is installed)
     RETURNS: {message: "Audio files processed successfully.", path: csv_path}
     ERRORS: 500 on processing error
 
@@ -538,14 +646,48 @@ POST /process_answer
 === DATA PROCESSING ===
 
 POST /api/convert-hdf5-to-csv
-    DESCRIPTION: Converts HDF5 data files to CSV format
-    REQUEST: {session_id: str}
+    DESCRIPTION: Converts HDF5 data files to CSV and Parquet format
+    REQUEST: {session_id: str, formats: ["csv", "parquet"] (optional; default both, CSV only without pyarrow)}
     PROCESSING:
-        - Calls hdf5_to_csv() on event_manager, vernier_manager, polar_manager
+        - Runs hdf5_to_csv() / hdf5_to_parquet() on event_manager, vernier_manager, polar_manager
+          in parallel (HDF5Exporter.convert_in_parallel); progress is printed per exported chunk
+        - With Parquet: also writes the subject CSV and *_SER.csv as Parquet (ParquetStore)
         - Collects success/error results
     RETURNS: {success: true, message, converted_files, errors}
     ERRORS: 400 if no active managers, 500 on error
 
+POST /api/align-session
+    DESCRIPTION: Aligns all streams of the session's subject onto one timeline (SessionAligner)
+    REQUEST: {session_id: str, rate_hz: float (default 10), method: 'asof' | 'linear' (default 'asof'),
+              formats: ["parquet", "hdf5"] (optional; default both, HDF5 only without pyarrow)}
+    PROCESSING:
+        - Reads event, cardiac, respiratory (all crash-numbered files), EmotiBit CSVs, SER and
+          audio/transcription tables of the subject directory
+        - As-of joins each stream onto the grid with np.searchsorted (per-stream max sample age)
+        - Writes <subject>_aligned.parquet / .h5 in the subject directory
+    RETURNS: {success: true, files: {format: path}}
+    ERRORS: 400 bad parameters or no subject directory, 404 no streams found, 500 on error
+
+POST /api/extract-features
+    DESCRIPTION: Starts an update of the per-marker-segment feature table of all subjects (FeatureExtractor)
+    REQUEST: {experiment: str (optional, only this experiment), workers: int (optional), force: bool}
+    PROCESSING:
+        - Runs `python FeatureExtractor.py` as a background job (BackgroundJobs); the request
+          returns at once, the extraction never runs in (or forks) the app process
+        - Walks EXPERIMENT_SUBJECT_DATA_DIR/<experiment>/<trial>/<subject>, one spawned process pool task per subject
+        - Subjects whose input files are unchanged since the last run keep their previous rows
+        - Features per segment: mean HR, RMSSD, respiration rate, force amplitude, EmotiBit EDA stats
+        - Writes EXPERIMENT_SUBJECT_DATA_DIR/features.parquet (features.csv without pyarrow)
+    RETURNS: 202 {success: true, job_id} - poll GET /api/jobs/<job_id>; the finished job's result is
+             {output, subjects, computed: [...], skipped: [...], errors: {subject: message}, rows, seconds}
+    ERRORS: 400 bad parameters, 500 if the job cannot be started
+
+GET /api/jobs/<job_id>
+    DESCRIPTION: Status of a background job (feature extraction, EmotiBit CSV import)
+    RETURNS: {success: true, job: {job_id, kind, state: 'running' | 'done' | 'failed', started_unix,
+              finished_unix, seconds, returncode, result, error, log_tail (failed jobs only)}}
+    ERRORS: 404 unknown job id (jobs are kept in memory for the app's lifetime)
+
 POST /api/push-to-database
     DESCRIPTION: Pushes CSV data to PostgreSQL database
     REQUEST: {session_id: str}
@@ -576,8 +718,13 @@ POST /import_emotibit_csv
         - Renames to: {time_started}_{subject_id}_emotibit_ground_truth[_{N}].csv
         - Handles duplicate filenames with counter
         - Saves to event_manager.data_folder
-    RETURNS: {success: true, message, file_path(s), uploaded_files} OR
+        - Starts one background job (`python EmotiBitImport.py <csvs>`, BackgroundJobs) that writes
+          {name}.h5 beside each CSV: one group per sensor type tag with its samples and
+          1 s / 10 s / 60 s min/mean/max summaries (EmotiBitImport, SummaryPyramid); the upload
+          does not wait for it
+    RETURNS: {success: true, message, file_path(s), uploaded_files, summary_job_id} OR
              {success: false, message, errors}
+             (poll GET /api/jobs/<summary_job_id>; result {csv path: {file, rows} or {error}})
     ERRORS: 400 if no files or invalid type
 
 === FORM & SURVEY MANAGEMENT ===
@@ -858,7 +1005,7 @@ Database:
 
 1. Check for active sessions (refuse if any)
 2. Set SHUTDOWN_FLAG
-3. Stop all managers (event, vernier, polar, recording)
+3. Stop all managers (event, vernier, polar, recording) and close the session store
 4. Wait for heartbeat monitor thread (2s timeout)
 5. Send SIGTERM to process
 
@@ -882,6 +1029,7 @@ Database:
 from flask import Flask, send_from_directory, send_file, jsonify, request, Response
 from flask_cors import CORS
 import os
+import glob
 import sys
 import signal
 from EventManager import EventManager
@@ -894,7 +1042,17 @@ from FormManager import FormManager
 from SERManager import SERManager
 from VernierManager import VernierManager
 from PolarManager import PolarManager
+from PolarHub import PolarHub
 from LSLManager import LSLManager
+from MarkerTimeline import MarkerTimeline
+from HDF5Exporter import convert_in_parallel, structured_to_frame
+from SessionStore import SessionStore
+from LiveReader import stream_summary, tail_stream, frame_to_records
+from Decimation import decimate_rows, DECIMATION_METHODS, DEFAULT_POINTS
+from StreamSlicer import load_time_range, load_marker
+from SessionAligner import align_subject, DEFAULT_ALIGN_RATE_HZ
+from BackgroundJobs import JobRunner
+from ParquetStore import PARQUET_AVAILABLE, csv_to_parquet
 from datetime import datetime, timezone
 import json
 import threading
@@ -985,9 +1143,29 @@ update_message = None
 
 EXPERIMENT_TEMPLATES_DIR = "experiments/templates"
 EXPERIMENT_SUBJECT_DATA_DIR = "experiments/subject_data"
+# Long offline work (feature extraction, EmotiBit imports) runs as subprocess jobs
+JOB_RUNNER = JobRunner()
 TEST_FILES_DIR = "static/test_files"
 CONSENT_FORMS_DIR = "static/consent_forms"
 
+# When enabled, all sensor streams of a session go to one HDF5 file written by one thread
+USE_SESSION_STORE = os.getenv('USE_SESSION_STORE', 'false').lower() in ('1', 'true', 'yes')
+
+# Write the sensor files in SWMR mode so they can be read (e.g. /api/manager-status) while recording.
+# Off by default: not used for files holding variable-length strings (event file, session file).
+HDF5_SWMR = os.getenv('HDF5_SWMR', 'false').lower() in ('1', 'true', 'yes')
+
+# Raw Polar waveforms (PMD service) to record beside HR/RR, and the simulated strap for bench tests
+POLAR_PMD_STREAMS = tuple(name.strip() for name in os.getenv('POLAR_PMD_STREAMS', '').split(',') if name.strip())
+POLAR_FAKE_DEVICE = os.getenv('POLAR_FAKE_DEVICE', 'false').lower() in ('1', 'true', 'yes')
+# Vernier sample period and block reads (drain all buffered samples per read)
+VERNIER_SAMPLE_PERIOD_MS = int(os.getenv('VERNIER_SAMPLE_PERIOD_MS', '100'))
+VERNIER_BLOCK_MODE = os.getenv('VERNIER_BLOCK_MODE', 'false').lower() in ('1', 'true', 'yes')
+# Group sessions: record up to this many straps from one PolarHub instead of a single PolarManager
+POLAR_HUB_MAX_DEVICES = int(os.getenv('POLAR_HUB_MAX_DEVICES', '0'))
+# Managers whose device acquisition runs in a separate worker process (DeviceWorker)
+DEVICE_WORKERS = {name.strip().lower() for name in os.getenv('DEVICE_WORKERS', '').split(',') if name.strip()}
+
 os.makedirs(EXPERIMENT_TEMPLATES_DIR, exist_ok=True)
 os.makedirs(EXPERIMENT_SUBJECT_DATA_DIR, exist_ok=True)
 os.makedirs(TEST_FILES_DIR, exist_ok=True)
@@ -997,7 +1175,8 @@ ACTIVE_SESSIONS = {}
 
 print("Timestamp Manager initialized with current timestamp:", tm.get_timestamp(type="iso"))
 
-event_manager = EventManager()
+marker_timeline = MarkerTimeline()
+event_manager = EventManager(marker_timeline=marker_timeline)
 subject_manager = SubjectManager()
 
 audio_file_manager = None
@@ -1007,7 +1186,9 @@ ser_manager = None
 form_manager = None
 vernier_manager = None
 polar_manager = None
+polar_hub = None
 lsl_manager = None
+session_store = None
 
 app = Flask(__name__, static_folder='static', static_url_path='')
 app.config['DEBUG'] = True
@@ -1251,10 +1432,34 @@ def get_manager_status():
             'vernier_manager': vernier_manager._running if vernier_manager else False,
             'polar_manager': polar_manager._running if polar_manager else False
         }
+
+        # Row count and newest row of each stream, read from the (SWMR) file while it is written
+        data = {}
+        for name, manager in (('event_manager', event_manager),
+                              ('vernier_manager', vernier_manager),
+                              ('polar_manager', polar_manager)):
+            filename = getattr(manager, 'hdf5_filename', None)
+            if filename and os.path.exists(filename):
+                try:
+                    data[name] = stream_summary(filename, group=manager.hdf5_group)
+                except Exception as e:
+                    data[name] = {'error': str(e)}
+        if vernier_manager is not None:
+            data['vernier_sampling'] = vernier_manager.sampling_stats()
+        if polar_manager is not None:
+            data['polar_connection'] = polar_manager.connection_stats()
+            if polar_manager.pmd_streams:
+                data['polar_pmd'] = polar_manager.pmd_stats()
+        workers = {name: manager.worker_status() for name, manager in (('vernier', vernier_manager),
+                                                                        ('polar', polar_manager))
+                   if manager is not None and manager.use_process}
+        if workers:
+            data['device_workers'] = workers
         
         return jsonify({
             'success': True,
             'status': status,
+            'data': data,
             'any_running': any(status.values())
         })
     except Exception as e:
@@ -1264,9 +1469,167 @@ def get_manager_status():
             'error': str(e)
         }), 500
     
+def stream_managers():
+    """Stream name -> manager for the live endpoints (names match the SessionStore groups)."""
+    return {
+        'event_markers': event_manager,
+        'cardiac': polar_manager,
+        'respiratory': vernier_manager,
+    }
+
+@app.route('/api/sessions/<session_id>/streams/<stream_name>/tail', methods=['GET'])
+def get_stream_tail(session_id, stream_name):
+    """Decimated view of the newest samples of one sensor stream"""
+    if session_id not in ACTIVE_SESSIONS:
+        return jsonify({'error': 'Invalid session ID'}), 404
+
+    manager = stream_managers().get(stream_name)
+    if manager is None:
+        return jsonify({'error': f'Unknown or inactive stream: {stream_name}'}), 404
+
+    try:
+        seconds = float(request.args.get('seconds', 60))
+        points = int(request.args.get('points', DEFAULT_POINTS))
+    except ValueError:
+        return jsonify({'error': 'seconds and points must be numbers'}), 400
+    method = request.args.get('method', 'lttb')
+    if seconds <= 0 or points < 3 or method not in DECIMATION_METHODS:
+        return jsonify({'error': f'Requires seconds > 0, points >= 3 and method in {DECIMATION_METHODS}'}), 400
+
+    try:
+        # In-memory history while recording; otherwise the tail of the stream file
+        rows = manager.recent_rows(seconds)
+        source = 'memory'
+        if rows is None:
+            filename = manager.hdf5_filename
+            if not filename or not os.path.exists(filename):
+                return jsonify({'error': f'No data recorded for stream: {stream_name}'}), 404
+            rows = tail_stream(filename, seconds, group=manager.hdf5_group).to_records(index=False)
+            source = 'file'
+
+        return jsonify({
+            'success': True,
+            'stream': stream_name,
+            'source': source,
+            'method': method,
+            'seconds': seconds,
+            'rows': len(rows),
+            'series': decimate_rows(rows, points, method)
+        })
+    except Exception as e:
+        print(f"Error reading tail of stream {stream_name}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/sessions/<session_id>/hrv', methods=['GET'])
+def get_hrv_features(session_id):
+    """Sliding-window HRV features (time and frequency domain) of the Polar stream"""
+    if session_id not in ACTIVE_SESSIONS:
+        return jsonify({'error': 'Invalid session ID'}), 404
+    if polar_manager is None:
+        return jsonify({'error': 'Polar manager not initialized'}), 404
+
+    try:
+        seconds = float(request.args.get('seconds', 300))
+    except ValueError:
+        return jsonify({'error': 'seconds must be a number'}), 400
+
+    try:
+        rows = polar_manager.recent_hrv_features(seconds)
+        source = 'memory'
+        if rows is not None:
+            df = structured_to_frame(rows)
+        else:
+            filename = polar_manager.hdf5_filename
+            if not polar_manager.hrv_group or not filename or not os.path.exists(filename):
+                return jsonify({'error': 'No HRV features recorded'}), 404
+            df = tail_stream(filename, seconds, group=polar_manager.hrv_group)
+            source = 'file'
+
+        return jsonify({
+            'success': True,
+            'source': source,
+            'latest': polar_manager.latest_hrv_features,
+            'rows': len(df),
+            'data': frame_to_records(df)
+        })
+    except Exception as e:
+        print(f"Error reading HRV features: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/sessions/<session_id>/breaths', methods=['GET'])
+def get_breaths(session_id):
+    """Breath-by-breath intervals and rate detected from the Vernier force signal"""
+    if session_id not in ACTIVE_SESSIONS:
+        return jsonify({'error': 'Invalid session ID'}), 404
+    if vernier_manager is None:
+        return jsonify({'error': 'Vernier manager not initialized'}), 404
+
+    try:
+        seconds = float(request.args.get('seconds', 300))
+    except ValueError:
+        return jsonify({'error': 'seconds must be a number'}), 400
+
+    try:
+        rows = vernier_manager.recent_breaths(seconds)
+        source = 'memory'
+        if rows is not None:
+            df = structured_to_frame(rows)
+        else:
+            filename = vernier_manager.hdf5_filename
+            if not vernier_manager.breaths_group or not filename or not os.path.exists(filename):
+                return jsonify({'error': 'No breaths recorded'}), 404
+            df = tail_stream(filename, seconds, group=vernier_manager.breaths_group)
+            source = 'file'
+
+        return jsonify({
+            'success': True,
+            'source': source,
+            'latest': vernier_manager.latest_breath,
+            'rows': len(df),
+            'data': frame_to_records(df)
+        })
+    except Exception as e:
+        print(f"Error reading breaths: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/sessions/<session_id>/streams/<stream_name>/slice', methods=['GET'])
+def get_stream_slice(session_id, stream_name):
+    """Rows of one stream for a time range or an event marker, read by binary search"""
+    if session_id not in ACTIVE_SESSIONS:
+        return jsonify({'error': 'Invalid session ID'}), 404
+
+    manager = stream_managers().get(stream_name)
+    filename = getattr(manager, 'hdf5_filename', None)
+    if not filename or not os.path.exists(filename):
+        return jsonify({'error': f'No data recorded for stream: {stream_name}'}), 404
+
+    event_marker = request.args.get('event_marker')
+    # Markers reach the file at close; while recording use the live timeline
+    table = manager.marker_timeline.snapshot() if manager._appender is not None else None
+    try:
+        if event_marker:
+            df = load_marker(filename, event_marker, group=manager.hdf5_group, table=table)
+        else:
+            t0 = float(request.args['t0'])
+            t1 = float(request.args.get('t1', 'inf'))
+            df = load_time_range(filename, t0, t1, group=manager.hdf5_group, table=table)
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Provide event_marker, or t0 (and optionally t1) as unix seconds'}), 400
+    except Exception as e:
+        print(f"Error slicing stream {stream_name}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    return jsonify({
+        'success': True,
+        'stream': stream_name,
+        'event_marker': event_marker,
+        'rows': len(df),
+        'data': frame_to_records(df)
+    })
+
 @app.route('/api/convert-hdf5-to-csv', methods=['POST'])
 def convert_hdf5_to_csv():
-    global event_manager, vernier_manager, polar_manager
+    global event_manager, vernier_manager, polar_manager, subject_manager
     
     try:
         data = request.json
@@ -1275,36 +1638,52 @@ def convert_hdf5_to_csv():
         if not session_id or session_id not in ACTIVE_SESSIONS:
             return jsonify({'error': 'Invalid or missing session ID'}), 400
         
+        formats = data.get('formats') or (['csv', 'parquet'] if PARQUET_AVAILABLE else ['csv'])
+        if 'parquet' in formats and not PARQUET_AVAILABLE:
+            return jsonify({'error': 'Parquet export requires pyarrow to be installed'}), 400
+
         converted_files = []
         errors = []
-        
-        if event_manager and hasattr(event_manager, 'hdf5_to_csv'):
-            try:
-                event_manager.hdf5_to_csv()
-                converted_files.append('EmotiBit event data')
-                print("✓ EventManager HDF5 converted to CSV")
-            except Exception as e:
-                errors.append(f"EventManager conversion failed: {str(e)}")
-                print(f"✗ EventManager conversion error: {e}")
-    
-        if vernier_manager and hasattr(vernier_manager, 'hdf5_to_csv'):
-            try:
-                vernier_manager.hdf5_to_csv()
-                converted_files.append('Vernier respiratory data')
-                print("✓ VernierManager HDF5 converted to CSV")
-            except Exception as e:
-                errors.append(f"VernierManager conversion failed: {str(e)}")
-                print(f"✗ VernierManager conversion error: {e}")
-        
-        if polar_manager and hasattr(polar_manager, 'hdf5_to_csv'):
+
+        # Convert all stream files concurrently; each job returns rows written or None on failure
+        jobs = {}
+        descriptions = {
+            'EventManager': 'EmotiBit event data',
+            'VernierManager': 'Vernier respiratory data',
+            'PolarManager': 'Polar HR data',
+        }
+        for manager_name, manager in (('EventManager', event_manager),
+                                      ('VernierManager', vernier_manager),
+                                      ('PolarManager', polar_manager)):
+            if manager and hasattr(manager, 'hdf5_to_csv'):
+                if 'csv' in formats:
+                    jobs[(manager_name, 'CSV')] = manager.hdf5_to_csv
+                if 'parquet' in formats:
+                    jobs[(manager_name, 'Parquet')] = manager.hdf5_to_parquet
+
+        for (manager_name, file_format), result in convert_in_parallel(jobs).items():
+            if isinstance(result, Exception):
+                errors.append(f"{manager_name} {file_format} conversion failed: {str(result)}")
+                print(f"✗ {manager_name} {file_format} conversion error: {result}")
+            elif result is None:
+                errors.append(f"{manager_name} {file_format} conversion failed (see server log)")
+                print(f"✗ {manager_name} {file_format} conversion failed")
+            else:
+                converted_files.append(f"{descriptions[manager_name]} ({file_format})")
+                print(f"✓ {manager_name} HDF5 converted to {file_format} ({result} rows)")
+
+        # Subject and SER tables are small CSVs; mirror them as Parquet alongside the streams
+        if 'parquet' in formats and subject_manager and subject_manager.csv_file_path:
             try:
-                polar_manager.hdf5_to_csv()
-                converted_files.append('Polar HR data')
-                print("✓ PolarManager HDF5 converted to CSV")
+                subject_manager.export_parquet()
+                converted_files.append('Subject data (Parquet)')
+                for ser_csv in glob.glob(os.path.join(subject_manager.subject_folder, '*_SER.csv')):
+                    csv_to_parquet(ser_csv)
+                    converted_files.append('SER data (Parquet)')
             except Exception as e:
-                errors.append(f"PolarManager conversion failed: {str(e)}")
-                print(f"✗ PolarManager conversion error: {e}")
-        
+                errors.append(f"Subject/SER Parquet conversion failed: {str(e)}")
+                print(f"✗ Subject/SER Parquet conversion error: {e}")
+
         if not converted_files and not errors:
             return jsonify({
                 'success': False,
@@ -1329,6 +1708,64 @@ def convert_hdf5_to_csv():
         return jsonify({'error': f'Conversion failed: {str(e)}'}), 500
 
 
+@app.route('/api/align-session', methods=['POST'])
+def align_session():
+    """Write the subject's streams aligned onto one timeline as <subject>_aligned.parquet/.h5"""
+    data = request.json or {}
+    session_id = data.get('session_id')
+    if not session_id or session_id not in ACTIVE_SESSIONS:
+        return jsonify({'error': 'Invalid or missing session ID'}), 400
+
+    subject_dir = ACTIVE_SESSIONS[session_id].get('subject_dir')
+    if not subject_dir or not os.path.exists(subject_dir):
+        return jsonify({'error': 'Subject directory not found'}), 400
+
+    try:
+        rate_hz = float(data.get('rate_hz', DEFAULT_ALIGN_RATE_HZ))
+        files = align_subject(subject_dir, rate_hz, data.get('formats'), data.get('method', 'asof'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        print(f"Error aligning session {session_id}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    return jsonify({'success': True, 'files': files})
+
+@app.route('/api/extract-features', methods=['POST'])
+def extract_features_route():
+    """Recompute the study feature table for subjects whose recordings changed"""
+    data = request.json or {}
+    try:
+        workers = int(data['workers']) if data.get('workers') else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'workers must be an integer'}), 400
+
+    args = ['--root', EXPERIMENT_SUBJECT_DATA_DIR]
+    if data.get('experiment'):
+        args += ['--experiment', str(data['experiment'])]
+    if workers:
+        args += ['--workers', workers]
+    if data.get('force'):
+        args.append('--force')
+
+    try:
+        job_id = JOB_RUNNER.start('features', 'FeatureExtractor.py', args)
+    except Exception as e:
+        print(f"Error starting feature extraction: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    return jsonify({'success': True, 'job_id': job_id}), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status of a background job started by another route"""
+    job = JOB_RUNNER.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job id'}), 404
+    return jsonify({'success': True, 'job': job})
+
 @app.route('/api/push-to-database', methods=['POST'])
 def push_to_database():
     """
@@ -1668,21 +2105,16 @@ def upload_vr_room_config():
     
 @app.route('/set_event_marker', methods=['POST'])
 def set_event_marker():
-    """Set event marker for the event manager"""
-    global event_manager, vernier_manager, polar_manager, lsl_manager
+    """Set event marker on the shared timeline read by every stream manager"""
+    global marker_timeline, lsl_manager
     data = request.get_json()
     event_marker = data.get('event_marker')
-
-    if vernier_manager is not None:
-        vernier_manager.event_marker = event_marker
-    if polar_manager is not None:
-        polar_manager.event_marker = event_marker
     
     try:
-        event_manager.event_marker = event_marker
+        marker_timeline.set_marker(event_marker)
 
         if lsl_manager is not None:
-            lsl_manager.send_marker(event_marker, event_manager.condition)
+            lsl_manager.send_marker(event_marker, marker_timeline.condition)
 
         print("Event marker set to: ", event_marker)
         return jsonify({'status': 'Event marker set.'})
@@ -1691,11 +2123,11 @@ def set_event_marker():
 
 def set_condition():
     """Set condition for the event manager"""
-    global event_manager
+    global marker_timeline
     data = request.get_json()
     condition = data.get('condition')
     try:
-        event_manager.condition = condition
+        marker_timeline.set_condition(condition)
         print("Condition set to: ", condition)
         return jsonify({'status': 'Condition set.'})
     except Exception as e:
@@ -1703,7 +2135,7 @@ def set_condition():
         
 @app.route('/record_task_audio', methods=['POST'])
 def record_task_audio():
-    global recording_manager, audio_file_manager, subject_manager, vernier_manager, event_manager, lsl_manager
+    global recording_manager, audio_file_manager, subject_manager, marker_timeline, lsl_manager
     data = request.get_json()
     action = data.get('action')
     question = data.get('question')
@@ -1714,9 +2146,8 @@ def record_task_audio():
     try:
         if action == 'start':
             recording_manager.start_recording()
-            event_manager.event_marker = event_marker
+            marker_timeline.set_marker(event_marker)
             lsl_manager.send_marker(event_marker, condition)
-            vernier_manager.event_marker = event_marker
 
             start_time = 10 # seconds
             while not recording_manager.stream_is_active:
@@ -1886,6 +2317,13 @@ def process_audio_files() -> Response:
                 writer.writerow(row)   
 
         print(f"CSV file created: {csv_path}")
+
+        if PARQUET_AVAILABLE:
+            try:
+                csv_to_parquet(csv_path)
+            except Exception as e:
+                print(f"Warning: Could not write SER Parquet file: {e}")
+
         return jsonify({'message': 'Audio files processed successfully.', 'path': csv_path}), 200
     
     except Exception as e:
@@ -2651,13 +3089,27 @@ def import_emotibit_csv() -> Response:
         except Exception as e:
             errors.append(f"File '{file.filename}': Error saving file - {str(e)}")
             print(f"Error saving file {file.filename}: {e}")
+            continue
+
+        uploaded_files[-1]['summary_file'] = os.path.splitext(file_path)[0] + '.h5'
+
+    # Per-sensor HDF5 copies with 1 s / 10 s / 60 s summaries, built in the background;
+    # the CSV upload stands on its own
+    summary_job_id = None
+    if uploaded_files:
+        try:
+            summary_job_id = JOB_RUNNER.start('emotibit', 'EmotiBitImport.py',
+                                              [f['file_path'] for f in uploaded_files])
+        except Exception as e:
+            print(f"Error starting EmotiBit summary job: {e}")
 
     if uploaded_files and not errors:
         if len(uploaded_files) == 1:
             return jsonify({
                 "success": True, 
                 "message": "File uploaded successfully.", 
-                "file_path": uploaded_files[0]['file_path']
+                "file_path": uploaded_files[0]['file_path'],
+                "summary_job_id": summary_job_id
             }), 200
         else:
             file_paths = [f['file_path'] for f in uploaded_files]
@@ -2665,7 +3117,8 @@ def import_emotibit_csv() -> Response:
                 "success": True, 
                 "message": f"{len(uploaded_files)} files uploaded successfully.", 
                 "file_paths": file_paths,
-                "uploaded_files": uploaded_files
+                "uploaded_files": uploaded_files,
+                "summary_job_id": summary_job_id
             }), 200
     
     elif uploaded_files and errors:
@@ -2675,7 +3128,8 @@ def import_emotibit_csv() -> Response:
             "message": f"{len(uploaded_files)} files uploaded successfully, {len(errors)} failed.", 
             "file_paths": file_paths,
             "uploaded_files": uploaded_files,
-            "errors": errors
+            "errors": errors,
+            "summary_job_id": summary_job_id
         }), 200
     
     else:
@@ -3187,6 +3641,42 @@ def stop_polar_manager():
         print(f"Error stopping polar manager: {e}")
         return jsonify({'error': 'Failed to stop polar manager'}), 500
 
+@app.route('/api/polar-hub/start', methods=['POST'])
+def start_polar_hub():
+    """Scan once and stream every Polar strap found"""
+    global polar_hub
+    if polar_hub is None:
+        return jsonify({'success': False, 'error': 'Polar hub not enabled (set POLAR_HUB_MAX_DEVICES)'}), 400
+    if polar_hub.data_folder is None:
+        return jsonify({'success': False, 'error': 'Participant info must be saved first'}), 400
+
+    try:
+        result = polar_hub.start()
+        if polar_hub.devices:
+            return jsonify({'success': True, 'message': result, 'devices': list(polar_hub.devices)})
+        return jsonify({'success': False, 'warning': result, 'message': 'No Polar devices connected.'}), 200
+    except Exception as e:
+        print(f"Error starting polar hub: {e}")
+        return jsonify({'success': False, 'error': f'Failed to start polar hub: {str(e)}'}), 500
+
+@app.route('/api/polar-hub/stop', methods=['POST'])
+def stop_polar_hub():
+    """Stop every strap of the Polar hub"""
+    if polar_hub is None:
+        return jsonify({'error': 'Polar hub not enabled'}), 400
+    try:
+        return jsonify({'success': True, 'message': polar_hub.stop()})
+    except Exception as e:
+        print(f"Error stopping polar hub: {e}")
+        return jsonify({'error': 'Failed to stop polar hub'}), 500
+
+@app.route('/api/polar-hub/status', methods=['GET'])
+def get_polar_hub_status():
+    """Per-strap connection state, rates and drop counters"""
+    if polar_hub is None:
+        return jsonify({'error': 'Polar hub not enabled'}), 400
+    return jsonify({'success': True, 'running': polar_hub.running, 'devices': polar_hub.stats()})
+
 @app.route('/start_vernier_manager', methods=['POST'])
 def start_vernier_manager():
     """Start the vernier manager"""
@@ -3238,8 +3728,8 @@ def stop_vernier_manager():
 
 @app.route('/set_condition', methods=['POST'])
 def set_condition():
-    """Set a condition for the event manager"""
-    global event_manager
+    """Set a condition on the shared marker timeline"""
+    global marker_timeline
     try:
         data = request.get_json()
         condition = data.get('condition', 'None')
@@ -3247,7 +3737,7 @@ def set_condition():
         if not condition:
             return jsonify({'error': 'Condition cannot be empty'}), 400
         
-        event_manager.condition = condition
+        marker_timeline.set_condition(condition)
         print(f"Condition set to: {condition}")
 
         return jsonify({'success': True, 'message': f'Condition set to {condition}'})
@@ -3706,6 +4196,18 @@ def save_participant_info(session_id):
             polar_manager.set_data_folder(subject_dir)
             polar_manager.set_filenames()
 
+        if polar_hub is not None:
+            polar_hub.set_metadata(
+                experiment_name=experiment_name,
+                trial_name=trial_name,
+                subject_id=email,
+                experimenter_name=experimenter_name
+            )
+            polar_hub.set_data_folder(subject_dir)
+
+        if USE_SESSION_STORE:
+            attach_session_store(subject_dir, email)
+
         if audio_file_manager is not None:
             audio_file_manager.set_audio_folder(subject_dir)
         
@@ -3838,7 +4340,7 @@ def instantiate_modules(template_path):
         print(f"needs_emotibit: {needs_emotibit}")
         print(f"needs_mat: {needs_mat}")
 
-        global recording_manager, audio_file_manager, vernier_manager, polar_manager
+        global recording_manager, audio_file_manager, vernier_manager, polar_manager, polar_hub
         global test_manager, transcription_manager, ser_manager, lsl_manager
         
         # Initialize audio and SER components together
@@ -3855,13 +4357,24 @@ def instantiate_modules(template_path):
         # Initialize respiratory/vernier if needed
         if needs_respiratory:
             print("\n=== Initializing Vernier Respiration ===")
-            vernier_manager = VernierManager()
+            vernier_manager = VernierManager(marker_timeline=marker_timeline, session_store=session_store,
+                                             swmr=HDF5_SWMR, sample_period_ms=VERNIER_SAMPLE_PERIOD_MS,
+                                             block_mode=VERNIER_BLOCK_MODE,
+                                             use_process='vernier' in DEVICE_WORKERS)
             print("✓ Vernier respiratory streaming initialized")
 
         # Initialize Polar HR if needed
-        if needs_polar:
+        if needs_polar and POLAR_HUB_MAX_DEVICES > 0:
+            print("\n=== Initializing Polar HR hub ===")
+            polar_hub = PolarHub(marker_timeline=marker_timeline, session_store=session_store, swmr=HDF5_SWMR,
+                                 max_devices=POLAR_HUB_MAX_DEVICES, pmd_streams=POLAR_PMD_STREAMS,
+                                 fake_devices=POLAR_HUB_MAX_DEVICES if POLAR_FAKE_DEVICE else 0)
+            print(f"✓ Polar HR hub initialized (up to {POLAR_HUB_MAX_DEVICES} straps)")
+        elif needs_polar:
             print("\n=== Initializing Polar HR ===")
-            polar_manager = PolarManager()
+            polar_manager = PolarManager(marker_timeline=marker_timeline, session_store=session_store,
+                                         swmr=HDF5_SWMR, pmd_streams=POLAR_PMD_STREAMS,
+                                         fake_device=POLAR_FAKE_DEVICE, use_process='polar' in DEVICE_WORKERS)
             print("✓ Polar HR manager initialized")
 
         # Initialize EmotiBit if needed (placeholder for future implementation)
@@ -4000,9 +4513,33 @@ def complete_experiment(session_id):
         print(f"Error completing experiment {session_id}: {e}")
         return jsonify({'error': f'Failed to complete experiment: {str(e)}'}), 500
 
+def attach_session_store(subject_dir, subject_id):
+    """Open the session's single HDF5 file and route the stream managers through it."""
+    global session_store
+
+    close_session_store()
+    current_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    # The session file holds the event stream's variable-length strings, so it is never SWMR
+    session_store = SessionStore(os.path.join(subject_dir, f"{current_date}_{subject_id}_session.h5"))
+    for manager in (event_manager, vernier_manager, polar_manager, polar_hub):
+        if manager is not None:
+            manager.session_store = session_store
+
+def close_session_store():
+    """Close every open stream and the session file (no-op without a session store)."""
+    global session_store
+
+    if session_store is None:
+        return
+    try:
+        session_store.close()
+    except Exception as e:
+        print(f"Error closing session store: {e}")
+    session_store = None
+
 def reset_experiment_managers():
-    global recording_manager, audio_file_manager, vernier_manager,test_manager, polar_manager
-    global transcription_manager, ser_manager, form_manager, subject_manager, event_manager
+    global recording_manager, audio_file_manager, vernier_manager,test_manager, polar_manager, polar_hub
+    global transcription_manager, ser_manager, form_manager, subject_manager, event_manager, marker_timeline
 
     try:
         if event_manager and event_manager.is_streaming:
@@ -4017,6 +4554,12 @@ def reset_experiment_managers():
         if polar_manager and hasattr(polar_manager, 'stop'):
             polar_manager.stop()
 
+        if polar_hub is not None:
+            polar_hub.reset()
+
+        close_session_store()
+
+        polar_hub = None
         recording_manager = None
         audio_file_manager = None
         vernier_manager = None
@@ -4028,7 +4571,8 @@ def reset_experiment_managers():
         event_manager = None
         
         subject_manager = SubjectManager()
-        event_manager = EventManager()
+        marker_timeline = MarkerTimeline()
+        event_manager = EventManager(marker_timeline=marker_timeline)
         form_manager = FormManager()
 
         print("All experiment managers reset successfully")
@@ -4101,6 +4645,13 @@ def cleanup_experimenter_session(session_id):
                 print(f"Stopped polar manager for session {session_id}")
             except Exception as e:
                 print(f"Error stopping polar manager: {e}")
+
+        if polar_hub is not None and polar_hub.running:
+            try:
+                polar_hub.stop()
+                print(f"Stopped polar hub for session {session_id}")
+            except Exception as e:
+                print(f"Error stopping polar hub: {e}")
         
         if recording_manager and hasattr(recording_manager, 'stream_is_active') and recording_manager.stream_is_active:
             try:
@@ -4108,6 +4659,8 @@ def cleanup_experimenter_session(session_id):
                 print(f"Stopped recording manager for session {session_id}")
             except Exception as e:
                 print(f"Error stopping recording manager: {e}")
+
+        close_session_store()
         
         # Save final session state
         if session_data.get('subject_dir') and os.path.exists(session_data['subject_dir']):
@@ -4296,6 +4849,13 @@ def shutdown_server():
                 print("Stopped polar manager")
         except Exception as e:
             print(f"Error stopping polar manager: {e}")
+
+        try:
+            if polar_hub is not None and polar_hub.running:
+                polar_hub.stop()
+                print("Stopped polar hub")
+        except Exception as e:
+            print(f"Error stopping polar hub: {e}")
         
         try:
             if recording_manager and hasattr(recording_manager, 'stream_is_active') and recording_manager.stream_is_active:
@@ -4303,6 +4863,8 @@ def shutdown_server():
                 print("Stopped recording manager")
         except Exception as e:
             print(f"Error stopping recording manager: {e}")
+
+        close_session_store()
         
         print("All managers stopped")
         print("Initiating server shutdown...")
@@ -0,0 +1,180 @@
+"""
+HDF5 Layout Benchmark
+
+Compares chunking/compression layouts for the three stream files using synthetic
+data for a simulated session, written through the same HDF5Appender the managers use.
+
+Streams (rates match the acquisition defaults):
+    event       one row per marker/condition change (EventManager's default transitions
+                mode); --event-mode poll writes the 100 Hz polled rows instead
+    respiratory  10 Hz  timestamp_unix, force, RR (Vernier)
+    cardiac      ~1 Hz  timestamp_unix, HR, HRV (Polar)
+
+APPEND PATH:
+    By default rows go through HDF5Appender.append one dict at a time, as the managers'
+    write_to_hdf5 does; --append block stages them with append_rows instead.
+
+For every stream x layout it reports write throughput (rows/s through the appender),
+final file size and the time of a full-scan read of the dataset.
+
+USAGE:
+    python benchmarks/hdf5_layout_benchmark.py
+    python benchmarks/hdf5_layout_benchmark.py --hours 0.5 --layouts gzip4 lzf
+    python benchmarks/hdf5_layout_benchmark.py --event-mode poll --append block
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from HDF5Appender import HDF5Appender, create_stream_dataset  # noqa: E402
+
+LAYOUTS = {
+    "auto": {"chunk_rows": None, "compression": None, "shuffle": False},
+    "chunk4096": {"chunk_rows": 4096, "compression": None, "shuffle": False},
+    "gzip1": {"chunk_rows": 4096, "compression": "gzip", "compression_opts": 1, "shuffle": True},
+    "gzip4": {"chunk_rows": 4096, "compression": "gzip", "compression_opts": 4, "shuffle": True},
+    "gzip4-noshuffle": {"chunk_rows": 4096, "compression": "gzip", "compression_opts": 4, "shuffle": False},
+    "lzf": {"chunk_rows": 4096, "compression": "lzf", "shuffle": True},
+}
+
+STRING = h5py.string_dtype(encoding='utf-8')
+
+# Seconds between marker changes and between condition changes of the synthetic session
+MARKER_PERIOD_S = 120
+CONDITION_PERIOD_S = 1200
+
+STREAMS = {
+    "event": {
+        "rate_hz": 100.0,    # poll mode only
+        "dtype": np.dtype([('timestamp_unix', 'f8'), ('event_marker', STRING), ('condition', STRING)]),
+    },
+    "respiratory": {
+        "rate_hz": 10.0,
+        "dtype": np.dtype([('timestamp_unix', 'f8'), ('force', 'f4'), ('RR', 'f4')]),
+    },
+    "cardiac": {
+        "rate_hz": 1.0,
+        "dtype": np.dtype([('timestamp_unix', 'f8'), ('HR', 'f4'), ('HRV', 'f4')]),
+    },
+}
+
+
+def synthesize(stream: str, hours: float, seed: int = 0, event_mode: str = "transitions") -> np.ndarray:
+    """Build a structured array of plausible samples for one stream."""
+    spec = STREAMS[stream]
+    if stream == "event" and event_mode == "transitions":
+        return synthesize_transitions(hours)
+    rng = np.random.default_rng(seed)
+    n = int(hours * 3600 * spec["rate_hz"])
+    t0 = 1_700_000_000.0
+    rows = np.zeros(n, dtype=spec["dtype"])
+    jitter = rng.normal(0, 0.0005, n)
+    rows['timestamp_unix'] = t0 + np.arange(n) / spec["rate_hz"] + jitter
+
+    if stream == "event":
+        # A marker change roughly every two minutes, condition every ~20 minutes
+        markers = np.array([f"procedure_{i}" for i in range(256)], dtype=object)
+        conditions = np.array(["None", "control", "stress"], dtype=object)
+        rows['event_marker'] = markers[(np.arange(n) // int(MARKER_PERIOD_S * spec["rate_hz"])) % len(markers)]
+        rows['condition'] = conditions[(np.arange(n) // int(CONDITION_PERIOD_S * spec["rate_hz"])) % len(conditions)]
+    elif stream == "respiratory":
+        t = np.arange(n) / spec["rate_hz"]
+        rows['force'] = 2.0 + 0.8 * np.sin(2 * np.pi * 0.25 * t) + rng.normal(0, 0.02, n)
+        rows['RR'] = np.round(15 + rng.normal(0, 0.5, n))
+    else:
+        rows['HR'] = np.round(70 + 5 * np.sin(np.arange(n) / 300) + rng.normal(0, 2, n))
+        rows['HRV'] = 40 + rng.normal(0, 5, n)
+    return rows
+
+
+def synthesize_transitions(hours: float) -> np.ndarray:
+    """Event rows as recorded in transitions mode: the start state, then one row per change."""
+    markers = np.array([f"procedure_{i}" for i in range(256)], dtype=object)
+    conditions = np.array(["None", "control", "stress"], dtype=object)
+    t = np.arange(0.0, hours * 3600, MARKER_PERIOD_S)
+    rows = np.zeros(len(t), dtype=STREAMS["event"]["dtype"])
+    rows['timestamp_unix'] = 1_700_000_000.0 + t
+    rows['event_marker'] = markers[np.arange(len(t)) % len(markers)]
+    rows['condition'] = conditions[(t // CONDITION_PERIOD_S).astype(int) % len(conditions)]
+    return rows
+
+
+def run_case(stream: str, layout_name: str, rows: np.ndarray, out_dir: str, block_rows: int,
+             append: str = "row") -> dict:
+    path = os.path.join(out_dir, f"{stream}_{layout_name}.h5")
+    if os.path.exists(path):
+        os.remove(path)
+
+    start = time.perf_counter()
+    with h5py.File(path, 'w') as h5_file:
+        dataset = create_stream_dataset(h5_file, 'data', rows.dtype, LAYOUTS[layout_name])
+        appender = HDF5Appender(dataset, flush_rows=block_rows, flush_interval=None, background=False)
+        if append == "row":
+            # One reused dict per row, like the managers' current_row
+            row = dict.fromkeys(rows.dtype.names)
+            columns = [(name, rows[name].tolist()) for name in rows.dtype.names]
+            for i in range(len(rows)):
+                for name, values in columns:
+                    row[name] = values[i]
+                appender.append(row)
+        else:
+            for i in range(0, len(rows), block_rows):
+                appender.append_rows(rows[i:i + block_rows])
+        appender.close()
+    write_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with h5py.File(path, 'r') as h5_file:
+        scanned = h5_file['data'][:]
+    read_s = time.perf_counter() - start
+    assert len(scanned) == len(rows)
+
+    return {
+        "stream": stream,
+        "layout": layout_name,
+        "rows": len(rows),
+        "write_rows_per_s": len(rows) / write_s if write_s else float('inf'),
+        "size_mb": os.path.getsize(path) / 1e6,
+        "read_s": read_s,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark HDF5 chunk/compression layouts for stream files.")
+    parser.add_argument("--hours", type=float, default=2.0, help="Simulated session length (default: 2)")
+    parser.add_argument("--layouts", nargs="+", default=list(LAYOUTS), choices=list(LAYOUTS))
+    parser.add_argument("--streams", nargs="+", default=list(STREAMS), choices=list(STREAMS))
+    parser.add_argument("--block-rows", type=int, default=256, help="Rows per appender flush (default: 256)")
+    parser.add_argument("--event-mode", choices=["transitions", "poll"], default="transitions",
+                        help="Event stream recording mode (default: transitions, as EventManager)")
+    parser.add_argument("--append", choices=["row", "block"], default="row",
+                        help="Per-row append() as the managers do, or block append_rows() (default: row)")
+    parser.add_argument("--out-dir", default=None, help="Where to write the files (default: temp dir)")
+    args = parser.parse_args(argv)
+
+    out_dir = args.out_dir or tempfile.mkdtemp(prefix="hdf5_layout_bench_")
+    os.makedirs(out_dir, exist_ok=True)
+    print(f"Writing benchmark files to: {out_dir}")
+    print(f"Simulated session: {args.hours} h, event mode: {args.event_mode}, append: {args.append}\n")
+
+    header = f"{'stream':<12} {'layout':<16} {'rows':>9} {'write rows/s':>14} {'size MB':>9} {'scan s':>8}"
+    print(header)
+    print("-" * len(header))
+    for stream in args.streams:
+        rows = synthesize(stream, args.hours, event_mode=args.event_mode)
+        for layout_name in args.layouts:
+            r = run_case(stream, layout_name, rows, out_dir, args.block_rows, args.append)
+            print(f"{r['stream']:<12} {r['layout']:<16} {r['rows']:>9} "
+                  f"{r['write_rows_per_s']:>14,.0f} {r['size_mb']:>9.2f} {r['read_s']:>8.3f}")
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""Tests for Decimation (run with: python -m pytest tests)."""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Decimation import decimate_rows, decimate_series, lttb_indices, minmax_indices  # noqa: E402
+
+
+def series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    t = 1_700_000_000.0 + np.arange(n) * 0.1
+    y = np.sin(np.arange(n) / 50.0) + rng.normal(0, 0.1, n)
+    return t, y
+
+
+@pytest.mark.parametrize('n, points', [(10000, 800), (1001, 3), (997, 100)])
+def test_lttb_keeps_endpoints_within_budget(n, points):
+    t, y = series(n)
+    kept = lttb_indices(t, y, points)
+
+    assert len(kept) == points
+    assert kept[0] == 0 and kept[-1] == n - 1
+    assert np.all(np.diff(kept) > 0)
+
+
+def test_lttb_keeps_a_spike():
+    t, y = series(10000)
+    y[4321] = 50.0
+    assert 4321 in lttb_indices(t, y, 200)
+
+
+@pytest.mark.parametrize('n, points', [(10000, 800), (1001, 10), (999, 7)])
+def test_minmax_keeps_min_and_max_of_every_bucket(n, points):
+    _, y = series(n)
+    y[::97] = np.nan
+    kept = minmax_indices(y, points)
+
+    assert len(kept) <= points
+    assert np.all(np.diff(kept) > 0)
+    buckets = max(points // 2, 1)
+    size = -(-n // buckets)
+    for start in range(0, n, size):
+        bucket = y[start:start + size]
+        assert start + np.nanargmin(bucket) in kept
+        assert start + np.nanargmax(bucket) in kept
+
+
+@pytest.mark.parametrize('method', ['lttb', 'minmax'])
+def test_inputs_shorter_than_the_budget_are_kept_whole(method):
+    t, y = series(50)
+    kept_t, kept_y = decimate_series(t, y, points=800, method=method)
+    np.testing.assert_array_equal(kept_t, t)
+    np.testing.assert_array_equal(kept_y, y)
+    assert len(lttb_indices(t[:0], y[:0], 800)) == 0
+    assert len(minmax_indices(y[:0], 800)) == 0
+
+
+def test_decimate_rows_budget_and_change_points():
+    n = 20000
+    t, y = series(n)
+    rows = np.zeros(n, dtype=[('timestamp_unix', 'f8'), ('HR', 'f4'), ('event_marker', 'S16')])
+    rows['timestamp_unix'] = t
+    rows['HR'] = y
+    rows['event_marker'] = np.where(np.arange(n) < 12345, b'baseline', b'task')
+
+    result = decimate_rows(rows, points=500, method='lttb')
+
+    hr = result['HR']
+    assert len(hr['values']) == 500
+    assert hr['timestamp_unix'][0] == t[0] and hr['timestamp_unix'][-1] == t[-1]
+    assert result['event_marker'] == {'timestamp_unix': [t[0], t[12345]], 'values': ['baseline', 'task']}
+
+    with pytest.raises(ValueError):
+        decimate_rows(rows, method='mean')
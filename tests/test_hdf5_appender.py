@@ -0,0 +1,46 @@
+"""Regression tests for HDF5Appender (run with: python -m pytest tests)."""
+import os
+import sys
+import threading
+import time
+
+import h5py
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from HDF5Appender import HDF5Appender  # noqa: E402
+
+DTYPE = np.dtype([('timestamp_unix', 'f8'), ('HR', 'f4')])
+
+
+def test_appends_racing_close_are_written_or_rejected(tmp_path):
+    filename = str(tmp_path / "appender.h5")
+    with h5py.File(filename, 'w') as h5_file:
+        dataset = h5_file.create_dataset('data', shape=(0,), maxshape=(None,), dtype=DTYPE)
+        appender = HDF5Appender(dataset, flush_rows=50, flush_interval=0.01)
+
+        accepted = []
+        start = threading.Event()
+
+        def producer():
+            start.wait()
+            for i in range(100000):
+                try:
+                    appender.append({'timestamp_unix': float(i), 'HR': 60.0})
+                except RuntimeError:
+                    return
+                accepted.append(i)
+
+        thread = threading.Thread(target=producer)
+        thread.start()
+        start.set()
+        while len(accepted) < 1000:
+            time.sleep(0.001)
+        appender.close()
+        thread.join()
+
+        # Every append that did not raise is on disk; nothing is silently dropped
+        assert len(dataset) == len(accepted)
+        with pytest.raises(RuntimeError):
+            appender.append({'timestamp_unix': 0.0, 'HR': 0.0})
@@ -0,0 +1,22 @@
+"""Regression tests for MarkerTimeline (run with: python -m pytest tests)."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import TimestampManager as tm  # noqa: E402
+from MarkerTimeline import MarkerTimeline  # noqa: E402
+
+
+def test_listeners_get_the_stored_start_of_out_of_order_changes():
+    timeline = MarkerTimeline()
+    changes = []
+    timeline.add_listener(lambda timestamp, marker, condition: changes.append((timestamp, marker)))
+
+    start = tm.get_timestamp_ns() * 1e-9 + 60.0
+    timeline.set_marker('baseline', timestamp=start)
+    # Earlier than the open interval: stored at its start so the table stays sorted
+    timeline.set_marker('task', timestamp=start - 10.0)
+
+    starts = timeline.snapshot().intervals['start_unix']
+    assert list(starts[1:]) == [start, start]
+    assert changes == [(start, 'baseline'), (start, 'task')]
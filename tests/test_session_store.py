@@ -0,0 +1,82 @@
+"""Regression tests for SessionStore (run with: python -m pytest tests)."""
+import os
+import sys
+import threading
+import time
+
+import h5py
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SessionStore import SessionStore  # noqa: E402
+
+DTYPE = np.dtype([('timestamp_unix', 'f8'), ('HR', 'f4')])
+
+
+def test_reused_row_dict_round_trips(tmp_path):
+    filename = str(tmp_path / "session.h5")
+    store = SessionStore(filename, flush_interval=0.05)
+    writer = store.open_stream('cardiac', DTYPE, flush_rows=1000, history_rows=1000)
+
+    # Managers reuse one dict for every row and change it before the writer thread drains it
+    row = {'timestamp_unix': None, 'HR': None}
+    for i in range(200):
+        row['timestamp_unix'] = 1000.0 + i
+        row['HR'] = 60 + i % 40
+        writer.append(row)
+    writer.flush()
+    recent = writer.recent()
+    store.close()
+
+    expected = 1000.0 + np.arange(200)
+    np.testing.assert_array_equal(recent['timestamp_unix'], expected)
+    with h5py.File(filename, 'r') as h5_file:
+        data = h5_file['cardiac/data'][:]
+    np.testing.assert_array_equal(data['timestamp_unix'], expected)
+    np.testing.assert_array_equal(data['HR'], 60 + np.arange(200) % 40)
+
+
+def test_submit_wait_from_writer_thread_runs_inline(tmp_path):
+    store = SessionStore(str(tmp_path / "session.h5"))
+    writer = store.open_stream('cardiac', DTYPE)
+
+    def outer(group):
+        # A finalize hook submitting (and waiting for) another command on the writer thread
+        return writer.submit(lambda inner_group: inner_group.name, wait=True)
+
+    assert writer.submit(outer, wait=True) == '/cardiac'
+    store.close()
+
+
+def test_appends_racing_close_are_written_or_rejected(tmp_path):
+    filename = str(tmp_path / "session.h5")
+    store = SessionStore(filename, flush_interval=0.01)
+    writer = store.open_stream('cardiac', DTYPE, flush_rows=50)
+
+    accepted = []
+    start = threading.Event()
+
+    def producer():
+        start.wait()
+        for i in range(100000):
+            try:
+                writer.append({'timestamp_unix': float(i), 'HR': 60.0})
+            except RuntimeError:
+                return
+            accepted.append(i)
+
+    thread = threading.Thread(target=producer)
+    thread.start()
+    start.set()
+    while len(accepted) < 1000:
+        time.sleep(0.001)
+    writer.close()
+    thread.join()
+    store.close()
+
+    # Every append that did not raise is on disk; nothing is silently dropped
+    with h5py.File(filename, 'r') as h5_file:
+        assert len(h5_file['cardiac/data']) == len(accepted)
+    with pytest.raises(RuntimeError):
+        writer.append({'timestamp_unix': 0.0, 'HR': 0.0})
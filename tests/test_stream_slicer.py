@@ -0,0 +1,138 @@
+"""Tests for StreamSlicer (run with: python -m pytest tests)."""
+import os
+import sys
+
+import h5py
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from MarkerTimeline import INTERVAL_DTYPE, MARKERS_GROUP, MarkerTable  # noqa: E402
+from StreamSlicer import (ROW_INDEX_NAME, marker_row_ranges, search_timestamp, slice_marker,  # noqa: E402
+                          slice_time, time_range_rows, write_marker_index)
+
+DTYPE = np.dtype([('timestamp_unix', 'f8'), ('HR', 'f4')])
+T0 = 1_700_000_000.0
+
+
+def write_rows(parent, rows):
+    """Append rows to parent['data'] the way HDF5Appender leaves it (rows_written attribute)."""
+    if 'data' not in parent:
+        parent.create_dataset('data', shape=(0,), maxshape=(None,), dtype=DTYPE)
+    dataset = parent['data']
+    n = int(dataset.attrs.get('rows_written', 0))
+    dataset.resize(n + len(rows), axis=0)
+    dataset[n:] = rows
+    dataset.attrs['rows_written'] = n + len(rows)
+
+
+def make_rows(start, n):
+    rows = np.zeros(n, dtype=DTYPE)
+    rows['timestamp_unix'] = T0 + (start + np.arange(n)) * 0.1
+    rows['HR'] = start + np.arange(n)
+    return rows
+
+
+def marker_table(changes, end=np.inf):
+    """MarkerTable from [(start_unix, label), ...]."""
+    labels = list(dict.fromkeys(label for _, label in changes))
+    intervals = np.zeros(len(changes), dtype=INTERVAL_DTYPE)
+    intervals['start_unix'] = [start for start, _ in changes]
+    intervals['end_unix'][:-1] = intervals['start_unix'][1:]
+    intervals['end_unix'][-1] = end
+    intervals['marker_id'] = [labels.index(label) for _, label in changes]
+    return MarkerTable(intervals, labels, ['None'])
+
+
+@pytest.fixture
+def stream(tmp_path):
+    with h5py.File(tmp_path / "stream.h5", 'w') as h5_file:
+        write_rows(h5_file, make_rows(0, 10000))
+        yield h5_file
+
+
+def test_search_timestamp_matches_searchsorted_on_and_between_samples(stream):
+    dataset = stream['data']
+    timestamps = dataset['timestamp_unix'][:]
+    values = np.concatenate([timestamps[[0, 1, 4095, 4096, 5000, 9998, 9999]],
+                             timestamps[[10, 7000]] + 0.05, [T0 - 1.0, T0 + 5000.0]])
+    for value in values:
+        for side in ('left', 'right'):
+            expected = int(np.searchsorted(timestamps, value, side=side))
+            assert search_timestamp(dataset, value, side=side, block_rows=8) == expected
+            assert search_timestamp(dataset, value, side=side) == expected
+
+
+def test_time_range_on_sample_boundaries(stream):
+    dataset = stream['data']
+    t = dataset['timestamp_unix'][:]
+
+    # Start and stop exactly on a sample: start included, stop excluded
+    assert time_range_rows(dataset, t[100], t[200]) == (100, 200)
+    np.testing.assert_array_equal(slice_time(stream, t[100], t[200])['HR'], np.arange(100, 200))
+    assert time_range_rows(dataset, t[0], np.inf) == (0, 10000)
+    assert time_range_rows(dataset, t[9999], t[9999] + 1.0) == (9999, 10000)
+
+
+@pytest.mark.parametrize('t0, t1', [(T0 + 10.0, T0 + 10.0), (T0 + 10.01, T0 + 10.05),
+                                    (T0 - 100.0, T0 - 50.0), (T0 + 5000.0, T0 + 6000.0),
+                                    (T0 + 20.0, T0 + 10.0)])
+def test_empty_time_ranges(stream, t0, t1):
+    start, stop = time_range_rows(stream['data'], t0, t1)
+    assert start == stop
+    assert len(slice_time(stream, t0, t1)) == 0
+
+
+def test_marker_slices_from_index_and_search_agree(stream):
+    table = marker_table([(T0, 'baseline'), (T0 + 100.0, 'task'), (T0 + 250.05, 'baseline'),
+                          (T0 + 600.0, 'task')], end=T0 + 800.0)
+    table.write_to_hdf5(stream)
+
+    searched = marker_row_ranges(stream, 'task')
+    write_marker_index(stream)
+    indexed = marker_row_ranges(stream, 'task')
+
+    np.testing.assert_array_equal(indexed, searched)
+    assert indexed.tolist() == [(1000, 2501), (6000, 8000)]
+    rows = slice_marker(stream, 'task')
+    np.testing.assert_array_equal(rows['HR'], np.concatenate([np.arange(1000, 2501), np.arange(6000, 8000)]))
+
+
+def test_marker_that_never_occurs(stream):
+    marker_table([(T0, 'baseline')]).write_to_hdf5(stream)
+    write_marker_index(stream)
+
+    assert len(marker_row_ranges(stream, 'missing')) == 0
+    assert len(slice_marker(stream, 'missing')) == 0
+
+
+def test_stream_without_markers(stream):
+    assert len(marker_row_ranges(stream, 'baseline')) == 0
+    write_marker_index(stream)
+    assert MARKERS_GROUP not in stream
+
+
+def test_reopened_file_with_more_than_one_marker_index(tmp_path):
+    filename = tmp_path / "reopened.h5"
+    first = marker_table([(T0, 'baseline'), (T0 + 50.0, 'task')], end=T0 + 100.0)
+    with h5py.File(filename, 'w') as h5_file:
+        write_rows(h5_file, make_rows(0, 1000))
+        first.write_to_hdf5(h5_file)
+        write_marker_index(h5_file)
+
+    # Reopened and appended to; the stale index no longer matches the row count
+    second = marker_table([(T0, 'baseline'), (T0 + 50.0, 'task'), (T0 + 150.0, 'baseline'),
+                           (T0 + 180.0, 'task')], end=T0 + 300.0)
+    with h5py.File(filename, 'a') as h5_file:
+        write_rows(h5_file, make_rows(1000, 2000))
+        assert h5_file[MARKERS_GROUP][ROW_INDEX_NAME].attrs['stream_rows'] == 1000
+        second.write_to_hdf5(h5_file)
+        searched = marker_row_ranges(h5_file, 'task')
+
+        # Closing again replaces the index with one covering every row
+        write_marker_index(h5_file)
+        assert h5_file[MARKERS_GROUP][ROW_INDEX_NAME].attrs['stream_rows'] == 3000
+        indexed = marker_row_ranges(h5_file, 'task')
+
+    assert searched.tolist() == [(500, 1500), (1800, 3000)]
+    np.testing.assert_array_equal(indexed, searched)
@@ -0,0 +1,82 @@
+"""Tests for StreamingHRV.RRWindow (run with: python -m pytest tests)."""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from StreamingHRV import RRWindow  # noqa: E402
+
+
+def reference(times, rr, max_beats, window_seconds):
+    """RMSSD/SDNN/pNN50/mean NN of the window recomputed from scratch with NumPy."""
+    keep = np.ones(len(rr), dtype=bool)
+    if max_beats is not None:
+        keep[:max(len(rr) - max_beats, 0)] = False
+    if window_seconds is not None:
+        keep &= times[-1] - times <= window_seconds
+    window = rr[keep]
+    if len(window) < 2:
+        return len(window), None, None, None, (window.mean() if len(window) else None)
+    diffs = np.diff(window)
+    return (len(window), np.sqrt(np.mean(diffs ** 2)), np.std(window, ddof=1),
+            100.0 * np.count_nonzero(np.abs(diffs) > 50.0) / len(diffs), window.mean())
+
+
+def rr_series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    rr = 900.0 + 80.0 * np.sin(np.arange(n) / 15.0) + rng.normal(0, 40.0, n)
+    times = 1_700_000_000.0 + np.cumsum(rr) / 1000.0
+    # Recording gaps evict most or all of a time window at once
+    times[400:] += 45.0
+    times[1200:] += 400.0
+    return times, rr
+
+
+@pytest.mark.parametrize('max_beats, window_seconds, resync_every', [
+    (64, None, 1000), (None, 30.0, 1000), (100, 60.0, 1000), (64, 30.0, 1), (64, 30.0, 7), (300, None, 97),
+])
+def test_running_values_match_numpy(max_beats, window_seconds, resync_every):
+    times, rr = rr_series(1500)
+    window = RRWindow(max_beats=max_beats, window_seconds=window_seconds, resync_every=resync_every)
+
+    for i in range(len(rr)):
+        window.push(rr[i], times[i])
+        n, rmssd, sdnn, pnn50, mean_nn = reference(times[:i + 1], rr[:i + 1], max_beats, window_seconds)
+        assert len(window) == n
+        if rmssd is None:
+            assert window.rmssd() is None and window.sdnn() is None and window.pnn50() is None
+        else:
+            assert window.rmssd() == pytest.approx(rmssd, rel=1e-9)
+            assert window.sdnn() == pytest.approx(sdnn, rel=1e-9)
+            assert window.pnn50() == pytest.approx(pnn50, rel=1e-12)
+        assert window.mean_nn() == pytest.approx(mean_nn, rel=1e-12)
+
+
+def test_values_across_a_resync_boundary():
+    times, rr = rr_series(40, seed=3)
+    window = RRWindow(max_beats=10, window_seconds=None, resync_every=5)
+    resyncs = 0
+    for i in range(len(rr)):
+        window.push(rr[i], times[i])
+        if window._pushes == 0:
+            # Just resynced from the window's arrays: values agree with the reference
+            resyncs += 1
+            _, rmssd, sdnn, pnn50, _ = reference(times[:i + 1], rr[:i + 1], 10, None)
+            assert (window.rmssd(), window.sdnn(), window.pnn50()) == pytest.approx((rmssd, sdnn, pnn50), rel=1e-12)
+    assert resyncs == len(rr) // 5
+
+
+def test_default_timestamps_are_the_running_sum_of_intervals():
+    window = RRWindow(max_beats=None, window_seconds=2.5)
+    for rr in (1000.0, 1000.0, 1000.0, 1000.0):
+        window.push(rr)
+    # Beats at 1, 2, 3, 4 s: the beat at 1 s is more than 2.5 s older than the newest
+    assert len(window) == 3
+    assert window.rmssd() == 0.0 and window.pnn50() == 0.0
+
+
+def test_a_window_needs_a_limit():
+    with pytest.raises(ValueError):
+        RRWindow(max_beats=None, window_seconds=None)
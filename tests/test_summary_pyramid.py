@@ -0,0 +1,83 @@
+"""Tests for SummaryPyramid (run with: python -m pytest tests)."""
+import os
+import sys
+
+import h5py
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SummaryPyramid import compute_pyramid, numeric_fields, read_summary, write_pyramid  # noqa: E402
+
+DTYPE = np.dtype([('timestamp_unix', 'f8'), ('HR', 'f4'), ('count_like', 'i4'), ('event_marker', 'S8')])
+LEVELS = (1, 10, 60)
+
+
+def make_rows(n=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = np.zeros(n, dtype=DTYPE)
+    # ~7 Hz with jitter, starting and ending mid-bucket at every level
+    rows['timestamp_unix'] = 1_700_000_003.4 + np.cumsum(rng.uniform(0.05, 0.25, n))
+    rows['HR'] = rng.normal(70, 5, n)
+    rows['count_like'] = rng.integers(0, 100, n)
+    rows['HR'][rng.random(n) < 0.1] = np.nan
+    # A whole 1 s bucket without valid HR samples
+    empty = np.floor(rows['timestamp_unix']) == np.floor(rows['timestamp_unix'][1000])
+    rows['HR'][empty] = np.nan
+    return rows
+
+
+def naive_level(rows, fields, seconds):
+    bucket = np.floor(rows['timestamp_unix'] / seconds).astype(np.int64)
+    expected = []
+    for b in np.unique(bucket):
+        in_bucket = rows[bucket == b]
+        row = {'timestamp_unix': b * seconds, 'count': len(in_bucket)}
+        for field in fields:
+            values = in_bucket[field].astype('f8')
+            values = values[~np.isnan(values)]
+            empty = len(values) == 0
+            row[f'{field}_min'] = np.nan if empty else values.min()
+            row[f'{field}_mean'] = np.nan if empty else values.mean()
+            row[f'{field}_max'] = np.nan if empty else values.max()
+        expected.append(row)
+    return expected
+
+
+def test_levels_match_naive_per_bucket_statistics():
+    rows = make_rows()
+    fields = numeric_fields(rows.dtype)
+    assert fields == ['HR', 'count_like']
+
+    # Chunk edges that do not line up with bucket edges
+    chunks = np.array_split(rows, [777, 1500, 1501, 4096])
+    pyramid = compute_pyramid(chunks, fields, LEVELS)
+
+    for seconds in LEVELS:
+        level = pyramid[seconds]
+        expected = naive_level(rows, fields, seconds)
+        assert len(level) == len(expected)
+        for column in level.dtype.names:
+            np.testing.assert_allclose(level[column], [row[column] for row in expected], rtol=1e-12,
+                                       err_msg=f"{seconds}s {column}")
+        assert level['count'].sum() == len(rows)
+    assert np.isnan(pyramid[1]['HR_mean']).any()
+
+
+def test_empty_input_gives_empty_levels():
+    pyramid = compute_pyramid([], ['HR'], LEVELS)
+    assert all(len(level) == 0 for level in pyramid.values())
+
+
+def test_write_pyramid_reads_only_valid_rows(tmp_path):
+    rows = make_rows(2000)
+    with h5py.File(tmp_path / "stream.h5", 'w') as h5_file:
+        # Preallocated tail past rows_written, as HDF5Appender leaves it while recording
+        dataset = h5_file.create_dataset('data', shape=(2500,), maxshape=(None,), dtype=DTYPE)
+        dataset[:2000] = rows
+        dataset.attrs['rows_written'] = 2000
+        written = write_pyramid(h5_file, LEVELS, chunk_rows=300)
+        level = read_summary(h5_file, 10)
+
+    expected = compute_pyramid([rows], ['HR', 'count_like'], LEVELS)
+    assert written == {seconds: len(expected[seconds]) for seconds in LEVELS}
+    np.testing.assert_array_equal(level, expected[10])
@@ -0,0 +1,74 @@
+"""Regression tests for VernierManager in worker-process mode (run with: python -m pytest tests)."""
+import os
+import sys
+import time
+
+import h5py
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TOTAL_ROWS = 5000
+BLOCK_ROWS = 100
+
+
+class FakeSource:
+    """DeviceWorker source ("tests.test_vernier_worker:FakeSource") emitting TOTAL_ROWS numbered rows."""
+    dtype = np.dtype([('timestamp_unix', 'f8'), ('force', 'f4'), ('RR', 'f4')])
+
+    def __init__(self):
+        self._next = 0
+
+    def open(self, **options) -> dict:
+        return {'name': 'fake', 'sensors': ['Force']}
+
+    def read_block(self):
+        # Paced like a device, so blocks keep arriving between drains
+        time.sleep(0.05)
+        if self._next >= TOTAL_ROWS:
+            return None
+        n = min(BLOCK_ROWS, TOTAL_ROWS - self._next)
+        rows = np.zeros(n, dtype=self.dtype)
+        rows['timestamp_unix'] = 1_700_000_000.0 + (self._next + np.arange(n)) * 0.1
+        rows['force'] = self._next + np.arange(n)
+        rows['RR'] = np.nan
+        self._next += n
+        return rows
+
+    def status(self) -> dict:
+        return {'device': 'fake', 'samples': self._next}
+
+    def close(self) -> None:
+        pass
+
+
+def test_stop_writes_every_row_left_in_the_ring(tmp_path):
+    pytest.importorskip('godirect')
+    pytest.importorskip('bleak')
+    from DeviceWorker import DeviceWorker
+    from VernierManager import VernierManager
+
+    manager = VernierManager(breath_detection=False, use_process=True)
+    manager.set_data_folder(str(tmp_path))
+    manager.set_metadata('experiment', 'trial', 'subject')
+    manager.set_filenames()
+    manager.initialize_hdf5_file()
+
+    # A slow drain leaves the last rows in the ring buffer when stop() is called
+    manager._worker = DeviceWorker("tests.test_vernier_worker:FakeSource", manager._on_worker_rows,
+                                   on_error=manager._on_worker_error, drain_interval=1.0)
+    manager._worker.launch()
+    manager._worker.open()
+    manager._device_started = True
+    manager.run()
+
+    deadline = time.monotonic() + 30
+    while manager._worker.status().get('rows_written', 0) < TOTAL_ROWS and time.monotonic() < deadline:
+        time.sleep(0.05)
+    filename = manager.hdf5_filename
+    manager.stop()
+
+    with h5py.File(filename, 'r') as h5_file:
+        data = h5_file['data'][:]
+    np.testing.assert_array_equal(data['force'], np.arange(TOTAL_ROWS))